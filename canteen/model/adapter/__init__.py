@@ -20,6 +20,7 @@ __doc__ = "Contains modules that adapt models to various storage backends."
 
 # abstract adapters
 from . import abstract
+from .abstract import Future
 from .abstract import Mixin
 from .abstract import KeyMixin
 from .abstract import ModelMixin
@@ -42,8 +43,9 @@ modules = [inmemory, protorpc, redis]
 # concrete adapters
 from .redis import RedisAdapter
 from .inmemory import InMemoryAdapter
+from .inmemory import SharedMemoryAdapter
 
-concrete = [InMemoryAdapter, RedisAdapter]
+concrete = [InMemoryAdapter, SharedMemoryAdapter, RedisAdapter]
 
 
 # builtin mixins
@@ -16,17 +16,22 @@
 
 # stdlib
 import abc
+import sys
 import time
 import json
 import base64
 import logging
 import datetime
+import itertools
+import threading
 
 # canteen utils
 from canteen.util import config
 from canteen.util import decorators
 
 
+_compressor = None  # compressor for data marked for compression
+
 try:
   import zlib; _compressor = zlib
 except ImportError:  # pragma: no cover
@@ -46,7 +51,6 @@ except ImportError:  # pragma: no cover
 ## Globals
 _adapters = {}
 _adapters_by_model = {}
-_compressor = None  # compressor for data marked for compression
 _encoder = base64.b64encode  # encoder for key names and special strings
 _core_mixin_classes = (
     'Mixin',
@@ -59,6 +63,104 @@ _core_mixin_classes = (
 CompoundKey = CompoundModel = CompoundVertex = CompoundEdge = None
 
 
+class Future(object):
+
+  """ Result of an adapter operation which may still be in flight, as returned
+      from ``*_async`` methods. Callers may collect the result (blocking until
+      it is ready) or attach callbacks to be run once it is. """
+
+  __slots__ = ('_event', '_lock', '_result', '_error', '_callbacks')
+
+  def __init__(self, event=None):
+
+    """ Initialize this ``Future``.
+
+        :param event: ``Event`` to signal completion with. Defaults to a new
+          :py:class:`threading.Event`. Greenlet-based adapters should provide
+          a cooperative equivalent. """
+
+    self._event, self._lock, self._result, self._error, self._callbacks = (
+      event or threading.Event(), threading.Lock(), None, None, [])
+
+  def run(self, operation, *args, **kwargs):
+
+    """ Run an operation and resolve this ``Future`` with its result (or the
+        exception it raises).
+
+        :param operation: Callable to run.
+
+        :param args: Positional arguments to pass to ``operation``.
+        :param kwargs: Keyword arguments to pass to ``operation``.
+
+        :returns: ``self``, for chainability. """
+
+    try:
+      self._result = operation(*args, **kwargs)
+    except Exception:
+      self._error = sys.exc_info()
+
+    with self._lock:
+      self._event.set()
+      callbacks, self._callbacks = self._callbacks, []
+    for callback in callbacks: callback(self)
+    return self
+
+  def done(self):
+
+    """ Check whether this ``Future`` has been resolved.
+
+        :returns: ``True`` if a result (or exception) is ready. """
+
+    return self._event.is_set()
+
+  def add_done_callback(self, callback):
+
+    """ Attach a callback to be run once this ``Future`` is resolved. If it
+        already has been, the callback is run immediately.
+
+        :param callback: Callable, which is passed this ``Future``.
+
+        :returns: ``self``, for chainability. """
+
+    with self._lock:
+      if not self.done():
+        self._callbacks.append(callback)
+        return self
+    callback(self)
+    return self
+
+  def exception(self, timeout=None):
+
+    """ Wait for this ``Future`` to be resolved, and return the exception
+        raised by its operation, if any.
+
+        :param timeout: Seconds to wait, or ``None`` to wait indefinitely.
+
+        :raises RuntimeError: If ``timeout`` expires first.
+
+        :returns: Exception raised by the operation, or ``None``. """
+
+    if not self._event.wait(timeout) and not self.done():
+      raise RuntimeError('Timed out waiting for adapter operation.')
+    return self._error[1] if self._error else None
+
+  def result(self, timeout=None):
+
+    """ Wait for this ``Future`` to be resolved, and return its result.
+
+        :param timeout: Seconds to wait, or ``None`` to wait indefinitely.
+
+        :raises RuntimeError: If ``timeout`` expires first.
+
+        :raises: Any exception raised by the operation.
+
+        :returns: Result of the operation. """
+
+    if self.exception(timeout) is not None:
+      raise self._error[0], self._error[1], self._error[2]
+    return self._result
+
+
 class ModelAdapter(object):
 
   """ Abstract base class for classes that adapt canteen models to a particular
@@ -187,7 +289,9 @@ class ModelAdapter(object):
           from storage.
 
         :param kwargs: Keyword arguments to pass to the delegated adapter
-          method (implementation-specific).
+          method (implementation-specific). The adapter is also passed
+          ``_keys``, mapping each encoded key to its :py:class:`model.Key`, so
+          results may reuse keys rather than decode them.
 
         :raises RuntimeError: If the target :py:class:`adapter.ModelAdapter`
           does not implement ``get_multi()``, which is an ABC-enforced child
@@ -209,7 +313,7 @@ class ModelAdapter(object):
       # grab getter method
       getter = getattr(self.__class__, 'get_multi')
 
-    bundles = []
+    bundles, known = [], {}
     for key in keys:
 
       # get key from model, if needed
@@ -226,10 +330,11 @@ class ModelAdapter(object):
         encoded = key.urlsafe(joined)
 
       bundles.append((encoded, flattened))  # append to bundles
+      known[encoded] = key
 
     # pass off to delegated `get_multi`
     try:
-      for entity in getter(bundles, **kwargs):
+      for entity in getter(bundles, _keys=known, **kwargs):
         yield entity
 
     except NotImplementedError:  # pragma: no cover
@@ -276,6 +381,39 @@ class ModelAdapter(object):
       self.encode_key(joined, flat) or entity.key.urlsafe(joined), flat),
         entity._set_persisted(True), _model, **kwargs)
 
+  def _put_multi(self, entities, **kwargs):
+
+    """ Low-level method for persisting a batch of entities, all in one go. By
+        default, simply persists each entity via :py:meth:`_put`. Adapters
+        that can batch writes should override this method.
+
+        :param entities: Iterable of :py:class:`model.Model` entities to
+          persist.
+
+        :param kwargs: Keyword arguments to pass to the delegated adapter
+          method (implementation-specific).
+
+        :returns: ``list`` of new (or updated) keys, in the same order as
+          ``entities``. """
+
+    return [self._put(entity, **kwargs) for entity in entities]
+
+  def _async(self, operation, *args, **kwargs):
+
+    """ Low-level method for running an operation without blocking the caller,
+        backing the ``*_async`` model methods. By default, the operation is
+        simply run synchronously. Adapters backed by network storage should
+        override this method to dispatch it concurrently.
+
+        :param operation: Callable to run.
+
+        :param args: Positional arguments to pass to ``operation``.
+        :param kwargs: Keyword arguments to pass to ``operation``.
+
+        :returns: :py:class:`Future` for the operation's result. """
+
+    return Future().run(operation, *args, **kwargs)
+
   def _delete(self, key, **kwargs):
 
     """ Low-level method for deleting an entity by Key.
@@ -415,6 +553,19 @@ class ModelAdapter(object):
                               ' is abstract and may not be'
                               ' called directly.')  # pragma: no cover
 
+  @classmethod
+  def sweep(cls, kind=None, now=None):  # pragma: no cover
+
+    """ Delete entities that have outlived their TTL, set per model (via
+        ``__ttl__``) or per write (via ``ttl``). Adapters that support
+        expiring entities *should* override this method.
+
+        :param kind: String ``kind`` name to sweep, or ``None`` for all kinds.
+        :param now: Timestamp to sweep as of, or ``None`` for the current time.
+        :returns: Count of entities swept. """
+
+    return 0
+
   @classmethod
   def encode_key(cls, key, joined, flattened):
 
@@ -447,6 +598,7 @@ class IndexedModelAdapter(ModelAdapter):
   _group_prefix = '__group__'
   _index_prefix = '__index__'
   _reverse_prefix = '__reverse__'
+  _composite_prefix = '__composite__'
 
 
   class Indexer(object):
@@ -632,6 +784,18 @@ class IndexedModelAdapter(ModelAdapter):
     return self.execute_query(*(
       query.kind, (query.filters, query.sorts), query.options))
 
+  def _iter_query(self, query):
+
+    """ Iterate lazily over results for a ``query.Query`` object. By default,
+        this simply executes the query and iterates over the resulting list;
+        adapters that can stream results should override it.
+
+        :param query: ``query.Query`` to iterate via the local adapter.
+
+        :returns: Iterator over query results, if any. """
+
+    return iter(self._execute_query(query))
+
   @classmethod
   def generate_indexes(cls, key, properties=None):
 
@@ -714,11 +878,128 @@ class IndexedModelAdapter(ModelAdapter):
 
         continue
 
+      # add composite index entries, for indexes declared on the model
+      _property_indexes.extend(cls.generate_composite_indexes(*(
+        key.kind, properties)))
+
     else:
       # we're cleaning indexes
       return encoded_key, _meta_indexes
     return encoded_key, _meta_indexes, _property_indexes
 
+  @classmethod
+  def generate_composite_indexes(cls, kind, properties):
+
+    """ Generate entries for the composite indexes declared on a model, via
+        ``__indexes__``: a sequence of property name tuples, each ending in
+        the (non-repeated) property to order or range over by score, and led
+        by the properties to match by equality, like
+        ``(('status', 'owner', 'created'),)``. Each property must be indexed.
+
+        Entities missing a value for any property in an index are left out of
+        it. Repeated properties get an entry for each of their values.
+
+        :param kind: String :py:class:`model.Model` kind name.
+
+        :param properties: Entity :py:class:`model.Model` property values to
+          index, as passed to :py:meth:`generate_indexes`.
+
+        :raises TypeError: If a composite index doesn't end with a single
+          numeric, ``date`` or ``datetime`` property.
+
+        :returns: ``list`` of composite index entries, which look like
+          ``(score_converter, (__composite__, kind, names, values..., score))``
+          where ``values`` are those of the leading (equality) properties. """
+
+    entries = []
+    for names in getattr(cls.registry.get(kind), '__indexes__', None) or ():
+      if not all((name in properties for name in names)): continue
+
+      prop = properties[names[-1]][0]
+      if prop.repeated or not (isinstance(prop.basetype, type) and (
+            issubclass(prop.basetype, (int, long, float, datetime.date)))):
+        raise TypeError('Composite index "%s" must end with a single numeric,'
+                        ' date or datetime property.' % '.'.join(names))
+
+      values = []
+      for name in names:
+        _prop, value = properties[name]
+        values.append(value if _prop.repeated and isinstance(value, (
+          tuple, list, set, frozenset)) else [value])
+
+      for combination in itertools.product(*values):
+        if None in combination: continue  # pragma: no cover
+        entries.append((cls._index_basetypes.get(prop.basetype), (
+          cls._composite_prefix, kind, tuple(names)) + combination))
+    return entries
+
+  @classmethod
+  def composite_index(cls, kind, filters, sorts, options):
+
+    """ Resolve a composite index (see :py:meth:`generate_composite_indexes`)
+        which can serve a query by itself: one with an equality filter over
+        each of its leading properties, and range filters over (or a sort by)
+        its last property. Queries with any other filters or sorts, or with
+        an ancestor, aren't matched.
+
+        :param kind: Model class for which we are querying across.
+
+        :param filters: ``list`` of :py:class:`query.Filter` directives.
+
+        :param sorts: ``list`` of :py:class:`query.Sort` directives.
+
+        :param options: Object descendent from, or directly instantiated as
+          :py:class:`QueryOptions`, for the query.
+
+        :returns: Tupled ``(names, values, directives, sort)`` for a matching
+          index, where ``values`` are matched by its leading properties,
+          ``directives`` are ``(operator, value)`` range filters over its last
+          property, and ``sort`` is the :py:class:`query.Sort` by it, if any.
+          ``None`` if no composite index matches. """
+
+    from canteen.model import query
+
+    _model = cls.registry.get(kind if isinstance(kind, basestring) else (
+      kind.kind()))
+    declared = getattr(_model, '__indexes__', None)
+    if not declared or options.ancestor or len(sorts or ()) > 1: return None
+
+    equality, ranges = {}, []
+    for _f in filters:
+      if isinstance(_f, query.KeyFilter) and _f.kind is query.KeyFilter.KIND:
+        continue  # composite indexes are per-kind anyway
+      if type(_f) is not query.Filter or _f.chain: return None
+
+      if _f.operator in (query.EQUALS, query.CONTAINS):
+        if _f.target.name in equality: return None
+        equality[_f.target.name] = _f.value.data
+      elif _f.operator in (query.LESS_THAN,
+                           query.LESS_THAN_EQUAL_TO,
+                           query.GREATER_THAN,
+                           query.GREATER_THAN_EQUAL_TO):
+        ranges.append((_f.target.name, _f.operator, _f.value.data))
+      else:
+        return None
+
+    sort = sorts[0] if sorts else None
+    for names in declared:
+      leading, last = names[:-1], names[-1]
+      if not all((getattr(_model, name).indexed for name in names)): continue
+
+      # an equality filter over the last property is a range of one score
+      directives = [(operator, value) for (name, operator, value) in ranges]
+      if last in equality:
+        directives.append((query.EQUALS, equality[last]))
+
+      if set(equality) - set((last,)) != set(leading): continue
+      if any((name != last for name, operator, value in ranges)): continue
+      if sort is not None and sort.target.name != last: continue
+      if not (directives or sort): continue
+
+      return (tuple(names), tuple((equality[name] for name in leading)),
+              directives, sort)
+    return None
+
   @abc.abstractmethod
   def write_indexes(cls, writes, **kwargs):
 
@@ -749,6 +1030,17 @@ class IndexedModelAdapter(ModelAdapter):
                               ' is abstract and may not be'
                               ' called directly.')  # pragma: no cover
 
+  @classmethod
+  def flush_indexes(cls):  # pragma: no cover
+
+    """ Apply any index writes deferred by earlier puts, so that queries
+        reflect them. Adapters that defer index writes *should* override this
+        method.
+
+        :returns: Count of entities whose indexes were applied. """
+
+    return 0
+
   @abc.abstractmethod
   def execute_query(cls, kind, spec, options, **kwargs):
 
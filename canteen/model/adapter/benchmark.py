@@ -0,0 +1,573 @@
+# -*- coding: utf-8 -*-
+
+"""
+
+  model adapter benchmarks
+  ~~~~~~~~~~~~~~~~~~~~~~~~
+
+  measures common workloads against each of the redis adapter's storage
+  modes, on ``fakeredis`` and (optionally) a live ``redis-server``, and read
+  throughput of the threadsafe in-memory adapter as threads are added. run
+  with ``python -m canteen.model.adapter.benchmark --help``.
+
+  :author: Sam Gammon <sg@samgammon.com>
+  :copyright: (c) Sam Gammon, 2014
+  :license: This software makes use of the MIT Open Source License.
+            A copy of this license is included as ``LICENSE.md`` in
+            the root of the project.
+
+"""
+
+from __future__ import print_function
+
+# stdlib
+import sys
+import time
+import json
+import functools
+import threading
+
+# canteen model API & util
+from canteen import model
+from canteen.util import cli
+from canteen.model.adapter import redis as rapi
+from canteen.model.adapter import inmemory
+
+
+## Globals
+_MODES = (  # storage modes, in the order they're reported
+  rapi.RedisMode.toplevel_blob,
+  rapi.RedisMode.hashkind_blob,
+  rapi.RedisMode.hashkey_blob,
+  rapi.RedisMode.hashkey_hash)
+
+_FAKE_DB = 15  # `fakeredis` database to benchmark in
+_GROUPS = 10  # distinct values of `BenchmarkEntity.group`
+_BATCH = 100  # entities fetched per `get_multi`
+_PAGE = 50  # entities fetched per query
+_THREADS = (1, 2, 4, 8)  # reader thread counts to measure scaling across
+
+_COMMANDS = frozenset((  # client methods metered as commands
+  (getattr(rapi.RedisAdapter.Operations, name).lower() if (
+    name != 'DELETE') else 'delete') for name in (
+      dir(rapi.RedisAdapter.Operations)) if (
+        not name.startswith('_') and isinstance(
+          getattr(rapi.RedisAdapter.Operations, name), basestring))))
+
+
+class BenchmarkEntity(model.Model):
+
+  """ Entity written and read by each benchmark workload. """
+
+  __adapter__ = rapi.RedisAdapter
+
+  group = str, {'indexed': True}
+  score = float, {'indexed': True}
+  label = str, {'indexed': True}
+  payload = str, {'indexed': False}
+
+
+class Meter(object):
+
+  """ Tallies round trips to ``Redis``, commands sent, and their payload size
+      (the sum of the lengths of each command's arguments). """
+
+  __slots__ = ('round_trips', 'commands', 'bytes_written', 'batching')
+
+  def __init__(self):
+
+    """ Initialize this meter, with nothing recorded. """
+
+    self.round_trips, self.commands, self.bytes_written, self.batching = (
+      0, 0, 0, False)
+
+  def record(self, commands):
+
+    """ Record one round trip, carrying one or more commands.
+
+        :param commands: Iterable of each command's argument ``tuple``.
+
+        :returns: ``None``. """
+
+    self.round_trips += 1
+    for args in commands:
+      self.commands += 1
+      self.bytes_written += sum((len(str(arg)) for arg in args))
+
+  def snapshot(self):
+
+    """ Capture this meter's current tallies.
+
+        :returns: Tupled ``(round_trips, commands, bytes_written)``. """
+
+    return self.round_trips, self.commands, self.bytes_written
+
+
+def metered_client(meter, server=None):
+
+  """ Build a ``Redis`` client that records its traffic to ``meter``. Against
+      ``fakeredis``, each command method called outside of a pipeline counts
+      as a round trip.
+
+      :param meter: :py:class:`Meter` to record traffic to.
+
+      :param server: Connection config for a live ``redis-server``, like
+        ``{'host': 'localhost', 'port': 6379, 'db': 15}``. Defaults to
+        ``None``, which builds a ``fakeredis`` client instead.
+
+      :returns: Metered client, which may be mounted for use by the adapter. """
+
+  if not server:
+    import fakeredis
+
+    class MeteredFakePipeline(fakeredis.FakePipeline):
+
+      """ ``fakeredis`` pipeline, metered as one round trip. """
+
+      def execute(self, raise_on_error=True):
+
+        """ Record the queued commands, and execute them. """
+
+        if self.commands:
+          meter.record((args for name, args, kwargs in self.commands))
+
+        meter.batching = True
+        try:
+          return super(MeteredFakePipeline, self).execute(raise_on_error)
+        finally:
+          meter.batching = False
+
+    def _metered(method):
+
+      """ Wrap a ``fakeredis`` command method to record each direct call. """
+
+      @functools.wraps(method)
+      def _command(self, *args, **kwargs):
+
+        """ Record the command, unless it's replayed from a pipeline (or
+            called by another command). """
+
+        if meter.batching: return method(self, *args, **kwargs)
+
+        meter.record((args,))
+        meter.batching = True
+        try:
+          return method(self, *args, **kwargs)
+        finally:
+          meter.batching = False
+
+      return _command
+
+    members = dict(((name, _metered(getattr(fakeredis.FakeStrictRedis, name)))
+      for name in _COMMANDS if hasattr(fakeredis.FakeStrictRedis, name)))
+    members['pipeline'] = lambda self, transaction=True, shard_hint=None: (
+      MeteredFakePipeline(self, transaction))
+    return type('MeteredFakeRedis', (fakeredis.FakeStrictRedis,), members)(
+      db=_FAKE_DB)
+
+  client = rapi.redis.client
+
+  class MeteredPipeline(client.StrictPipeline):
+
+    """ ``redis-py`` pipeline, metered as one round trip per execution. """
+
+    def immediate_execute_command(self, *args, **options):
+
+      """ Record a command sent while watching keys, and send it. """
+
+      meter.record((args,))
+      return super(MeteredPipeline, self).immediate_execute_command(*(
+        args), **options)
+
+    def execute(self, raise_on_error=True):
+
+      """ Record the queued commands, and execute them. """
+
+      if self.command_stack:
+        meter.record((args for args, options in self.command_stack))
+      return super(MeteredPipeline, self).execute(raise_on_error)
+
+  class MeteredRedis(client.StrictRedis):
+
+    """ ``redis-py`` client, metered as one round trip per command. """
+
+    def execute_command(self, *args, **options):
+
+      """ Record a command, and send it. """
+
+      meter.record((args,))
+      return super(MeteredRedis, self).execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+
+      """ Build a metered pipeline. """
+
+      return MeteredPipeline(*(
+        self.connection_pool, self.response_callbacks, transaction, shard_hint))
+
+  return MeteredRedis(**server)
+
+
+def footprint(client):
+
+  """ Measure the memory used by a ``Redis`` dataset: as reported by the
+      server (``used_memory``), or for ``fakeredis``, as the total length of
+      each key and the values it holds.
+
+      :param client: Client to measure the dataset of.
+
+      :returns: Size of the dataset, in bytes. """
+
+  if not hasattr(client, '_db'):  # live server
+    return client.info('memory')['used_memory']
+
+  size = 0
+  for key, value in client._db.iteritems():
+    size += len(key)
+    if hasattr(value, 'items'):  # hashes and sorted sets
+      size += sum((len(str(k)) + len(str(v)) for k, v in value.items()))
+    elif isinstance(value, (set, list)):
+      size += sum((len(str(member)) for member in value))
+    else:
+      size += len(str(value))
+  return size
+
+
+def workloads(adapter, count):
+
+  """ Build each benchmark workload, over ``count`` entities.
+
+      :param adapter: Adapter to run workloads against.
+
+      :param count: Number of entities to write, read and delete.
+
+      :returns: ``list`` of ``(name, operations, callable)`` tuples, in the
+        order they must be run. """
+
+  keys = [model.Key(BenchmarkEntity, 'entity-%s' % i) for i in xrange(count)]
+  groups = ['group-%s' % (i % _GROUPS) for i in xrange(count)]
+
+  def _put():
+
+    """ Write each entity, one at a time. """
+
+    for index, (key, group) in enumerate(zip(keys, groups)):
+      BenchmarkEntity(key=key,
+                      group=group,
+                      score=float(index),
+                      label='label-%s' % index,
+                      payload='x' * 256).put(adapter=adapter)
+
+  def _get():
+
+    """ Read each entity, one at a time. """
+
+    for key in keys:
+      BenchmarkEntity.get(key, adapter=adapter)
+
+  def _get_multi():
+
+    """ Read entities in batches. """
+
+    for start in xrange(0, count, _BATCH):
+      list(BenchmarkEntity.get_multi(*(
+        keys[start:(start + _BATCH)],), adapter=adapter))
+
+  def _filtered_query():
+
+    """ Query a page of entities in each group. """
+
+    for group in groups[:_GROUPS]:
+      q = BenchmarkEntity.query(BenchmarkEntity.group == group)
+      q.fetch(limit=_PAGE, adapter=adapter)
+
+  def _sorted_query():
+
+    """ Query a page of entities in each group, ordered by score. """
+
+    for group in groups[:_GROUPS]:
+      q = BenchmarkEntity.query(BenchmarkEntity.group == group)
+      q.sort(-BenchmarkEntity.score).fetch(limit=_PAGE, adapter=adapter)
+
+  def _delete():
+
+    """ Delete each entity, one at a time. """
+
+    for key in keys:
+      key.delete(adapter=adapter)
+
+  return [
+    ('put', count, _put),
+    ('get', count, _get),
+    ('get_multi', len(xrange(0, count, _BATCH)), _get_multi),
+    ('filtered_query', min(count, _GROUPS), _filtered_query),
+    ('sorted_query', min(count, _GROUPS), _sorted_query),
+    ('delete', count, _delete)]
+
+
+def run(modes=_MODES, count=1000, server=None):
+
+  """ Run each workload against each storage mode, on a fresh dataset.
+
+      :param modes: Iterable of :py:class:`rapi.RedisMode` values to run.
+
+      :param count: Number of entities to run each workload over.
+
+      :param server: Connection config for a live ``redis-server`` to run
+        against, like ``{'host': 'localhost', 'port': 6379, 'db': 15}``. The
+        database is **flushed** before each mode is run. Defaults to ``None``,
+        which runs against ``fakeredis``.
+
+      :returns: ``list`` of result ``dict``s, one per workload, per mode. """
+
+  adapter, results = rapi.RedisAdapter, []
+  profile = rapi._default_profile or '__default__'
+
+  saved = (adapter.__testing__, adapter.EngineConfig.mode, rapi._mock_redis,
+           rapi._client_connections.get(profile))
+
+  try:
+    for mode in modes:
+      meter = Meter()
+      client = metered_client(meter, server)
+      client.flushdb()
+
+      adapter.__testing__, adapter.EngineConfig.mode = not server, mode
+      if server:
+        rapi._client_connections[profile] = client
+      else:
+        rapi._mock_redis = client
+
+      baseline = footprint(client)
+      for name, operations, workload in workloads(adapter(), count):
+        before, started = meter.snapshot(), time.time()
+        workload()
+        elapsed = time.time() - started
+        round_trips, commands, written = (
+          after - prior for after, prior in zip(meter.snapshot(), before))
+
+        results.append({
+          'mode': mode,
+          'backend': 'redis' if server else 'fakeredis',
+          'workload': name,
+          'operations': operations,
+          'seconds': elapsed,
+          'ops_per_sec': (operations / elapsed) if elapsed else None,
+          'round_trips_per_op': float(round_trips) / operations,
+          'commands_per_op': float(commands) / operations,
+          'bytes_written': written,
+          'memory': footprint(client) - baseline})
+
+  finally:
+    (adapter.__testing__, adapter.EngineConfig.mode, rapi._mock_redis,
+     connection) = saved
+    if connection is None:
+      rapi._client_connections.pop(profile, None)
+    else:  # pragma: no cover
+      rapi._client_connections[profile] = connection
+
+  return results
+
+
+def report(results, out=sys.stdout):
+
+  """ Print a table of benchmark results.
+
+      :param results: Results, as returned from :py:func:`run`.
+
+      :param out: File-like object to print to.
+
+      :returns: ``None``. """
+
+  header = ('backend', 'mode', 'workload', 'ops/sec', 'trips/op', 'cmds/op',
+            'bytes written', 'memory')
+  row = '%-10s %-9s %-15s %11s %9s %8s %14s %12s'
+
+  print(row % header, file=out)
+  for result in results:
+    print(row % (
+      result['backend'],
+      result['mode'],
+      result['workload'],
+      '%.1f' % result['ops_per_sec'] if result['ops_per_sec'] else '-',
+      '%.2f' % result['round_trips_per_op'],
+      '%.2f' % result['commands_per_op'],
+      result['bytes_written'],
+      result['memory']), file=out)
+
+
+def scaling(threads=_THREADS, count=1000, reads=1000):
+
+  """ Measure read throughput of the in-memory adapter, with locks striped
+      across kinds, as reader threads are added. A writer thread rewrites
+      entities for as long as the readers run, so reads contend with writes
+      to the same kind.
+
+      :param threads: Iterable of reader thread counts to run with.
+
+      :param count: Number of entities to read.
+
+      :param reads: Reads made by each reader thread. Every tenth read is a
+        query for a page of entities in a group, the rest are gets by key.
+
+      :returns: ``list`` of result ``dict``s, one per thread count. """
+
+  adapter, results = inmemory.InMemoryAdapter(), []
+  keys = [model.Key(BenchmarkEntity, 'scaling-%s' % i) for i in xrange(count)]
+
+  def _write(index):
+
+    """ Write the entity at ``index``. """
+
+    BenchmarkEntity(key=keys[index],
+                    group='group-%s' % (index % _GROUPS),
+                    score=float(index),
+                    label='label-%s' % index,
+                    payload='x' * 256).put(adapter=adapter)
+
+  def _read(errors):
+
+    """ Make this reader's reads, recording any errors raised. """
+
+    try:
+      for index in xrange(reads):
+        if index % 10:
+          BenchmarkEntity.get(keys[index % count], adapter=adapter)
+        else:
+          q = BenchmarkEntity.query(*(
+            BenchmarkEntity.group == 'group-%s' % ((index // 10) % _GROUPS),))
+          q.fetch(limit=_PAGE, adapter=adapter)
+    except Exception as exc:  # pragma: no cover
+      errors.append(exc)
+
+  def _rewrite(stop, written, errors):
+
+    """ Rewrite entities until ``stop`` is set, counting writes. """
+
+    try:
+      while not stop.is_set():
+        _write(written[0] % count)
+        written[0] += 1
+    except Exception as exc:  # pragma: no cover
+      errors.append(exc)
+
+  saved = adapter.EngineConfig.threadsafe
+  adapter.EngineConfig.threadsafe = True
+
+  try:
+    for index in xrange(count): _write(index)
+
+    for readers in threads:
+      stop, written, errors = threading.Event(), [0], []
+      writer = threading.Thread(target=_rewrite, args=(stop, written, errors))
+      pool = [threading.Thread(target=_read, args=(errors,)) for _ in (
+        xrange(readers))]
+
+      writer.start()
+      started = time.time()
+      for reader in pool: reader.start()
+      for reader in pool: reader.join()
+      elapsed = time.time() - started
+      stop.set()
+      writer.join()
+
+      results.append({
+        'backend': 'inmemory',
+        'threads': readers,
+        'operations': readers * reads,
+        'seconds': elapsed,
+        'ops_per_sec': (readers * reads / elapsed) if elapsed else None,
+        'writes': written[0],
+        'errors': len(errors)})
+
+  finally:
+    for key in keys: key.delete(adapter=adapter)
+    adapter.EngineConfig.threadsafe = saved
+
+  return results
+
+
+def report_scaling(results, out=sys.stdout):
+
+  """ Print a table of in-memory scaling results.
+
+      :param results: Results, as returned from :py:func:`scaling`.
+
+      :param out: File-like object to print to.
+
+      :returns: ``None``. """
+
+  header = ('backend', 'threads', 'reads/sec', 'speedup', 'writes', 'errors')
+  row = '%-10s %7s %11s %8s %8s %7s'
+
+  baseline = results[0]['ops_per_sec'] if results else None
+  print(row % header, file=out)
+  for result in results:
+    print(row % (
+      result['backend'],
+      result['threads'],
+      '%.1f' % result['ops_per_sec'] if result['ops_per_sec'] else '-',
+      '%.2fx' % (result['ops_per_sec'] / baseline) if (
+        baseline and result['ops_per_sec']) else '-',
+      result['writes'],
+      result['errors']), file=out)
+
+
+class Benchmark(cli.Tool):
+
+  """ Benchmark the redis adapter's storage modes against common workloads,
+      reporting throughput, round trips, bytes written and memory used, and
+      (optionally) in-memory read throughput as threads are added. """
+
+  arguments = (
+    ('--count', {
+      'type': int,
+      'default': 1000,
+      'help': 'number of entities to run each workload over'}),
+    ('--modes', {
+      'nargs': '+',
+      'choices': _MODES,
+      'default': list(_MODES),
+      'help': 'storage modes to benchmark'}),
+    ('--server', {
+      'help': ('host:port of a live redis-server to benchmark against, in'
+               ' addition to fakeredis (its database is flushed!)')}),
+    ('--db', {
+      'type': int,
+      'default': 15,
+      'help': 'database to benchmark in, on a live redis-server'}),
+    ('--threads', {
+      'type': int,
+      'nargs': '+',
+      'help': ('reader thread counts to measure in-memory read scaling'
+               ' across, like `1 2 4 8`')}),
+    ('--json', {
+      'action': 'store_true',
+      'help': 'print results as JSON, rather than as a table'}))
+
+  def execute(arguments, unknown=None):  # pragma: no cover
+
+    """ Run the benchmark, and print its results. """
+
+    results = run(arguments.modes, arguments.count)
+    if arguments.server:
+      host, _, port = arguments.server.partition(':')
+      results.extend(run(arguments.modes, arguments.count, {
+        'host': host, 'port': int(port or 6379), 'db': arguments.db}))
+
+    scaled = scaling(arguments.threads, arguments.count) if (
+      arguments.threads) else []
+
+    if arguments.json:
+      print(json.dumps(results + scaled, indent=2))
+    else:
+      report(results)
+      if scaled:
+        print(file=sys.stdout)
+        report_scaling(scaled)
+    return True
+
+
+if __name__ == '__main__':  # pragma: no cover
+  tool = Benchmark(safe=True)
+  sys.exit(tool(*tool.parser.parse_known_args()))
@@ -190,6 +190,52 @@ class AdaptedModel(ModelMixin):
           keys, **kwargs)):
       yield result
 
+  @classmethod
+  def get_async(cls, key=None, name=None, adapter=None, **kwargs):
+
+    """ Retrieve a persisted version of this model via the current model
+        adapter, without blocking. Accepts the same arguments as ``get``.
+
+        :returns: :py:class:`Future` for the entity, or ``None`` if it could
+          not be found. """
+
+    return (adapter or cls.__adapter__)._async(*(
+      cls.get, key, name, adapter), **kwargs)
+
+  @classmethod
+  def get_multi_async(cls, keys=None, adapter=None, **kwargs):
+
+    """ Retrieve multiple entities from underlying storage in one-go, without
+        blocking. Accepts the same arguments as ``get_multi``.
+
+        :returns: :py:class:`Future` for a ``list`` of object results, with
+          order preserved from ``keys`` requested for fetch. """
+
+    return (adapter or cls.__adapter__)._async(*(
+      lambda: list(cls.get_multi(keys, adapter, **kwargs)),))
+
+  @classmethod
+  def put_multi(cls, entities, adapter=None, **kwargs):
+
+    """ Persist multiple entities to underlying storage in one-go, as if they
+        were persisted individually via ``put``, but giving the engine a chance
+        to batch the writes.
+
+        :param entities: Iterable of :py:class:`model.Model` instances to
+          persist.
+
+        :param adapter: Adapter to use in place of the ``cls`` ``Model``
+          subtype's default adapter, if any. ``None`` uses the default adapter
+          resolution flow, which is the default.
+
+        :param kwargs: Keyword arguments (implementation-specific) to be passed
+          to the underlying driver.
+
+        :returns: ``list`` of written :py:class:`model.Key` objects, with order
+          preserved from ``entities``. """
+
+    return (adapter or cls.__adapter__)._put_multi(entities, **kwargs)
+
   @classmethod
   def query(cls, *args, **kwargs):
 
@@ -245,6 +291,18 @@ class AdaptedModel(ModelMixin):
     if not adapter: adapter = self.__class__.__adapter__
     return adapter._put(self, **kwargs)
 
+  def put_async(self, adapter=None, **kwargs):
+
+    """ Persist this entity via the current model adapter, without blocking.
+
+        :param adapter:
+        :param kwargs:
+        :returns: :py:class:`Future` for the entity's key. """
+
+    # allow adapter override
+    if not adapter: adapter = self.__class__.__adapter__
+    return adapter._async(adapter._put, self, **kwargs)
+
   def delete(self, adapter=None, **kwargs):
 
     """ Discard any primary or index-based data linked to this Key.
@@ -14,20 +14,45 @@
 """
 
 # stdlib
+import os
+import mmap
 import time
 import json
 import base64
+import hashlib
+import bisect
+import contextlib
+import struct
+import cPickle
+import cStringIO
 import datetime
+import functools
 import itertools
+import threading
 import collections
 
 # adapter API
 from .abstract import DirectedGraphAdapter
 
+# canteen utils
+from canteen.util.struct import EMPTY
+
 
 ## Globals
 _init, _graph, _metadata, _datastore = (
   False, {}, {}, {})
+_snapshotting = False  # whether state is snapshotted in the background
+_snapshot_lock = threading.Lock()  # guards starting the background snapshotter
+_snapshots_lock = threading.Lock()  # serializes writing snapshots
+_locks = {}  # holds locks striped across kinds, by kind name
+_locks_lock = threading.Lock()  # guards creating striped locks
+_meta_lock = threading.Lock()  # guards metadata shared across kinds
+_schemas = {}  # holds packed property layouts, by kind name
+_segment = None  # holds the shared segment mapped by a reader process
+_segment_lock = threading.Lock()  # guards mapping a newer shared segment
+_publishing = False  # whether shared segments are published in the background
+_publish_lock = threading.Lock()  # guards starting the background publisher
+_publishes_lock = threading.Lock()  # serializes writing shared segments
 
 
 ## Constants
@@ -37,9 +62,320 @@ _sorted_types = (int,
                  datetime.date,
                  datetime.datetime)
 
+_SNAPSHOT_MAGIC = 'CNTNSNAP'  # leads every snapshot file
+_SNAPSHOT_VERSION = 1  # version of the snapshot format
+_SNAPSHOT_HEADER = struct.Struct('>8sBB')  # magic, version and frame count
+_SNAPSHOT_FRAME = struct.Struct('>Q')  # length of each frame that follows
+
+_SEGMENT_MAGIC = 'CNTNSHRD'  # leads every shared segment file
+_SEGMENT_VERSION = 1  # version of the shared segment format
+_SEGMENT_HEADER = struct.Struct('>8sBQQQ')  # magic, version, count, offsets
+_SEGMENT_SLOT = struct.Struct('>QQI')  # key digest, record offset and length
+
 
 ## Utils
 _to_timestamp = lambda dt: int(time.mktime(dt.timetuple()))
+_key_kind = lambda key, *args: (  # kind name of a `Key` or `(encoded, flat)`
+  key[1] if isinstance(key, tuple) else key.flatten())[-2]
+_identity = lambda stat: (  # identifies a published file, to spot new ones
+  stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime)
+
+
+def _canonical(flattened):
+
+  """ Render a flattened key as text, identically in every process.
+
+      :param flattened: Flattened key to render.
+
+      :returns: ``unicode`` rendering of ``flattened``. """
+
+  return u'/'.join(((_canonical(part[1]) if isinstance(part, tuple) else (
+    u'' if part is None else unicode(part))) for part in flattened))
+
+
+def _digest(flattened):
+
+  """ Digest a flattened key, to look it up in a shared segment. Keys that
+      render the same (like IDs ``5`` and ``'5'``) share a digest, and are
+      told apart by the records they point to.
+
+      :param flattened: Flattened key to digest.
+
+      :returns: 64-bit ``int`` digest. """
+
+  return struct.unpack('>Q', hashlib.md5(
+    _canonical(flattened).encode('utf-8')).digest()[:8])[0]
+
+
+def _striped(kind):
+
+  """ Run an adapter method holding the lock striped to the kind it works
+      on (see :py:meth:`InMemoryAdapter.lock`).
+
+      :param kind: Callable resolving the kind name from the method's
+        positional arguments.
+
+      :returns: Decorator for the method. """
+
+  def _decorator(method):
+
+    """ Wrap ``method`` to hold its kind's lock. """
+
+    @functools.wraps(method)
+    def _locked(cls, *args, **kwargs):
+
+      """ Hold the lock for this call's kind, and call through. """
+
+      with cls.lock(kind(*args)):
+        return method(cls, *args, **kwargs)
+
+    return _locked
+  return _decorator
+
+
+class _Unlocked(object):
+
+  """ Stands in for striped locks while the adapter isn't threadsafe. """
+
+  __enter__ = lambda self: self
+  __exit__ = lambda self, *exc_info: None
+
+_unlocked = _Unlocked()
+
+
+class SortedIndex(object):
+
+  """ Ordered index of ``(value, target)`` entries, for sorted properties.
+      Entries are kept in order as they're written, so range filters can be
+      answered with ``bisect`` rather than by scanning every entry. """
+
+  __slots__ = ('values', 'entries')
+
+  def __init__(self, entries=()):
+
+    """ Initialize this ``SortedIndex``.
+
+        :param entries: Iterable of ``(value, target)`` entries to start
+          with. """
+
+    self.entries = sorted(set(entries))
+    self.values = [value for value, _ in self.entries]
+
+  def __iter__(self):
+
+    """ Iterate over entries in this index, in order.
+
+        :returns: Iterator of ``(value, target)`` entries. """
+
+    return iter(self.entries)
+
+  def __len__(self):
+
+    """ Count entries in this index.
+
+        :returns: Count of ``(value, target)`` entries. """
+
+    return len(self.entries)
+
+  def __contains__(self, entry):
+
+    """ Check whether an entry is in this index.
+
+        :param entry: ``(value, target)`` entry to check for.
+
+        :returns: ``True`` if ``entry`` is indexed, ``False`` otherwise. """
+
+    position = bisect.bisect_left(self.entries, entry)
+    return position < len(self.entries) and self.entries[position] == entry
+
+  def add(self, entry):
+
+    """ Add an entry to this index, at its place in order. Entries that are
+        already indexed are ignored, as they would be in a ``set``.
+
+        :param entry: ``(value, target)`` entry to add. """
+
+    position = bisect.bisect_left(self.entries, entry)
+    if position < len(self.entries) and self.entries[position] == entry:
+      return
+    self.entries.insert(position, entry)
+    self.values.insert(position, entry[0])
+
+  def discard(self, entry):
+
+    """ Remove an entry from this index, if it's present.
+
+        :param entry: ``(value, target)`` entry to remove. """
+
+    position = bisect.bisect_left(self.entries, entry)
+    if position < len(self.entries) and self.entries[position] == entry:
+      del self.entries[position], self.values[position]
+
+  remove = discard
+
+  def between(self, low=None, high=None, inclusive=(True, True)):
+
+    """ Select the entries with values in a range, in order.
+
+        :param low: Lower bound for values. Defaults to ``None``, for no lower
+          bound. ``0`` and other falsy values are valid bounds.
+
+        :param high: Upper bound for values. Defaults to ``None``, for no upper
+          bound.
+
+        :param inclusive: Tupled ``(low, high)`` flags, whether entries valued
+          at each bound are selected.
+
+        :returns: ``list`` of ``(value, target)`` entries within the range. """
+
+    include_low, include_high = inclusive
+    start, end = 0, len(self.values)
+
+    if low is not None:
+      start = (bisect.bisect_left if include_low else bisect.bisect_right)(
+        self.values, low)
+    if high is not None:
+      end = (bisect.bisect_right if include_high else bisect.bisect_left)(
+        self.values, high)
+    return self.entries[start:end]
+
+
+class Segment(object):
+
+  """ Read-only mapping of entities published to a shared segment file (see
+      :py:meth:`SharedMemoryAdapter.publish`). The file is memory-mapped, so
+      its pages are held once by the OS and shared by every process that maps
+      it. Entities are found by binary search over the segment's directory
+      of key digests, and unpickled only as they're read.
+
+      Segments are never modified once published: newer ones are written
+      aside and renamed into place. Reads against a mapped segment need no
+      locks, and the mapping stays valid until it's dropped. """
+
+  __slots__ = ('path', 'identity', 'checked', 'mapped', 'count', 'directory',
+               'metadata', 'loads')
+
+  def __init__(self, path, loads):
+
+    """ Map a shared segment file.
+
+        :param path: Segment file to map.
+
+        :param loads: Callable unpickling each record, like
+          :py:meth:`InMemoryAdapter.loads`.
+
+        :raises RuntimeError: If the file isn't a segment that can be read. """
+
+    with open(path, 'rb') as handle:
+      self.identity = _identity(os.fstat(handle.fileno()))
+      self.mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, self.count, self.directory, self.metadata = (
+      _SEGMENT_HEADER.unpack_from(self.mapped, 0))
+    if magic != _SEGMENT_MAGIC or version != _SEGMENT_VERSION:
+      raise RuntimeError('File "%s" is not a readable'
+                         ' shared segment.' % path)
+
+    self.path, self.checked, self.loads = path, time.time(), loads
+
+  def slot(self, position):
+
+    """ Read an entry from this segment's directory.
+
+        :param position: Index of the entry to read.
+
+        :returns: Tupled ``(digest, offset, length)``. """
+
+    return _SEGMENT_SLOT.unpack_from(
+      self.mapped, self.directory + position * _SEGMENT_SLOT.size)
+
+  def record(self, position):
+
+    """ Read the record a directory entry points to.
+
+        :param position: Index of the entry to read through.
+
+        :returns: Tupled ``(flattened, packed)`` entity record. """
+
+    digest, offset, length = self.slot(position)
+    return self.loads(self.mapped[offset:(offset + length)])
+
+  def get(self, flattened, default=None):
+
+    """ Read an entity from this segment.
+
+        :param flattened: Flattened key of the entity to read.
+
+        :param default: Value to return if no entity is held at
+          ``flattened``.
+
+        :returns: Packed entity ``tuple`` (see
+          :py:meth:`InMemoryAdapter.pack`), or ``default``. """
+
+    digest = _digest(flattened)
+
+    low, high = 0, self.count
+    while low < high:  # find the first entry with this digest
+      middle = (low + high) // 2
+      if self.slot(middle)[0] < digest:
+        low = middle + 1
+      else:
+        high = middle
+
+    for position in xrange(low, self.count):
+      if self.slot(position)[0] != digest: break
+      key, packed = self.record(position)
+      if key == flattened: return packed
+    return default
+
+  def __getitem__(self, flattened):
+
+    """ Read an entity from this segment, which must hold it.
+
+        :param flattened: Flattened key of the entity to read.
+
+        :raises KeyError: If no entity is held at ``flattened``.
+
+        :returns: Packed entity ``tuple``. """
+
+    packed = self.get(flattened)
+    if packed is None: raise KeyError(flattened)
+    return packed
+
+  def __contains__(self, flattened):
+
+    """ Check whether this segment holds an entity.
+
+        :param flattened: Flattened key to check for.
+
+        :returns: ``True`` if an entity is held at ``flattened``. """
+
+    return self.get(flattened) is not None
+
+  def __len__(self):
+
+    """ Count entities held in this segment.
+
+        :returns: Count of entities. """
+
+    return self.count
+
+  def keys(self):
+
+    """ List the keys of every entity held in this segment.
+
+        :returns: ``list`` of flattened keys. """
+
+    return [self.record(position)[0] for position in xrange(self.count)]
+
+  def state(self):
+
+    """ Read the metadata and graph published along with this segment's
+        entities.
+
+        :returns: Tupled ``(metadata, graph)``. """
+
+    return self.loads(self.mapped[self.metadata:])
 
 
 class InMemoryAdapter(DirectedGraphAdapter):
@@ -57,6 +393,17 @@ class InMemoryAdapter(DirectedGraphAdapter):
 
   is_supported = classmethod(lambda cls: True)  # always supported
 
+
+  class EngineConfig(object):
+
+    """ Configuration for the `InMemoryAdapter` engine. """
+
+    snapshot_path = None  # file to snapshot state to, and restore it from
+    snapshot_interval = 0  # seconds between background snapshots (0 disables)
+    threadsafe = False  # stripe locks across kinds, for threaded servers
+    packed = False  # store entities as tuples of values, rather than models
+
+
   @classmethod
   def acquire(cls, name, bases, properties):
 
@@ -81,6 +428,7 @@ class InMemoryAdapter(DirectedGraphAdapter):
           'delete': 0},  # track # of entity delete() operations
 
         'keys': set(),  # holds set of all known keys
+        'expiry': {},  # maps expiring keys to the time they expire at
         'kinds': {},  # holds current count and ID increment
         'global': {  # holds global metadata, like entity count
           'entity_count': 0,  # holds global count of all entities
@@ -96,29 +444,29 @@ class InMemoryAdapter(DirectedGraphAdapter):
       }, {
 
         # holds nodes (structurally)
-        'nodes': collections.defaultdict(lambda: set()),
+        'nodes': collections.defaultdict(set),
 
         # holds edges (structurally)
         'edges': {
 
           # holds directed edges
           'directed': {
-            'in': collections.defaultdict(lambda: set()),
-            'out': collections.defaultdict(lambda: set())},
+            'in': collections.defaultdict(set),
+            'out': collections.defaultdict(set)},
 
           # holds undirected edges
-          'undirected': collections.defaultdict(lambda: set())},
+          'undirected': collections.defaultdict(set)},
 
         # holds neighbor indexes
         'neighbors': {
 
           # holds directed edge neighbor indexes
           'directed': {
-            'in': collections.defaultdict(lambda: set()),
-            'out': collections.defaultdict(lambda: set())},
+            'in': collections.defaultdict(set),
+            'out': collections.defaultdict(set)},
 
           # holds undirected neighbor indexes
-          'undirected': collections.defaultdict(lambda: set())}}
+          'undirected': collections.defaultdict(set)}}
 
     # pass up the chain to create a singleton
     return super(InMemoryAdapter, cls).acquire(name, bases, properties)
@@ -143,10 +491,11 @@ class InMemoryAdapter(DirectedGraphAdapter):
     encoded, flattened = key
 
     # pull from in-memory backend
-    entity = _datastore.get(flattened)
-    if entity is None: return  # not found
+    entity = cls.load(flattened)
+    if entity is None or cls.expired(flattened): return  # not found
 
-    _metadata['ops']['get'] += 1
+    with cls.metalock():
+      _metadata['ops']['get'] += 1
     return entity  # construct + inflate entity
 
   @classmethod
@@ -174,10 +523,11 @@ class InMemoryAdapter(DirectedGraphAdapter):
       obj = cls.get(key)
 
       # inflate key + model and return
-      obj.key.__persisted__ = True
+      if obj is not None: obj.key.__persisted__ = True
       yield obj
 
   @classmethod
+  @_striped(_key_kind)
   def put(cls, key, entity, model, **kwargs):
 
     """ Persist an entity to storage in Python RAM.
@@ -191,7 +541,8 @@ class InMemoryAdapter(DirectedGraphAdapter):
           for property/policy reference.
 
         :param kwargs: Implementation-specific flags/kwargs to the underlying
-          adapter from the application.
+          adapter from the application. Accepts ``ttl``, seconds for the
+          entity to live, which falls back to the model's ``__ttl__``.
 
         :returns: ``key`` at which ``entity`` was stored in underlying storage,
           including any elements of ``key`` which required population from
@@ -203,6 +554,19 @@ class InMemoryAdapter(DirectedGraphAdapter):
     encoded, flattened = key
     target = flattened
 
+    # overwrites drop the key's index entries, which are written again from
+    # `entity` (otherwise stale entries keep matching, and sort it twice)
+    if target in _datastore:
+      cls.clean_indexes(cls.generate_indexes(entity.key))
+
+    # track expiry, if the entity has a TTL
+    ttl = kwargs.get('ttl')
+    if ttl is None: ttl = getattr(model, '__ttl__', None)
+    if ttl:
+      _metadata['expiry'][target] = time.time() + ttl
+    else:
+      _metadata['expiry'].pop(target, None)
+
     # perform validation
     with entity:
 
@@ -212,11 +576,15 @@ class InMemoryAdapter(DirectedGraphAdapter):
           'entity_count': 0,  # keep count of seen entities for each kind
           'keys': set()}  # keep set of all keys for kind
 
-      # update counts
-      _metadata['ops']['put'] = _metadata['ops'].get('put', 0) + 1
+      # update counts (shared across kinds, so not covered by the stripe)
+      with cls.metalock():
+        _metadata['ops']['put'] = _metadata['ops'].get('put', 0) + 1
+
+        _metadata['global']['entity_count'] = (
+          _metadata['global'].get('entity_count', 0) + 1)
 
-      _metadata['global']['entity_count'] = (
-        _metadata['global'].get('entity_count', 0) + 1)
+        # add to main keys index
+        _metadata['keys'].add(target)
 
       kinded_entity_count = (
         _metadata['kinds'][entity.key.kind].get('entity_count', 0))
@@ -229,11 +597,9 @@ class InMemoryAdapter(DirectedGraphAdapter):
       kinded_keys.add(target)
       _metadata['kinds'][entity.key.kind]['keys'] = kinded_keys
 
-      # add to main keys index
-      _metadata['keys'].add(target)
-
       # save to datastore
-      _datastore[target] = entity
+      _datastore[target] = cls.pack(entity) if cls.packed(model) else entity
+      cls.snapshotter()
 
       # store vertexes separately
       if getattr(model, '__vertex__', False):
@@ -272,6 +638,7 @@ class InMemoryAdapter(DirectedGraphAdapter):
     return entity.key
 
   @classmethod
+  @_striped(_key_kind)
   def delete(cls, key, **kwargs):
 
     """ Delete an entity by Key from memory.
@@ -295,6 +662,7 @@ class InMemoryAdapter(DirectedGraphAdapter):
 
     # extract key parts
     parent, kind, _id = flattened
+    _metadata['expiry'].pop(flattened, None)
 
     # if we have the key...
     if flattened in _metadata[cls._key_prefix]:
@@ -302,17 +670,19 @@ class InMemoryAdapter(DirectedGraphAdapter):
         del _datastore[flattened]  # delete from datastore
 
       except KeyError:  # pragma: no cover
-        _metadata[cls._key_prefix].remove(flattened)
+        with cls.metalock():
+          _metadata[cls._key_prefix].remove(flattened)
         return False  # untrimmed key
 
       else:
-        # update meta
-        _metadata[cls._key_prefix].remove(flattened)
-        _metadata['ops']['delete'] = (
-          _metadata['ops'].get('delete', 0) + 1)
+        # update meta (shared across kinds, so not covered by the stripe)
+        with cls.metalock():
+          _metadata[cls._key_prefix].remove(flattened)
+          _metadata['ops']['delete'] = (
+            _metadata['ops'].get('delete', 0) + 1)
 
-        _metadata['global']['entity_count'] = (
-          _metadata['global'].get('entity_count', 1) - 1)
+          _metadata['global']['entity_count'] = (
+            _metadata['global'].get('entity_count', 1) - 1)
 
         _metadata['kinds'][kind]['entity_count'] = (
           _metadata['kinds'][kind].get('entity_count', 1) - 1)
@@ -321,6 +691,7 @@ class InMemoryAdapter(DirectedGraphAdapter):
     return False
 
   @classmethod
+  @_striped(lambda key_class, kind, *args: kind)
   def allocate_ids(cls, key_class, kind, count=1, **kwargs):
 
     """ Allocate new Key IDs up to `count`.
@@ -367,7 +738,402 @@ class InMemoryAdapter(DirectedGraphAdapter):
     return pointer
 
   @classmethod
-  def write_indexes(cls, writes, _graph, execute=True):
+  def expired(cls, flattened, now=None):
+
+    """ Check whether an entity has outlived its TTL, and if so, delete it
+        (and its indexes) on the spot.
+
+        :param flattened: Flattened key of the entity to check.
+
+        :param now: Timestamp to check expiry as of. Defaults to ``None``,
+          which uses the current time.
+
+        :returns: ``True`` if the entity had expired, ``False`` otherwise. """
+
+    deadline = _metadata['expiry'].get(flattened)
+    if deadline is None or deadline > (time.time() if now is None else now):
+      return False
+
+    entity = cls.load(flattened)
+    if entity is not None:
+      cls.clean_indexes(cls.generate_indexes(entity.key))
+    cls.delete((None, flattened))
+    return True
+
+  @classmethod
+  def sweep(cls, kind=None, now=None):
+
+    """ Delete every entity that has outlived its TTL, along with its
+        indexes. Expired entities are otherwise deleted lazily, as they're
+        encountered.
+
+        :param kind: String :py:class:`model.Model` kind name to sweep.
+          Defaults to ``None``, which sweeps every kind.
+
+        :param now: Timestamp to sweep expired entities as of. Defaults to
+          ``None``, which uses the current time.
+
+        :returns: Count of entities swept. """
+
+    now = time.time() if now is None else now
+    return sum((1 for flattened in _metadata['expiry'].keys() if (
+      (kind is None or flattened[1] == kind) and cls.expired(flattened, now))))
+
+  @classmethod
+  def lock(cls, kind):
+
+    """ Resolve the lock striped to a kind. Writes to a kind, and queries
+        over it, hold its lock while :py:attr:`EngineConfig.threadsafe` is
+        set, so they may be made from any thread. Writes to different kinds
+        (and reads by key) never contend.
+
+        :param kind: String kind name to resolve a lock for.
+
+        :returns: Reentrant lock for ``kind``, or a stand-in that doesn't
+          lock at all, if the adapter isn't threadsafe. """
+
+    if not cls.EngineConfig.threadsafe: return _unlocked
+
+    stripe = _locks.get(kind)
+    if stripe is None:
+      with _locks_lock:
+        stripe = _locks.setdefault(kind, threading.RLock())
+    return stripe
+
+  @classmethod
+  def metalock(cls):
+
+    """ Resolve the lock guarding metadata shared across kinds (operation
+        counts, and the index of every key), which striped locks don't cover.
+        It's only ever held briefly.
+
+        :returns: Lock for shared metadata, or a stand-in that doesn't lock at
+          all, if the adapter isn't threadsafe. """
+
+    return _meta_lock if cls.EngineConfig.threadsafe else _unlocked
+
+  @classmethod
+  @contextlib.contextmanager
+  def exclusive(cls):
+
+    """ Hold every striped lock at once (see :py:meth:`lock`), for work that
+        spans all kinds, like snapshots.
+
+        :returns: Context manager, blocking writes to every kind while it's
+          entered. """
+
+    if not cls.EngineConfig.threadsafe:
+      yield
+      return
+
+    with _locks_lock:  # blocks new stripes, too
+      stripes = [_locks[kind] for kind in sorted(_locks)]
+      for stripe in stripes: stripe.acquire()
+      try:
+        yield
+      finally:
+        for stripe in reversed(stripes): stripe.release()
+
+  @classmethod
+  def inflate_key(cls, flattened):
+
+    """ Inflate a :py:class:`model.Key` from its flattened form, as held in
+        RAM by this adapter.
+
+        :param flattened: Flattened key, from ``key.flatten(True)``.
+
+        :returns: Persisted :py:class:`model.Key` instance. """
+
+    keyclass = cls.registry[flattened[-2]].__keyclass__
+    parts = list(flattened)
+
+    # parents are flattened as `(joined, flattened)` pairs, and passed apart
+    position = list(reversed(keyclass.__schema__)).index('parent')
+    parent, parts[position] = parts[position], None
+    return keyclass(*parts, parent=(
+      cls.inflate_key(parent[1]) if parent else None), _persisted=True)
+
+  @classmethod
+  def hydrate(cls, flattened, entity):
+
+    """ Build a model instance from an entity restored from a snapshot.
+
+        :param flattened: Flattened key the entity was stored at.
+
+        :param entity: Entity ``dict``, as exported by ``to_dict``.
+
+        :returns: Persisted :py:class:`model.Model` instance. """
+
+    entity['key'] = cls.inflate_key(flattened)
+    return cls.registry[flattened[-2]](_persisted=True, **entity)
+
+  @classmethod
+  def packed(cls, model):
+
+    """ Resolve whether entities of a kind are stored packed (see
+        :py:meth:`pack`), via the model's ``__packed__`` attribute, falling
+        back to :py:attr:`EngineConfig.packed`.
+
+        :param model: :py:class:`model.Model` subtype to resolve for.
+
+        :returns: ``True`` if entities of ``model`` are stored packed. """
+
+    packed = getattr(model, '__packed__', None)
+    return cls.EngineConfig.packed if packed is None else packed
+
+  @classmethod
+  def schema(cls, model):
+
+    """ Resolve the layout of a kind's packed entities: its property names,
+        in order, and which of them are repeated.
+
+        :param model: :py:class:`model.Model` subtype to resolve for.
+
+        :returns: Tupled ``(names, repeated)``, where ``repeated`` is a
+          ``frozenset`` of repeated property names. """
+
+    schema = _schemas.get(model.kind())
+    if schema is None:
+      names = tuple(sorted(model.__lookup__))
+      schema = _schemas[model.kind()] = (names, frozenset((
+        name for name in names if model.__dict__[name].repeated)))
+    return schema
+
+  @classmethod
+  def pack(cls, entity):
+
+    """ Pack an entity into a ``tuple`` of its property values, ordered by
+        its kind's schema (see :py:meth:`schema`). Repeated values are held
+        as tuples, so that no mutable state is shared with callers.
+
+        :param entity: :py:class:`model.Model` instance to pack.
+
+        :returns: Packed ``tuple`` of ``entity``'s property values. """
+
+    names, repeated = cls.schema(entity.__class__)
+    values = entity.to_dict(convert_datetime=False,
+                            convert_keys=False,
+                            convert_models=True)
+
+    def _value(name):
+
+      """ Resolve a property's packed value, or ``None`` if it's unset. """
+
+      value = values.get(name, EMPTY)
+      if name in repeated and value not in (None, EMPTY):
+        value = tuple((item for item in value if item is not EMPTY)) or EMPTY
+      return None if value is EMPTY else value
+
+    return tuple((_value(name) for name in names))
+
+  @classmethod
+  def load(cls, flattened):
+
+    """ Read an entity held in RAM. Packed entities (see :py:meth:`pack`)
+        are built into a fresh model instance on every read.
+
+        :param flattened: Flattened key of the entity to read.
+
+        :returns: :py:class:`model.Model` instance, or ``None`` if no entity
+          is held at ``flattened``. """
+
+    entity = _datastore.get(flattened)
+    if not isinstance(entity, tuple): return entity
+
+    names, repeated = cls.schema(cls.registry[flattened[-2]])
+    return cls.hydrate(flattened, dict(((name, (
+      list(value) if name in repeated else value)) for (
+        name, value) in itertools.izip(names, entity) if value is not None)))
+
+  @classmethod
+  def dumps(cls, obj):
+
+    """ Pickle state held in RAM, storing keys in their flattened form.
+
+        :param obj: Object to pickle.
+
+        :returns: Pickled ``str``. """
+
+    from canteen import model
+
+    stream = cStringIO.StringIO()
+    pickler = cPickle.Pickler(stream, cPickle.HIGHEST_PROTOCOL)
+    pickler.persistent_id = lambda obj: (
+      obj.flatten(True)[1] if isinstance(obj, model.Key) else None)
+    pickler.dump(obj)
+    return stream.getvalue()
+
+  @classmethod
+  def loads(cls, source):
+
+    """ Unpickle state pickled by :py:meth:`dumps`, inflating its keys.
+
+        :param source: Pickled ``str``, or a file-like object to read it
+          from.
+
+        :returns: Unpickled object. """
+
+    unpickler = cPickle.Unpickler(source if hasattr(source, 'read') else (
+      cStringIO.StringIO(source)))
+    unpickler.persistent_load = cls.inflate_key
+    return unpickler.load()
+
+  @classmethod
+  def snapshot(cls, path=None):
+
+    """ Write every entity, index and graph structure held in RAM to a
+        snapshot file, which :py:meth:`restore` can warm-start from. Snapshots
+        are written aside, synced to disk and renamed into place, one at a
+        time, so an existing snapshot is only replaced once a new one is
+        complete.
+
+        Snapshots are a header (see ``_SNAPSHOT_HEADER``) followed by
+        length-prefixed frames, one each for entities, metadata and the
+        graph. Keys are stored in their flattened form. While the adapter is
+        threadsafe, writes wait for state to be captured.
+
+        :param path: File to write the snapshot to. Defaults to ``None``,
+          which uses :py:attr:`EngineConfig.snapshot_path`.
+
+        :raises RuntimeError: If no snapshot file is given or configured.
+
+        :returns: Count of entities written to the snapshot. """
+
+    path = path or cls.EngineConfig.snapshot_path
+    if not path:
+      raise RuntimeError('No path was given or configured'
+                         ' for the in-memory snapshot.')
+
+    with _snapshots_lock:
+      with cls.exclusive():
+        entities = [(flattened, entity.to_dict(convert_datetime=False,
+                                               convert_keys=False,
+                                               convert_models=True)) for (
+          flattened, entity) in (
+            (flattened, cls.load(flattened)) for flattened in (
+              _datastore.keys()))]
+
+        frames = [cls.dumps(section) for section in (
+          entities, _metadata, _graph)]
+
+      pending = '%s.pending' % path
+      with open(pending, 'wb') as handle:
+        handle.write(_SNAPSHOT_HEADER.pack(
+          _SNAPSHOT_MAGIC, _SNAPSHOT_VERSION, len(frames)))
+        for frame in frames:
+          handle.write(_SNAPSHOT_FRAME.pack(len(frame)))
+          handle.write(frame)
+        handle.flush()
+        os.fsync(handle.fileno())
+      os.rename(pending, path)
+    return len(entities)
+
+  @classmethod
+  def restore(cls, path=None):
+
+    """ Replace all state held in RAM with a snapshot written by
+        :py:meth:`snapshot`. The file is memory-mapped, and each frame is
+        unpickled straight from the mapping. Models for every kind in the
+        snapshot must be defined before it is restored.
+
+        :param path: Snapshot file to restore from. Defaults to ``None``,
+          which uses :py:attr:`EngineConfig.snapshot_path`.
+
+        :raises RuntimeError: If no snapshot file is given or configured, or
+          the file isn't a snapshot this adapter can read.
+
+        :returns: Count of entities restored from the snapshot. """
+
+    path = path or cls.EngineConfig.snapshot_path
+    if not path:
+      raise RuntimeError('No path was given or configured'
+                         ' for the in-memory snapshot.')
+
+    with open(path, 'rb') as handle:
+      if os.fstat(handle.fileno()).st_size < _SNAPSHOT_HEADER.size:
+        raise RuntimeError('File "%s" is not a readable'
+                           ' in-memory snapshot.' % path)
+      mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+    try:
+      magic, version, count = _SNAPSHOT_HEADER.unpack_from(mapped, 0)
+      if magic != _SNAPSHOT_MAGIC or version != _SNAPSHOT_VERSION:
+        raise RuntimeError('File "%s" is not a readable'
+                           ' in-memory snapshot.' % path)
+
+      sections, offset = [], _SNAPSHOT_HEADER.size
+      for _ in xrange(count):
+        length, = _SNAPSHOT_FRAME.unpack_from(mapped, offset)
+        offset += _SNAPSHOT_FRAME.size
+
+        mapped.seek(offset)
+        sections.append(cls.loads(mapped))
+        offset += length
+    finally:
+      mapped.close()
+
+    entities, metadata, graph = sections
+    datastore = {}
+    for flattened, entity in entities:
+      entity = cls.hydrate(flattened, entity)
+      datastore[flattened] = (
+        cls.pack(entity) if cls.packed(entity.__class__) else entity)
+
+    cls.mount(datastore, metadata, graph)
+    return len(datastore)
+
+  @classmethod
+  def mount(cls, datastore, metadata, graph):
+
+    """ Replace all state held in RAM at once.
+
+        :param datastore: Mapping of flattened keys to entities.
+
+        :param metadata: Metadata ``dict``, holding indexes and counts.
+
+        :param graph: Graph structure ``dict``.
+
+        :returns: ``None``. """
+
+    global _init, _graph, _metadata, _datastore
+
+    with cls.exclusive():
+      _init, _metadata, _graph, _datastore = True, metadata, graph, datastore
+
+  @classmethod
+  def snapshotter(cls):
+
+    """ Start snapshotting state in the background, every
+        :py:attr:`EngineConfig.snapshot_interval` seconds, if that is set and
+        a snapshotter isn't running already.
+
+        :returns: ``None``. """
+
+    global _snapshotting
+
+    if not cls.EngineConfig.snapshot_interval or _snapshotting: return
+    with _snapshot_lock:
+      if _snapshotting: return
+      _snapshotting = True
+
+    def _snapshot():
+
+      """ Snapshot state, forever. """
+
+      while True:
+        time.sleep(cls.EngineConfig.snapshot_interval)
+        try:
+          cls.snapshot()
+        except Exception:  # pragma: no cover
+          pass  # retried at the next interval
+
+    snapshotter = threading.Thread(target=_snapshot, name='inmemory-snapshot')
+    snapshotter.daemon = True
+    snapshotter.start()
+
+  @classmethod
+  @_striped(lambda writes, *args: writes[0][-2])
+  def write_indexes(cls, writes, _graph, execute=True, **kwargs):
 
     """ Write a set of generated indexes via `generate_indexes`.
 
@@ -379,6 +1145,9 @@ class InMemoryAdapter(DirectedGraphAdapter):
         :param execute: ``bool`` flag, whether to execute and actually commit
           the writes planned.
 
+        :param kwargs: Implementation-specific flags/kwargs to the underlying
+          adapter from the application.
+
         :raises RuntimeError: If an invalid bundle of index writes is provided.
 
         :returns: Writes committed to the ``_metadata`` ``dict``, for
@@ -410,7 +1179,7 @@ class InMemoryAdapter(DirectedGraphAdapter):
         # convert into a compound sorted index
         if isinstance(value, _sorted_types):
 
-          if isinstance(value, datetime.datetime):
+          if isinstance(value, (datetime.datetime, datetime.date)):
             value = _to_timestamp(value)
 
           write = (index, path, (value, target))
@@ -440,24 +1209,25 @@ class InMemoryAdapter(DirectedGraphAdapter):
 
         # extract write, inflate
         index, dimension, value = write
+        is_sorted = (
+          isinstance(value, tuple) and isinstance(value[0], _sorted_types))
 
         # init index hash
         if index not in _write:
-          _write[index] = {dimension: {value}}
+          _write[index] = {}
 
-        elif dimension not in _write[index]:
-          _write[index][dimension] = {value}
+        if dimension not in _write[index]:
+          _write[index][dimension] = SortedIndex() if is_sorted else set()
 
-        else:
-          # everything is there, map the value
-          _write[index][dimension].add(value)
+        # everything is there, map the value
+        _write[index][dimension].add(value)
 
         # add sorted mark, if necessary
-        if isinstance(value, tuple) and isinstance(value[0], _sorted_types):
+        if is_sorted:
           _mark = (dimension, '__sorted__')
           if _mark not in _write[index]:
             _write[index][_mark] = {}
-          _write[index][_mark][target] = value
+          _write[index][_mark].setdefault(target, set()).add(value)
 
         # add reverse index
         if target not in _write[cls._reverse_prefix]:
@@ -521,6 +1291,7 @@ class InMemoryAdapter(DirectedGraphAdapter):
     return _write
 
   @classmethod
+  @_striped(lambda writes, *args: writes[0][-2])
   def clean_indexes(cls, writes, **kwargs):
 
     """ Clean indexes for a key that is due to be deleted.
@@ -590,9 +1361,8 @@ class InMemoryAdapter(DirectedGraphAdapter):
             # check sorted-ness
             svalue = (value, '__sorted__')
             if svalue in _metadata[index]:
-              sorted_entry = _metadata[index][svalue].get(target)
-              if sorted_entry:
-                _metadata[index][value].remove(sorted_entry)
+              for sorted_entry in _metadata[index][svalue].pop(target, ()):
+                _metadata[index][value].discard(sorted_entry)
 
             else:
               # remove from set at item in mapping
@@ -635,6 +1405,56 @@ class InMemoryAdapter(DirectedGraphAdapter):
     return flattened
 
   @classmethod
+  def composite_query(cls, kind, composite, options):
+
+    """ Execute a query served by a declared composite index, as resolved
+        by :py:meth:`composite_index`. Entries for the query's equality values
+        are filtered and ordered by score, then paged by ``offset`` and
+        ``limit``.
+
+        :param kind: :py:class:`model.Model` subtype class that we're querying
+          for.
+
+        :param composite: Tupled ``(names, values, directives, sort)``, as
+          returned from :py:meth:`composite_index`.
+
+        :param options: :py:class:`canteen.model.query.QueryOptions` instance,
+          which specifies query options like a result ``offset`` or ``limit``.
+
+        :returns: ``list`` of matching entities, or of their keys for
+          ``keys_only`` queries. """
+
+    from canteen.model import query
+
+    names, values, directives, sort = composite
+    _score = lambda value: (
+      _to_timestamp(value) if isinstance(value, (
+        datetime.datetime, datetime.date)) else value)
+
+    bounds = [(query._operator_map[operator], _score(value)) for (
+      operator, value) in directives]
+    index = _metadata.get(cls._composite_prefix, {}).get(*(
+      (kind.kind(), names) + values, ()))
+    entries = sorted((entry for entry in index if all((
+      compare(entry[0], value) for compare, value in bounds))),
+      reverse=bool(sort) and sort.operator is query.DESCENDING)
+
+    offset, limit, results = (
+      max(options.offset or 0, 0), max(options.limit or 0, 0), [])
+    for score, target in entries:
+      if target not in _datastore or cls.expired(target): continue
+
+      if offset:
+        offset -= 1
+        continue
+
+      entity = cls.load(target)
+      results.append(entity.key if options.keys_only else entity)
+      if limit and len(results) >= limit: break
+    return results
+
+  @classmethod
+  @_striped(lambda kind, *args: kind.__name__ if kind else None)
   def execute_query(cls, kind, spec, options, **kwargs):  # pragma: no cover
 
     """ Execute a query across one (or multiple) indexed properties. Collapses
@@ -665,6 +1485,11 @@ class InMemoryAdapter(DirectedGraphAdapter):
     # extract spec
     filters, sorts = spec
 
+    # a declared composite index can serve the query by itself
+    composite = cls.composite_index(kind, filters, sorts, options)
+    if composite is not None:
+      return cls.composite_query(kind, composite, options)
+
     # calculate ancestry parent
     ancestry_parent = None
     if isinstance(options.ancestor, basestring):
@@ -681,11 +1506,19 @@ class InMemoryAdapter(DirectedGraphAdapter):
 
     _index_groups = (_special_indexes, _sorted_indexes, _unsorted_indexes)
 
+    # map sorted operators to `(low, high, inclusive)` ranges
+    _ranges = {
+      query.EQUALS: lambda value: (value, value, (True, True)),
+      query.LESS_THAN: lambda value: (None, value, (True, False)),
+      query.LESS_THAN_EQUAL_TO: lambda value: (None, value, (True, True)),
+      query.GREATER_THAN: lambda value: (value, None, (False, True)),
+      query.GREATER_THAN_EQUAL_TO: lambda value: (value, None, (True, True))}
+
     ## apply ancestry first
     if ancestry_parent:
       _ekey = cls.encode_key(*ancestry_parent.flatten(True))
-      _group_index = _metadata[cls._group_prefix].get(_ekey)
-      if _group_index: _special_indexes.append((False, (
+      _group_index = _metadata[cls._group_prefix].get(_ekey, set())
+      _special_indexes.append((False, (
           query.KeyFilter(model.Key.from_raw(_ekey),
                           _type=query.KeyFilter.ANCESTOR), _group_index)))
 
@@ -705,14 +1538,14 @@ class InMemoryAdapter(DirectedGraphAdapter):
           if isinstance(_f.value.data, (datetime.datetime, datetime.date)):
             _filter_val = _to_timestamp(_f.value.data)
 
-          # valued index
+          # valued index (missing once no entity has a value for it, in
+          # which case nothing matches)
           _index_key = (kind.__name__, _f.target.name)
-          if _index_key in _metadata[cls._index_prefix]:
-            _sorted_indexes.append((True, (
-              _f.target.name,
-              _f.operator,
-              _filter_val,
-              _metadata[cls._index_prefix][_index_key])))
+          _sorted_indexes.append((True, (
+            _f.target.name,
+            _f.operator,
+            _filter_val,
+            _metadata[cls._index_prefix].get(_index_key, SortedIndex()))))
 
         else:
 
@@ -736,9 +1569,8 @@ class InMemoryAdapter(DirectedGraphAdapter):
           else:
             # devalued index
             _index_key = ((kind.__name__, _f.target.name), _f.value.data)
-            if _index_key in _metadata[cls._index_prefix]:
-              _unsorted_indexes.append((
-                False, (_f, _metadata[cls._index_prefix][_index_key])))
+            _unsorted_indexes.append((False, (
+              _f, _metadata[cls._index_prefix].get(_index_key, set()))))
 
       for group in _index_groups:
         for is_sorted, directive in group:
@@ -746,31 +1578,20 @@ class InMemoryAdapter(DirectedGraphAdapter):
           # sorted indexes
           if is_sorted:
             target, operator, value, index = directive
-            high_bound = (value if (operator in (
-              query.LESS_THAN, query.LESS_THAN_EQUAL_TO)) else None)
-            low_bound = (value if (operator in (
-              query.GREATER_THAN, query.GREATER_THAN_EQUAL_TO)) else None)
-
-            if low_bound and not high_bound:
-              evaluate = lambda bundle: (low_bound < bundle[0])
-
-            elif low_bound and high_bound:
-              evaluate = lambda bundle: (low_bound < bundle[0] < high_bound)
 
-            elif high_bound:  # high-bound only
-              evaluate = lambda bundle: (bundle[0] < high_bound)
-
-            else:  # invalid filter
+            if operator not in _ranges:
               raise RuntimeError('Invalid sorted filter'
                                  ' operation: "%s".' % operator)
 
+            low, high, inclusive = _ranges[operator](value)
+            _matches = set((
+              _target for _, _target in index.between(low, high, inclusive)))
+
             if not _q_init:  # no frame yet, initialize
               _q_init = True
-              _data_frame = (
-                set((value for _, value in filter(evaluate, index))))
+              _data_frame = _matches
             else:  # otherwise, filter
-              _data_frame &= (
-                set((value for _, value in filter(evaluate, index))))
+              _data_frame &= _matches
 
           # unsorted indexes
           else:
@@ -783,7 +1604,7 @@ class InMemoryAdapter(DirectedGraphAdapter):
 
               if not _q_init:  # no frame yet, initialize
                 _q_init = True
-                _data_frame = _target
+                _data_frame = set(_target)  # copy, so the index isn't narrowed
               else:
                 # filter against selected target
                 _data_frame &= _target
@@ -798,15 +1619,19 @@ class InMemoryAdapter(DirectedGraphAdapter):
       # no filters - working with _all_ models of a kind as base
       _data_frame = _metadata[cls._kind_prefix].get(kind.__name__, set())
 
+    # results are paged after filtering, so pages are never short
+    _offset, _limit = max(options.offset or 0, 0), max(options.limit or 0, 0)
+    _page = lambda results: itertools.islice(*(
+      results, _offset, (_offset + _limit) if _limit else None))
+
     ## inflate results (keys only)
     if options.keys_only and not _inmemory_filters:
       _keyify = lambda k: (
         model.Key.from_urlsafe(k, _persisted=True) if not (
           isinstance(k, model.Key)) else k)
 
-      return (_keyify(k) for k in _data_frame)
-
-    result_entities = []
+      return _page((
+        _keyify(k) for k in list(_data_frame) if not cls.expired(k)))
 
     if not _data_frame and _inmemory_filters:
       # corner case: no initial data frame but inmemory filters
@@ -817,25 +1642,48 @@ class InMemoryAdapter(DirectedGraphAdapter):
       if kind:
         _data_frame = (
           _metadata['kinds'].get(kind.__name__, {'keys': set()})['keys'])
-      else: _data_frame = _metadata['keys']
+      else:
+        with cls.metalock():  # copied, as other kinds may be written to
+          _data_frame = set(_metadata['keys'])
 
-    for n, (key, entity) in (
-          enumerate(((k, _datastore.get(k)) for k in _data_frame))):
+    def _matching(keys):
 
-      # @TODO(sgammon) log ghosts?
-      if not entity: continue  # skip missing entities
+      """ Lazily inflate entities for a stream of keys, skipping ghosts,
+          expired entities and those rejected by in-memory filters.
 
-      # stop if options say so, skip if the options say so
-      if options.limit and n >= options.limit: break
-      if options.offset and n <= options.offset: continue
-      # @TODO(sgammon): make sure we don't get any off-by-ones
+          :param keys: Iterable of flattened keys to inflate, in order.
 
-      # collapse in-memory filters
-      for _inner_f in _inmemory_filters:
-        if not _inner_f(entity):
-          break
-      else:
-        result_entities.append(entity)
+          :returns: Generator of matching entities, in order. """
+
+      for key in keys:
+
+        # @TODO(sgammon) log ghosts?
+        if cls.expired(key): continue
+        entity = cls.load(key)
+        if not entity: continue  # skip missing entities
+
+        # collapse in-memory filters
+        if all((_inner_f(entity) for _inner_f in _inmemory_filters)):
+          yield entity
+
+    ## unsorted: stop as soon as the page is full
+    if not sorts:
+      return list(_page(_matching(list(_data_frame))))
+
+    ## sorted by an indexed property: walk the index in order instead
+    _sort_index = _metadata[cls._index_prefix].get(
+      (kind.__name__, sorts[0].target.name))
+    if len(sorts) == 1 and isinstance(_sort_index, SortedIndex) and (
+          not sorts[0].target.repeated):
+
+      # copied, as expired entities are cleaned from the index as we go
+      _entries = _sort_index.entries[::(
+        1 if sorts[0].operator is query.ASCENDING else -1)]
+
+      return list(_page(_matching((
+        target for _, target in _entries if target in _data_frame))))
+
+    result_entities = list(_matching(list(_data_frame)))
 
     if not result_entities: return result_entities  # no need to sort, obvs
 
@@ -890,7 +1738,7 @@ class InMemoryAdapter(DirectedGraphAdapter):
         return _sort_frame
 
       if len(sorts) == 1:
-        return do_sort(sorts[0], result_entities)
+        return list(_page(do_sort(sorts[0], result_entities)))
 
       if len(sorts) > 1:
 
@@ -899,5 +1747,301 @@ class InMemoryAdapter(DirectedGraphAdapter):
         for sort in sorts:
           _sort_base = do_sort(*(
             sort, (_sort_base and result_entities) or _sort_base))
-        return _sort_base
+        return list(_page(_sort_base))
     return result_entities
+
+
+class SharedMemoryAdapter(InMemoryAdapter):
+
+  """ Adapt model classes to RAM shared across processes, like preforked
+      server workers. One writer process holds live state, exactly as the
+      ``InMemoryAdapter`` does, and publishes it to a segment file (see
+      :py:meth:`publish`). Every other process is a reader, and maps the
+      latest segment read-only (see :py:meth:`attach`), so entities are held
+      once per host rather than once per process. Indexes are loaded by each
+      reader, as they're published alongside entities.
+
+      A process is either a writer or a reader, and holds state for this
+      adapter in place of the ``InMemoryAdapter``'s. Readers refuse writes,
+      which must be made by the writer. """
+
+
+  class EngineConfig(InMemoryAdapter.EngineConfig):
+
+    """ Configuration for the `SharedMemoryAdapter` engine. """
+
+    segment_path = None  # segment file published to, and mapped by readers
+    writer = False  # whether this process holds live state and publishes it
+    publish_interval = 0  # seconds between background publishes (0 disables)
+    refresh_interval = 1.0  # seconds between checks for a newer segment
+
+
+  @classmethod
+  def writable(cls):
+
+    """ Ensure this process may write, as the writer.
+
+        :raises RuntimeError: If this process is a reader.
+
+        :returns: ``None``. """
+
+    if not cls.EngineConfig.writer:
+      raise RuntimeError('Shared memory is read-only in reader processes:'
+                         ' writes must be made by the writer.')
+
+  @classmethod
+  def publish(cls, path=None):
+
+    """ Publish every entity, index and graph structure held by the writer
+        to a segment file, for readers to map. Segments are written aside,
+        synced to disk and renamed into place, one publish at a time, so
+        readers only ever map complete segments.
+
+        Segments are a header (see ``_SEGMENT_HEADER``), then a record for
+        each entity (its flattened key and packed values, see
+        :py:meth:`pack`), a directory of records ordered by key digest (see
+        ``_SEGMENT_SLOT``), and finally, the metadata and graph.
+
+        :param path: File to publish the segment to. Defaults to ``None``,
+          which uses :py:attr:`EngineConfig.segment_path`.
+
+        :raises RuntimeError: If no segment file is given or configured, or
+          this process is a reader.
+
+        :returns: Count of entities published. """
+
+    cls.writable()
+    path = path or cls.EngineConfig.segment_path
+    if not path:
+      raise RuntimeError('No path was given or configured'
+                         ' for the shared segment.')
+
+    with _publishes_lock:
+      with cls.exclusive():
+        entities = [(flattened, entity if isinstance(entity, tuple) else (
+          cls.pack(entity))) for flattened, entity in _datastore.items()]
+        state = cls.dumps((_metadata, _graph))
+
+      slots, offset = [], _SEGMENT_HEADER.size
+      pending = '%s.pending' % path
+      with open(pending, 'wb') as handle:
+        handle.write('\0' * _SEGMENT_HEADER.size)  # filled in once known
+
+        for flattened, packed in entities:
+          record = cls.dumps((flattened, packed))
+          handle.write(record)
+          slots.append((_digest(flattened), offset, len(record)))
+          offset += len(record)
+
+        directory = offset
+        for slot in sorted(slots):
+          handle.write(_SEGMENT_SLOT.pack(*slot))
+        handle.write(state)
+
+        handle.seek(0)
+        handle.write(_SEGMENT_HEADER.pack(
+          _SEGMENT_MAGIC, _SEGMENT_VERSION, len(slots), directory,
+          directory + len(slots) * _SEGMENT_SLOT.size))
+        handle.flush()
+        os.fsync(handle.fileno())
+      os.rename(pending, path)
+    return len(slots)
+
+  @classmethod
+  def attach(cls):
+
+    """ Map the latest published segment, in a reader process. Readers check
+        for a newer segment at most every
+        :py:attr:`EngineConfig.refresh_interval` seconds, and map it in place
+        of the last. Reads carry on against the segment already mapped while
+        one thread maps a newer one.
+
+        :raises RuntimeError: If no segment has been published yet.
+
+        :returns: Mapped :py:class:`Segment`, or ``None`` in the writer. """
+
+    global _segment
+
+    if cls.EngineConfig.writer: return None
+
+    segment, now = _segment, time.time()
+    if segment is not None and (
+          now - segment.checked < cls.EngineConfig.refresh_interval):
+      return segment
+
+    # without a segment, wait for one; otherwise, let one thread check
+    if not _segment_lock.acquire(segment is None): return segment
+    try:
+      if _segment is not segment: return _segment  # mapped meanwhile
+
+      path = cls.EngineConfig.segment_path
+      if not path or not os.path.exists(path):
+        if segment is not None: return segment
+        raise RuntimeError('No shared segment has been'
+                           ' published at "%s".' % path)
+
+      if segment is not None and segment.identity == _identity(os.stat(path)):
+        segment.checked = now
+        return segment
+
+      segment = Segment(path, cls.loads)
+      metadata, graph = segment.state()
+      cls.mount(segment, metadata, graph)
+      _segment = segment
+      return segment
+    finally:
+      _segment_lock.release()
+
+  @classmethod
+  def publisher(cls):
+
+    """ Start publishing segments in the background from the writer, every
+        :py:attr:`EngineConfig.publish_interval` seconds, if that is set and
+        a publisher isn't running already.
+
+        :returns: ``None``. """
+
+    global _publishing
+
+    if not cls.EngineConfig.publish_interval or _publishing: return
+    with _publish_lock:
+      if _publishing: return
+      _publishing = True
+
+    def _publish():
+
+      """ Publish segments, forever. """
+
+      while True:
+        time.sleep(cls.EngineConfig.publish_interval)
+        try:
+          cls.publish()
+        except Exception:  # pragma: no cover
+          pass  # retried at the next interval
+
+    publisher = threading.Thread(target=_publish, name='inmemory-publisher')
+    publisher.daemon = True
+    publisher.start()
+
+  @classmethod
+  def expired(cls, flattened, now=None):
+
+    """ Check whether an entity has outlived its TTL. Only the writer
+        deletes expired entities; readers skip them.
+
+        :param flattened: Flattened key of the entity to check.
+
+        :param now: Timestamp to check expiry as of. Defaults to ``None``,
+          which uses the current time.
+
+        :returns: ``True`` if the entity has expired, ``False`` otherwise. """
+
+    if cls.EngineConfig.writer:
+      return super(SharedMemoryAdapter, cls).expired(flattened, now)
+
+    deadline = _metadata['expiry'].get(flattened)
+    return deadline is not None and (
+      deadline <= (time.time() if now is None else now))
+
+  @classmethod
+  def get(cls, key, **kwargs):
+
+    """ Retrieve an entity by Key, from the latest segment in readers.
+
+        :param key: Target :py:class:`model.Key` object to fetch.
+
+        :param kwargs: Implementation-specific flags/kwargs passed to the
+          underlying adapter from the application.
+
+        :returns: Entity at ``key``, if any, or ``None``. """
+
+    cls.attach()
+    return super(SharedMemoryAdapter, cls).get(key, **kwargs)
+
+  @classmethod
+  def execute_query(cls, kind, spec, options, **kwargs):
+
+    """ Execute a query, against the latest segment in readers.
+
+        :param kind: :py:class:`model.Model` subtype class to query for.
+
+        :param spec: Tuple of ``(filters, sorts)`` to apply.
+
+        :param options: :py:class:`canteen.model.query.QueryOptions`
+          instance for this query.
+
+        :param kwargs: Implementation-specific flags/kwargs to the underlying
+          adapter from the application.
+
+        :returns: Results matching ``spec`` for ``kind``. """
+
+    cls.attach()
+    return super(SharedMemoryAdapter, cls).execute_query(
+      kind, spec, options, **kwargs)
+
+  @classmethod
+  def put(cls, key, entity, model, **kwargs):
+
+    """ Persist an entity, in the writer (see :py:meth:`InMemoryAdapter.put`).
+
+        :raises RuntimeError: If this process is a reader.
+
+        :returns: ``key`` at which ``entity`` was stored. """
+
+    cls.writable()
+    written = super(SharedMemoryAdapter, cls).put(key, entity, model, **kwargs)
+    cls.publisher()
+    return written
+
+  @classmethod
+  def delete(cls, key, **kwargs):
+
+    """ Delete an entity, in the writer (see :py:meth:`InMemoryAdapter.delete`).
+
+        :raises RuntimeError: If this process is a reader.
+
+        :returns: ``True`` if the entity at ``key`` was found and deleted. """
+
+    cls.writable()
+    return super(SharedMemoryAdapter, cls).delete(key, **kwargs)
+
+  @classmethod
+  def allocate_ids(cls, key_class, kind, count=1, **kwargs):
+
+    """ Allocate new Key IDs, in the writer (see
+        :py:meth:`InMemoryAdapter.allocate_ids`).
+
+        :raises RuntimeError: If this process is a reader.
+
+        :returns: Allocated ID, or a generator of them. """
+
+    cls.writable()
+    return super(SharedMemoryAdapter, cls).allocate_ids(
+      key_class, kind, count, **kwargs)
+
+  @classmethod
+  def write_indexes(cls, writes, _graph, execute=True, **kwargs):
+
+    """ Write indexes, in the writer (see
+        :py:meth:`InMemoryAdapter.write_indexes`).
+
+        :raises RuntimeError: If this process is a reader.
+
+        :returns: Writes committed. """
+
+    if execute: cls.writable()
+    return super(SharedMemoryAdapter, cls).write_indexes(
+      writes, _graph, execute, **kwargs)
+
+  @classmethod
+  def clean_indexes(cls, writes, **kwargs):
+
+    """ Clean indexes, in the writer (see
+        :py:meth:`InMemoryAdapter.clean_indexes`).
+
+        :raises RuntimeError: If this process is a reader.
+
+        :returns: Index keys that were cleaned. """
+
+    cls.writable()
+    return super(SharedMemoryAdapter, cls).clean_indexes(writes, **kwargs)
@@ -14,15 +14,26 @@
 """
 
 # stdlib
+import sys
+import time
+import atexit
 import json
+import uuid
+import Queue
 import base64
+import bisect
+import hashlib
 import datetime
+import functools
+import threading
+import contextlib
 import collections
 from operator import itemgetter
 
 # adapter API
 from . import abstract
-from .abstract import (IndexedModelAdapter,
+from .abstract import (Future,
+                       IndexedModelAdapter,
                        DirectedGraphAdapter)
 
 # canteen util
@@ -33,13 +44,36 @@ from canteen.util import decorators
 ## Globals
 _support = struct.WritableObjectProxy()
 _mock_redis = None  # holds global singleton for mock testing
+_mock_shards = {}  # holds per-shard mock clients for testing
 _server_profiles = {}  # holds globally-configured server profiles
 _default_profile = None  # holds the default redis instance mapping
 _client_connections = {}  # holds instantiated redis connection clients
+_connection_pools = {}  # holds shared connection pools, by server profile
+_hash_rings = {}  # holds consistent hash rings, by tuple of shard profiles
 _profiles_by_model = {}  # holds specific model => redis instance mappings
+_script_hashes = {}  # holds SHA1 digests of scripts loaded into redis
+_async_tasks = None  # holds the queue of async operations, for worker threads
+_async_lock = threading.Lock()  # guards starting async worker threads
+_entity_cache = None  # holds the in-process entity cache, once started
+_cache_lock = threading.Lock()  # guards starting the entity cache
+_listeners = []  # holds cache invalidation listeners, and their subscriptions
+_stopping = threading.Event()  # set at exit, to stop cache listeners
+_id_leases = {}  # holds blocks of IDs leased for local allocation, by kind
+_id_lock = threading.Lock()  # guards creating ID leases
+_sweeping = False  # whether expired entities are swept in the background
+_sweep_lock = threading.Lock()  # guards starting the background sweeper
+_indexing = False  # whether deferred index writes are applied in the background
+_indexer_lock = threading.Lock()  # guards starting the background indexer
+_flush_lock = threading.Lock()  # serializes draining deferred index writes
+_flush_worker = uuid.uuid4().hex  # names this process's claimed index writes
 _SERIES_BASETYPES = (  # basetypes that should be stored as a sorted set
   datetime.datetime, datetime.date, float)
 
+_SORTED_SAMPLES = {  # sample values, to resolve sorted index names with
+  float: 0.0,
+  datetime.date: datetime.date(2000, 1, 1),
+  datetime.datetime: datetime.datetime(2000, 1, 1)}
+
 
 ##### ==== runtime ==== #####
 
@@ -59,7 +93,7 @@ except ImportError:  # pragma: no cover
 
 # resolve gevent
 try:
-  import gevent; _support.gevent = gevent
+  import gevent.event; _support.gevent = gevent
 except ImportError:  # pragma: no cover
   gevent, _support.gevent = None, False
 else:  # pragma: no cover
@@ -97,6 +131,589 @@ try:
   import lz4; _support.lz4 = lz4
 except ImportError:  # pragma: no cover
   lz4, _support.lz4 = None, False
+else:  # pragma: no cover
+  try:
+    import lz4.frame; _support.lz4 = lz4.frame  # prefer the frame format
+  except ImportError:
+    pass
+
+
+##### ==== blob format ==== #####
+
+# stored blobs are framed as `<magic><header><payload>`, where the header
+# byte packs the format version (high nibble), serializer and codec
+_FRAME_MAGIC = '\xc1'  # never emitted by msgpack, nor valid leading JSON
+_FRAME_VERSION = 0x1
+
+_SERIALIZERS = ('json', 'msgpack')  # serializers, by header ID
+_CODECS = (None, 'zlib', 'snappy', 'lz4')  # compression codecs, by header ID
+
+
+##### ==== connection pools ==== #####
+
+class PooledConnections(object):
+
+  """ Mixin for ``redis`` connection pools, which counts pool usage and checks
+      the health of connections that have sat idle in the pool before handing
+      them out again. """
+
+  health_check_interval = 30  # seconds idle before a connection is checked
+
+  def __init__(self, *args, **kwargs):
+
+    """ Initialize pool usage counters and health-check settings.
+
+        :param args: Positional arguments to pass to the underlying pool.
+
+        :param kwargs: Keyword arguments to pass to the underlying pool, and
+          ``health_check_interval``, the number of seconds a connection may
+          sit idle before it is checked (``None`` disables checks). """
+
+    self.health_check_interval = kwargs.pop('health_check_interval', (
+      self.health_check_interval))
+    self.stats = collections.Counter()
+    super(PooledConnections, self).__init__(*args, **kwargs)
+
+  def make_connection(self):
+
+    """ Create a new connection for this pool, counting it.
+
+        :returns: New ``redis`` connection. """
+
+    self.stats['created'] += 1
+    return super(PooledConnections, self).make_connection()
+
+  def get_connection(self, command_name, *keys, **options):
+
+    """ Acquire a connection from this pool, making sure it is still alive if
+        it has sat idle for longer than ``health_check_interval``. Dead
+        connections are disconnected, to be re-established on next use.
+
+        :param command_name: Name of the command the connection is for.
+
+        :returns: Acquired ``redis`` connection. """
+
+    connection = super(PooledConnections, self).get_connection(*((
+      command_name,) + keys), **options)
+
+    idle_since = getattr(connection, '_idle_since', None)
+    if idle_since is not None and self.health_check_interval is not None and (
+          (time.time() - idle_since) >= self.health_check_interval):
+
+      self.stats['health_checks'] += 1
+      try:
+        connection.send_command('PING')
+        connection.read_response()
+      except (redis.ConnectionError, redis.TimeoutError):
+        self.stats['reconnects'] += 1
+        connection.disconnect()
+
+    self.stats['acquired'] += 1
+    return connection
+
+  def release(self, connection):
+
+    """ Release a connection back into this pool, noting when it went idle.
+
+        :param connection: ``redis`` connection to release. """
+
+    connection._idle_since = time.time()
+    self.stats['released'] += 1
+    return super(PooledConnections, self).release(connection)
+
+  @property
+  def usage(self):
+
+    """ Snapshot of usage counters for this pool.
+
+        :returns: ``dict`` of counters, with ``in_use`` (connections currently
+          checked out) and ``max_connections`` (pool size). """
+
+    return dict(self.stats,
+                in_use=self.stats['acquired'] - self.stats['released'],
+                max_connections=self.max_connections)
+
+
+##### ==== sharding ==== #####
+
+class HashRing(object):
+
+  """ Consistent hash ring, which maps keys onto a set of nodes such that
+      adding or removing a node only moves the keys owned by that node. """
+
+  replicas = 160  # points on the ring per node, smooths out distribution
+
+  def __init__(self, nodes, replicas=None):
+
+    """ Build a ring for a set of nodes.
+
+        :param nodes: Iterable of ``basestring`` node names.
+
+        :param replicas: Number of points to place on the ring for each node.
+          Defaults to :py:attr:`HashRing.replicas`. """
+
+    self.nodes, self.replicas = tuple(nodes), replicas or self.replicas
+
+    points = sorted(((self.hash('%s:%s' % (node, i)), node) for node in (
+      self.nodes) for i in xrange(self.replicas)))
+
+    self._points, self._owners = (
+      [point for point, node in points], [node for point, node in points])
+
+  @staticmethod
+  def hash(value):
+
+    """ Hash a value onto the ring.
+
+        :param value: ``basestring`` value to hash.
+
+        :returns: ``int`` position on the ring. """
+
+    if isinstance(value, unicode): value = value.encode('utf-8')
+    return int(hashlib.md5(value).hexdigest()[:8], 16)
+
+  def get(self, key):
+
+    """ Resolve the node owning a key.
+
+        :param key: ``basestring`` key to place on the ring.
+
+        :returns: Name of the node owning ``key``. """
+
+    return self._owners[
+      bisect.bisect(self._points, self.hash(key)) % len(self._owners)]
+
+
+##### ==== entity cache ==== #####
+
+class EntityCache(object):
+
+  """ In-process, least-recently-used cache of inflated entities, bounded by
+      entry count and by the serialized size of cached entities, in bytes.
+      Entities are copied on the way in and out, so callers may mutate them.
+
+      Each invalidation bumps an ``epoch``: fills are only accepted at the
+      epoch they were read at, so that a read racing a write can't cache a
+      stale entity. """
+
+  __slots__ = ('max_entries',
+               'max_bytes',
+               'size',
+               'epoch',
+               'stats',
+               '_entries',
+               '_lock')
+
+  def __init__(self, max_entries, max_bytes):
+
+    """ Initialize this ``EntityCache``.
+
+        :param max_entries: Maximum number of entities to hold.
+        :param max_bytes: Maximum serialized size of entities to hold. """
+
+    self.max_entries, self.max_bytes, self.size, self.epoch = (
+      max_entries, max_bytes, 0, 0)
+    self.stats, self._entries, self._lock = (
+      collections.Counter(), collections.OrderedDict(), threading.Lock())
+
+  def __len__(self):
+
+    """ Count cached entities.
+
+        :returns: Number of entities currently cached. """
+
+    return len(self._entries)
+
+  @classmethod
+  def copy(cls, value):
+
+    """ Copy an inflated entity (or a value within one), structurally.
+
+        :param value: Inflated entity or value to copy.
+
+        :returns: Copy of ``value``, sharing only immutable values. """
+
+    if isinstance(value, dict):
+      return dict(((k, cls.copy(v)) for k, v in value.iteritems()))
+    if isinstance(value, list):
+      return [cls.copy(v) for v in value]
+    return value
+
+  def get(self, key):
+
+    """ Retrieve a copy of a cached entity.
+
+        :param key: Encoded key of the entity to retrieve.
+
+        :returns: Copy of the inflated entity, or ``None`` if it isn't
+          cached. """
+
+    with self._lock:
+      entry = self._entries.pop(key, None)
+      if entry is None:
+        self.stats['misses'] += 1
+        return None
+
+      self._entries[key] = entry  # now the most recently used
+      self.stats['hits'] += 1
+    return self.copy(entry[0])
+
+  def set(self, key, value, size, epoch):
+
+    """ Cache a copy of an inflated entity, evicting the least recently used
+        entities as needed to stay within bounds.
+
+        :param key: Encoded key of the entity to cache.
+
+        :param value: Inflated entity to cache.
+
+        :param size: Serialized size of the entity, in bytes.
+
+        :param epoch: Value of :py:attr:`epoch` when the entity was read.
+
+        :returns: ``True`` if the entity was cached. """
+
+    if size > self.max_bytes: return False
+    value = self.copy(value)
+
+    with self._lock:
+      if epoch != self.epoch: return False  # invalidated since it was read
+
+      previous = self._entries.pop(key, None)
+      if previous is not None: self.size -= previous[1]
+      self._entries[key], self.size = (value, size), self.size + size
+
+      while len(self._entries) > self.max_entries or (
+            self.size > self.max_bytes):
+        _key, (_value, _size) = self._entries.popitem(last=False)
+        self.size -= _size
+        self.stats['evictions'] += 1
+    return True
+
+  def invalidate(self, key):
+
+    """ Drop an entity from the cache, if it's cached.
+
+        :param key: Encoded key of the entity to drop.
+
+        :returns: ``True`` if the entity was cached. """
+
+    with self._lock:
+      self.epoch += 1
+      entry = self._entries.pop(key, None)
+      if entry is None: return False
+
+      self.size -= entry[1]
+      self.stats['invalidations'] += 1
+    return True
+
+  def clear(self):
+
+    """ Drop every entity from the cache.
+
+        :returns: ``None``. """
+
+    with self._lock:
+      self.epoch += 1
+      self._entries.clear()
+      self.size = 0
+
+
+def _stop_listeners(timeout=1.0):
+
+  """ Stop cache invalidation listeners (see :py:meth:`RedisAdapter.listen`),
+      closing their subscriptions, before the interpreter shuts down.
+
+      :param timeout: Seconds to wait for each listener to stop.
+
+      :returns: ``None``. """
+
+  _stopping.set()
+  for listener, subscription in list(_listeners):
+    if subscription:
+      try:
+        subscription[0].close()
+      except Exception:  # pragma: no cover
+        pass  # already dropped
+    if isinstance(listener, threading.Thread):
+      listener.join(timeout)
+    else:  # pragma: no cover
+      listener.kill(block=False)
+
+atexit.register(_stop_listeners)
+
+
+##### ==== ID leases ==== #####
+
+class IDLease(object):
+
+  """ Block of IDs leased for a kind with one increment of its counter in
+      Redis, which are then handed out locally, without a round trip.
+
+      The size of each new block adapts to the rate IDs are allocated at: if
+      a block is used up in less than half of ``window`` seconds, the next is
+      twice as big (up to ``ceiling``), and if it lasts more than twice as
+      long, it's halved (down to the initial size). IDs left over in a block
+      when the process exits are never used. """
+
+  __slots__ = ('size',
+               'floor',
+               'ceiling',
+               'window',
+               'next',
+               'top',
+               'leased',
+               '_lock')
+
+  def __init__(self, size, ceiling, window):
+
+    """ Initialize this ``IDLease``.
+
+        :param size: Initial (and minimum) number of IDs to lease at a time.
+        :param ceiling: Maximum number of IDs to lease at a time.
+        :param window: Seconds each leased block should last, ideally. """
+
+    self.size = self.floor = size
+    self.ceiling, self.window = max(ceiling, size), window
+    self.next, self.top, self.leased, self._lock = (
+      1, 0, None, threading.Lock())
+
+  def allocate(self, count, lease):
+
+    """ Allocate a contiguous range of IDs from this block, leasing a new
+        block first if there aren't enough left in this one.
+
+        :param count: Number of IDs to allocate.
+
+        :param lease: Callable which leases a new block of IDs, when passed
+          its size, and returns the highest ID in it.
+
+        :returns: Highest allocated ID (the range is ``count`` IDs, up to and
+          including it). """
+
+    with self._lock:
+      if self.top - self.next + 1 < count:
+        now = time.time()
+        if self.leased is not None:
+          elapsed = now - self.leased
+          if elapsed < self.window / 2.0:
+            self.size = min(self.size * 2, self.ceiling)
+          elif elapsed > self.window * 2:
+            self.size = max(self.size // 2, self.floor)
+
+        size = max(self.size, count)
+        self.top, self.leased = lease(size), now
+        self.next = self.top - size + 1
+
+      top, self.next = self.next + count - 1, self.next + count
+    return top
+
+
+##### ==== instrumentation ==== #####
+
+def _payload_size(args):
+
+  """ Measure the size of a command's arguments, as sent to Redis.
+
+      :param args: Iterable of arguments (which may nest mappings, like the
+        weights passed to ``ZINTERSTORE``).
+
+      :returns: Size of ``args``, in bytes. """
+
+  size = 0
+  for arg in args:
+    if isinstance(arg, basestring):
+      size += len(arg)
+    elif isinstance(arg, dict):
+      size += _payload_size(arg.iterkeys()) + _payload_size(arg.itervalues())
+    elif isinstance(arg, (list, tuple)):
+      size += _payload_size(arg)
+    else:
+      size += len(str(arg))
+  return size
+
+
+class Instrument(object):
+
+  """ Receives a record of each command sent to Redis by
+      :py:meth:`RedisAdapter.execute`, and of each round trip made, directly
+      or by executing a pipeline (see :py:meth:`RedisAdapter.commit`).
+      Instruments are enabled by listing them in
+      :py:attr:`RedisAdapter.EngineConfig.instruments`, and are called from
+      whichever thread issued the command. """
+
+  __slots__ = tuple()
+
+  def command(self, operation, kind, pipelined, size, latency):
+
+    """ Record a command.
+
+        :param operation: Redis command name (see
+          :py:class:`RedisAdapter.Operations`).
+
+        :param kind: String :py:class:`model.Model` kind the command was
+          issued for, or ``None`` if it wasn't issued for any one kind.
+
+        :param pipelined: ``True`` if the command was queued in a pipeline.
+
+        :param size: Size of the command's arguments, in bytes.
+
+        :param latency: Seconds taken to send the command and read its reply,
+          or ``None`` for pipelined commands.
+
+        :returns: ``None``. """
+
+  def round_trip(self, commands, latency):
+
+    """ Record a round trip to Redis.
+
+        :param commands: Number of commands sent in the round trip.
+        :param latency: Seconds the round trip took.
+
+        :returns: ``None``. """
+
+
+class Metrics(Instrument):
+
+  """ Instrument that aggregates commands in-process, by operation and kind:
+      calls (pipelined and direct), payload bytes and a histogram of direct
+      latencies, bucketed by :py:attr:`buckets`. Round trips are counted
+      overall, and within each :py:meth:`request` scope. """
+
+  buckets = (  # upper bounds of latency histogram buckets, in seconds
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+  __slots__ = ('commands', 'round_trips', '_local', '_lock')
+
+  def __init__(self):
+
+    """ Initialize this ``Metrics`` instrument, with nothing recorded. """
+
+    self.commands, self.round_trips, self._local, self._lock = (
+      {}, 0, threading.local(), threading.Lock())
+
+  def command(self, operation, kind, pipelined, size, latency):
+
+    """ Record a command, against its operation and kind (see
+        :py:meth:`Instrument.command`). """
+
+    with self._lock:
+      stats = self.commands.get((operation, kind))
+      if stats is None:
+        stats = self.commands[(operation, kind)] = {
+          'calls': 0,
+          'pipelined': 0,
+          'direct': 0,
+          'bytes': 0,
+          'latency': [0] * (len(self.buckets) + 1)}
+
+      stats['calls'] += 1
+      stats['bytes'] += size
+      if pipelined:
+        stats['pipelined'] += 1
+      else:
+        stats['direct'] += 1
+        stats['latency'][bisect.bisect_left(self.buckets, latency)] += 1
+
+    scope = getattr(self._local, 'scope', None)
+    if scope is not None: scope['commands'] += 1
+
+  def round_trip(self, commands, latency):
+
+    """ Record a round trip, overall and within the current
+        :py:meth:`request` scope (see :py:meth:`Instrument.round_trip`). """
+
+    with self._lock:
+      self.round_trips += 1
+
+    scope = getattr(self._local, 'scope', None)
+    if scope is not None:
+      scope['round_trips'] += 1
+      scope['latency'] += latency
+
+  @contextlib.contextmanager
+  def request(self):
+
+    """ Count round trips made (and commands sent) by the current thread
+        while in this context, say, for the duration of one request.
+
+        :returns: ``dict`` of ``round_trips``, ``commands`` and ``latency``
+          (total seconds spent in round trips), updated until the context
+          exits. """
+
+    previous, self._local.scope = getattr(self._local, 'scope', None), {
+      'round_trips': 0, 'commands': 0, 'latency': 0.0}
+    try:
+      yield self._local.scope
+    finally:
+      self._local.scope = previous
+
+  def snapshot(self):
+
+    """ Capture the metrics recorded so far.
+
+        :returns: ``dict`` with the count of ``round_trips``, and
+          ``commands``, a ``list`` of stats ``dict``s (including their
+          ``operation`` and ``kind``). """
+
+    with self._lock:
+      return {
+        'round_trips': self.round_trips,
+        'commands': [dict(stats, operation=operation, kind=kind, latency=(
+          list(stats['latency']))) for (operation, kind), stats in (
+            sorted(self.commands.iteritems()))]}
+
+  def reset(self):
+
+    """ Discard the metrics recorded so far.
+
+        :returns: ``None``. """
+
+    with self._lock:
+      self.commands, self.round_trips = {}, 0
+
+
+##### ==== scripts ==== #####
+
+# executes a planned query server-side: intersects set indexes, filters by
+# sorted index score ranges and pages the result, all in one round trip. only
+# the indexes passed as KEYS are read: matching entities are fetched after.
+#
+# KEYS: sorted indexes (ARGV[3] of them), followed by unsorted set indexes
+# ARGV: offset, limit, sorted count, [min, max]...
+_QUERY_SCRIPT = """
+local unpack = unpack or table.unpack
+local offset, limit = tonumber(ARGV[1]), tonumber(ARGV[2])
+local sorted = tonumber(ARGV[3])
+local sets, candidates = {}, nil
+
+for i = sorted + 1, #KEYS do sets[#sets + 1] = KEYS[i] end
+if #sets > 0 then candidates = redis.call('SINTER', unpack(sets)) end
+
+for i = 1, sorted do
+  local matched = redis.call(
+    'ZRANGEBYSCORE', KEYS[i], ARGV[2 + (i * 2)], ARGV[3 + (i * 2)])
+
+  if candidates == nil then
+    candidates = matched
+  else
+    local lookup, merged = {}, {}
+    for _, member in ipairs(matched) do lookup[member] = true end
+    for _, member in ipairs(candidates) do
+      if lookup[member] then merged[#merged + 1] = member end
+    end
+    candidates = merged
+  end
+end
+
+candidates = candidates or {}
+table.sort(candidates)
+
+local last, page = #candidates, {}
+if limit > 0 then last = math.min(last, offset + limit) end
+for i = offset + 1, last do page[#page + 1] = candidates[i] end
+return page
+"""
 
 
 class RedisMode(object):
@@ -123,10 +740,19 @@ class RedisAdapter(DirectedGraphAdapter):
   _id_prefix = '__id__'
   _meta_prefix = '__meta__'
   _kind_prefix = '__kind__'
+  _temp_prefix = '__temp__'
+  _cache_prefix = '__cache__'
+  _expiry_prefix = '__expiry__'
+  _pending_prefix = '__pending__'
+  _temp_ttl = 60  # seconds to keep temporary keys read across round trips
   _magic_separator = '::'
   _path_separator = '.'
   _chunk_separator = ':'
 
+  # server-side Lua scripts, by name
+  _scripts = {
+    'query': _QUERY_SCRIPT}
+
 
   class EngineConfig(object):
 
@@ -134,8 +760,25 @@ class RedisAdapter(DirectedGraphAdapter):
 
     encoding = True  # encoding for keys and special values
     serializer = json  # json or msgpack
-    compression = False  # compression for serialized data values
+    compression = False  # codec for blobs: `True`, 'zlib', 'snappy', 'lz4'
+    compression_threshold = 256  # minimum size (bytes) of blobs to compress
     mode = RedisMode.toplevel_blob  # internal mode of operation
+    scripting = False  # execute queries server-side, via Lua scripts
+    shards = None  # server profiles to shard entity groups across
+    batch_size = 100  # batch size for streamed index scans and fetches
+    async_workers = 32  # threads running async operations, without gevent
+    cache = False  # cache inflated entities in-process, invalidated by pub/sub
+    cache_entries = 10000  # maximum number of entities to cache
+    cache_bytes = 64 * 1024 * 1024  # maximum serialized size of cached entities
+    intersect_ttl = 0  # seconds to keep intersected query results around
+    id_block = 0  # IDs to lease per kind at a time, allocated locally (or 0)
+    id_block_max = 10000  # maximum IDs to lease at a time, as blocks adapt
+    id_block_window = 10.0  # seconds each block of leased IDs should last
+    sweep_interval = 30  # seconds between sweeps of expired entities (or 0)
+    write_behind = False  # defer index writes, to be applied in the background
+    write_behind_batch = 500  # deferred index writes to apply at a time
+    write_behind_interval = 0.1  # seconds the indexer idles for (0 disables it)
+    instruments = ()  # `Instrument`s to record commands and round trips to
 
 
   class Operations(object):
@@ -209,6 +852,7 @@ class RedisAdapter(DirectedGraphAdapter):
     RIGHT_PUSH = 'RPUSH'
     LEFT_PUSH_X = 'LPUSHX'
     RIGHT_PUSH_X = 'RPUSHX'
+    RIGHT_POP_LEFT_PUSH = 'RPOPLPUSH'
     LIST_TRIM = 'LTRIM'
     LIST_INDEX = 'LINDEX'
     LIST_RANGE = 'LRANGE'
@@ -232,6 +876,7 @@ class RedisAdapter(DirectedGraphAdapter):
     SET_UNION_STORE = 'SUNIONSTORE'
     SET_RANDOM_MEMBER = 'SRANDMEMBER'
     SET_INTERSECT_STORE = 'SINTERSTORE'
+    SET_SCAN = 'SSCAN'
 
     ## Sorted Set Operations
     SORTED_ADD = 'ZADD'
@@ -250,6 +895,7 @@ class RedisAdapter(DirectedGraphAdapter):
     SORTED_MEMBERS_BY_SCORE = 'ZREVRANGEBYSCORE'
     SORTED_REMOVE_RANGE_BY_RANK = 'ZREMRANGEBYRANK'
     SORTED_REMOVE_RANGE_BY_SCORE = 'ZREMRANGEBYSCORE'
+    SORTED_SCAN = 'ZSCAN'
 
     ## Pub/Sub Operations
     PUBLISH = 'PUBLISH'
@@ -317,8 +963,7 @@ class RedisAdapter(DirectedGraphAdapter):
               cls.EngineConfig.mode,
               cls.EngineConfig.serializer and (
                 cls.EngineConfig.serializer.__name__),
-              cls.EngineConfig.compression and (
-                cls.EngineConfig.compression.__name__))
+              _CODECS[cls.codec()[0]])
 
   __unicode__ = __str__ = __repr__
 
@@ -352,7 +997,7 @@ class RedisAdapter(DirectedGraphAdapter):
         :returns: Currently-configured compressor, mounted statically at
           ``cls.EngineConfig.compression``. """
 
-    return cls.EngineConfig.compression or zlib
+    return cls.codec()[1] or zlib
 
   @classmethod
   def acquire(cls, name, bases, properties):
@@ -377,14 +1022,14 @@ class RedisAdapter(DirectedGraphAdapter):
       ## Resolve Redis config
       if servers:  # pragma: no cover
         for name, config in servers.items():
-          if name == 'default' or (config.get('default', False) is True):
+          if name == 'default' or (not isinstance(config, basestring) and (
+                config.get('default', False) is True)):
             _default_profile = name
           elif not _default_profile:  # pragma: no cover
             _default_profile = name
-          if isinstance(config, basestring):
-            _server_profiles[name] = redis.from_url(config)
-          else:
-            _server_profiles[name] = config
+
+          # strings are URLs, or pointers to other profiles
+          _server_profiles[name] = config
 
       if not _default_profile:
         # still no default? inject sensible defaults
@@ -393,13 +1038,77 @@ class RedisAdapter(DirectedGraphAdapter):
           'host': '127.0.0.1', 'port': 6379}
 
   @classmethod
-  def channel(cls, kind):
+  def pool(cls, profile=None):
+
+    """ Retrieve the shared connection pool for a server profile, creating it
+        on first use. Profiles may specify, in addition to regular ``redis``
+        connection options:
+
+        - ``max_connections``: maximum size of the pool (``1000``)
+        - ``blocking``: wait for a free connection when the pool is exhausted,
+          instead of raising an error (``False``)
+        - ``timeout``: seconds to wait for a free connection, when blocking
+          (``20``)
+        - ``health_check_interval``: seconds a connection may sit idle before
+          it is checked on acquisition (``30``, ``None`` to disable)
+        - ``unix_socket_path``: connect over a unix socket at this path
+
+        :param profile: Name of the server profile to retrieve a pool for.
+          Defaults to ``None``, which resolves the default profile.
+
+        :returns: Pool for the requested profile, mixed with
+          :py:class:`PooledConnections`. """
+
+    global _connection_pools
+
+    name = profile or _default_profile or '__default__'
+    if name in _connection_pools:
+      return _connection_pools[name]
+
+    # resolve profile config, following pointers to other profiles
+    config = _server_profiles.get(name, {'host': '127.0.0.1', 'port': 6379})
+    while isinstance(config, basestring) and config in _server_profiles:
+      config = _server_profiles[config]
+
+    options = dict(config) if not isinstance(config, basestring) else {}
+    options.pop('default', None)
+    blocking, max_connections, timeout = (
+      options.pop('blocking', False),
+      options.pop('max_connections', 1000),
+      options.pop('timeout', 20))
+
+    base = (cls.adapter.BlockingConnectionPool if blocking else (
+            cls.adapter.ConnectionPool))
+    impl = type(base.__name__, (PooledConnections, base), {})
+
+    if blocking: options['timeout'] = timeout
+    options['max_connections'] = max_connections
+
+    if isinstance(config, basestring):  # it's a URL
+      pool = impl.from_url(config, **options)
+
+    else:
+      if 'unix_socket_path' in options:
+        options['path'] = options.pop('unix_socket_path')
+        options['connection_class'] = cls.adapter.UnixDomainSocketConnection
+        options.pop('host', None), options.pop('port', None)
+      pool = impl(**options)
+
+    _connection_pools[name] = pool
+    return pool
+
+  @classmethod
+  def channel(cls, kind, shard=None):
 
     """ Retrieve a write channel to Redis.
 
         :param kind: String :py:class:`model.Model` kind to retrieve a channel
           for.
 
+        :param shard: Name of the server profile to retrieve a channel for,
+          as resolved by :py:meth:`shard`. Defaults to ``None``, which routes
+          by ``kind``.
+
         :raises RuntimeError:
 
         :returns: Acquired ``Redis`` client connection, potentially specific to
@@ -413,159 +1122,689 @@ class RedisAdapter(DirectedGraphAdapter):
 
     if not (__debug__ and cls.__testing__):  # pragma: no cover
 
-      impl, pool, profile = (
-        cls.adapter.StrictRedis, cls.adapter.ConnectionPool, None)
-
       # convert to string kind if we got a model class
       if not isinstance(kind, basestring) and kind is not None:
         kind = kind.kind()
 
-      # check for existing connection
-      if kind in _client_connections:
-        return _client_connections[kind]  # return cached connection
-
-      # check kind-specific profiles
-      if kind in _profiles_by_model.get('index', set()):  # pragma: no cover
+      # resolve profile: shard, kind-specific, or default
+      profile = shard or _default_profile or '__default__'
+      if not shard and kind in _profiles_by_model.get('index', set()):
         profile = _profiles_by_model['map'].get(kind)
-        if 'unix_socket_path' in profile:
-          client = _client_connections[kind] = (
-            impl(**profile))
-          return client
-
-        max_connections = profile.get('max_connections', 1000)
-        if 'max_connections' in profile:
-          del profile['max_connections']
-        client = _client_connections[kind] = pool(
-          max_connections=max_connections, **profile)
-        return impl(connection_pool=client)
-
-      # # @TODO(sgammon): patch client with connection/workerpool (if gevent)
-
-      # check for cached default connection
-      if '__default__' in _client_connections:
-        return _client_connections['__default__']
-
-      _config = cls.config
-      if 'servers' in _config:
-        profile = _config['servers'].get('default', None)
-        profile = _config['servers'].get(profile, None)
-        if profile: return impl(**profile)
-
-      # otherwise, build new default
-      default_profile = profile = _server_profiles[_default_profile]
-      if isinstance(default_profile, basestring):
-        # if it's a string, it's a pointer to a profile
-        profile = _server_profiles[default_profile]
-
-      client = _client_connections['__default__'] = impl(**profile)
-      return client
+        if not isinstance(profile, basestring):
+          # inline profile config: register it under the kind name
+          _server_profiles.setdefault(kind, profile)
+          profile = kind
+
+      # clients are cached per profile, and share that profile's pool
+      if profile not in _client_connections:
+        _client_connections[profile] = cls.adapter.StrictRedis(
+          connection_pool=cls.pool(profile))
+      return _client_connections[profile]
 
     else:  # pragma: no cover
 
       # mock adapter testing
       import fakeredis
 
+      if shard:  # each shard gets a database of its own
+        if shard not in _mock_shards:
+          _mock_shards[shard] = fakeredis.FakeStrictRedis(
+            db=len(_mock_shards) + 1)
+        return _mock_shards[shard]
+
       if not _mock_redis:
         _mock_redis = fakeredis.FakeStrictRedis()
       return _mock_redis
 
   @classmethod
-  def execute(cls, operation, kind, *args, **kwargs):
-
-    """ Acquire a channel and execute an operation, optionally buffering the
-        command.
+  def shard(cls, key):
 
-        :param operation: Operation name to execute (from
-          :py:attr:`RedisAdapter.Operations`).
+    """ Resolve the shard an entity lives on, by consistent hashing of its
+        entity group (root key) across :py:attr:`EngineConfig.shards`, so that
+        entity groups are never split.
 
-        :param kind: String :py:class:`model.Model` kind to acquire the channel
-          for.
+        :param key: :py:class:`model.Key`, or flattened ``(parent, kind, id)``
+          key, to resolve a shard for.
 
-        :param args: Positional arguments to pass to the low-level operation
-          selected.
+        :returns: Name of the server profile holding ``key``, or ``None`` if
+          sharding is disabled. """
 
-        :param kwargs: Keyword arguments to pass to the low-level operation
-          selected.
+    global _hash_rings
 
-        :returns: Result of the selected low-level operation. """
+    from canteen import model
 
-    # defer to pipeline or resolve channel for kind
-    target = kwargs.get('target', None)
-    if target is None: target = cls.channel(kind)
+    shards = cls.EngineConfig.shards
+    if not shards: return None
 
-    if operation == cls.Operations.DELETE:
-      # special case: `delete` instead of `del` (because it's a keyword)
-      operation = 'DELETE'
+    flattened = key.flatten() if isinstance(key, model.Key) else key
+    while flattened[0]:  # walk up to the root key
+      parent = flattened[0]
 
-    if 'target' in kwargs: del kwargs['target']
+      # parents of keys flattened with `join` are `(joined, flattened)` pairs
+      flattened = parent[1] if isinstance(parent[0], basestring) else parent
 
-    try:
-      if isinstance(operation, tuple):  # pragma: no cover
-        # (CLIENT, KILL) => "CLIENT KILL"
-        operation = '_'.join(map(unicode, operation))
-      if isinstance(target, (_redis_client.client.Pipeline,
-                             _redis_client.client.StrictPipeline)) or (
-              fakeredis and isinstance(target, fakeredis.FakePipeline)):
-        getattr(target, operation.lower())(*args, **kwargs)
-        return target
-      if operation == cls.Operations.HASH_SET:  # pragma: no cover
-        r = getattr(target, operation.lower())(*args, **kwargs)
-        if r in (0, 1):
-          # count 0 and 1 as success, as it indicates an overwrite,
-          # not a failure
-          return 1
-      return getattr(target, operation.lower())(*args, **kwargs)
-    except Exception:  # pragma: no cover
-      raise
+    shards = tuple(shards)
+    if shards not in _hash_rings:
+      _hash_rings[shards] = HashRing(shards)
+    return _hash_rings[shards].get(u'%s:%s' % (flattened[1], flattened[2]))
 
   @classmethod
-  def inflate(cls, result):
+  def entity_cache(cls, kind):
 
-    """ Small closure that can inflate (and potentially decompress) a resulting
-        object for a given storage mode.
+    """ Resolve the in-process entity cache, if caching is enabled for
+        ``kind``: per model (via ``__cache__``), or across the engine (via
+        :py:attr:`EngineConfig.cache`). The cache, and a listener for
+        invalidations on each shard, are started on first use.
 
-        :param result: ``basestring`` result from raw Redis storage.
+        :param kind: String :py:class:`model.Model` kind name.
 
-        :returns: Inflated entity, if applicable. """
+        :returns: The :py:class:`EntityCache`, or ``None`` if caching is
+          disabled for ``kind``. """
 
-    if not isinstance(result, basestring):  # pragma: no cover
-      return result  # accounts for dict-like storage
+    global _entity_cache
 
-    # account for none, optionally decompress
-    if cls.EngineConfig.compression:  # pragma: no cover
-      try:
-        result = cls.compressor.decompress(result)
-      except:
-        pass  # maybe entity is uncompressed? will fail during deserialization
+    setting = getattr(cls.registry.get(kind), '__cache__', None)
+    if setting is None: setting = cls.EngineConfig.cache
+    if not setting: return None
 
-    # deserialize structures
-    return cls.serializer.loads(result)
+    if _entity_cache is None:
+      with _cache_lock:
+        if _entity_cache is None:
+          cache = EntityCache(*(
+            cls.EngineConfig.cache_entries, cls.EngineConfig.cache_bytes))
+          for shard in (cls.EngineConfig.shards or (None,)):
+            cls.listen(cache, shard)
+          _entity_cache = cache
+    return _entity_cache
 
   @classmethod
-  def get(cls, key, pipeline=None, _entity=None):
+  def id_lease(cls, kind):
 
-    """ Retrieve an entity by Key from Redis.
+    """ Resolve the local lease of IDs for ``kind``, if leasing is enabled
+        for it: per model (via ``__id_block__``), or across the engine (via
+        :py:attr:`EngineConfig.id_block`), either of which sets the initial
+        number of IDs to lease at a time.
 
-        :param key: Target :py:class:`model.Key` to retrieve from storage.
+        :param kind: String :py:class:`model.Model` kind name.
 
-        :param pipeline: Redis pipeline to enqueue the resulting commands
-          in, rather than directly executing them. Defaults to ``None``. If a
-          pipeline is passed, it will be returned in lieu of the pending
-          result.
+        :returns: The :py:class:`IDLease` for ``kind``, or ``None`` if IDs
+          are allocated from Redis directly. """
+
+    setting = getattr(cls.registry.get(kind), '__id_block__', None)
+    if setting is None: setting = cls.EngineConfig.id_block
+    if not setting: return None
+
+    lease = _id_leases.get(kind)
+    if lease is None:
+      with _id_lock:
+        lease = _id_leases.get(kind)
+        if lease is None:
+          lease = _id_leases[kind] = IDLease(*(
+            int(setting),
+            cls.EngineConfig.id_block_max,
+            cls.EngineConfig.id_block_window))
+    return lease
+
+  @classmethod
+  def write_behind(cls, kind):
+
+    """ Resolve whether index writes are deferred for ``kind``: per model
+        (via ``__write_behind__``), or across the engine (via
+        :py:attr:`EngineConfig.write_behind`). Deferred index writes are
+        queued alongside each entity write, and applied later by
+        :py:meth:`flush_indexes`.
+
+        :param kind: String :py:class:`model.Model` kind name.
+
+        :returns: ``True`` if index writes for ``kind`` are deferred. """
+
+    setting = getattr(cls.registry.get(kind), '__write_behind__', None)
+    if setting is None: setting = cls.EngineConfig.write_behind
+    return bool(setting)
+
+  @classmethod
+  def listen(cls, cache, shard=None):
+
+    """ Start listening for entity cache invalidations, published on each
+        kind's channel by writes to a server (see :py:meth:`invalidate`). If
+        the subscription drops, the cache is cleared, as invalidations may
+        have been missed, and the failure is logged. Listeners are stopped
+        when the interpreter exits.
+
+        :param cache: :py:class:`EntityCache` to invalidate entities in.
+
+        :param shard: Server profile to listen on, if sharding.
+
+        :returns: ``None``. """
+
+    pattern = cls._magic_separator.join((cls._cache_prefix, '*'))
+    subscription = []  # current subscription, closed at exit
+
+    def _listen():
+
+      """ Subscribe and apply invalidations, until stopped. """
+
+      while not _stopping.is_set():
+        try:
+          pubsub = cls.channel(None, shard).pubsub(
+            ignore_subscribe_messages=True)
+          subscription[:] = [pubsub]
+          pubsub.psubscribe(pattern)
+
+          while not _stopping.is_set():
+            message = pubsub.get_message(timeout=1.0)
+            if message and message['type'] == 'pmessage':
+              cache.invalidate(message['data'])
+
+        except Exception:  # pragma: no cover
+          if _stopping.is_set(): return
+          cls.logging.warning('Entity cache subscription dropped on "%s",'
+                              ' clearing cache.' % (shard or 'default'),
+                              exc_info=True)
+          cache.clear()
+          _stopping.wait(1.0)
+
+    if _support.gevent:  # pragma: no cover
+      listener = gevent.spawn(_listen)
+    else:
+      listener = threading.Thread(target=_listen, name=(
+        'redis-cache-%s' % (shard or 'default')))
+      listener.daemon = True
+      listener.start()
+    _listeners.append((listener, subscription))
+
+  @classmethod
+  def invalidate(cls, kind, encoded, target=None, shard=None):
+
+    """ Drop an entity from the in-process cache, and publish its invalidation
+        to other processes on the ``kind``'s channel. If ``target`` is a
+        transaction, the invalidation is published as the write is applied.
+
+        :param kind: String :py:class:`model.Model` kind name.
+
+        :param encoded: Encoded key of the entity.
+
+        :param target: Pipeline to enqueue the invalidation in, if any.
+
+        :param shard: Server profile the entity lives on, if sharding.
+
+        :returns: ``None``. """
+
+    cache = cls.entity_cache(kind)
+    if cache is None: return
+
+    cache.invalidate(encoded)
+    cls.execute(*(
+      cls.Operations.PUBLISH,
+      kind,
+      cls._magic_separator.join((cls._cache_prefix, kind)),
+      encoded), target=target, shard=shard)
+
+  @staticmethod
+  def blob_size(result):
+
+    """ Measure the serialized size of an entity read from storage.
+
+        :param result: Raw blob, or ``dict`` of raw hash fields.
+
+        :returns: Size of ``result``, in bytes. """
+
+    if isinstance(result, dict):
+      return sum((len(field) + len(value) for field, value in (
+        result.iteritems())))
+    return len(result)
+
+  @classmethod
+  def hydrate(cls, key, entity, known=None, projection=None):
+
+    """ Build a model instance from an entity inflated from storage. Keys are
+        only decoded if the caller didn't already hold them, in which case the
+        entity gets its own copy, so caller-held keys are never shared between
+        entities or marked persisted.
+
+        :param key: Tupled ``(encoded, flattened)`` key the entity was read
+          with.
+
+        :param entity: Inflated entity ``dict``.
+
+        :param known: ``dict`` of :py:class:`model.Key` objects already held by
+          the caller, by encoded key, to reuse in place of decoding ``key``.
+
+        :param projection: Property names ``entity`` was fetched with, if it
+          was fetched with a projection. The instance is marked as partial, so
+          that it can't be put back (see :py:meth:`_put_multi`).
+
+        :returns: Persisted :py:class:`model.Model` instance. """
+
+    encoded, flattened = key
+    held = known.get(encoded) if known else None
+    keyclass = cls.registry[flattened[1]].__keyclass__
+
+    if held is None:
+      _key = keyclass.from_raw(base64.b64decode(encoded), _persisted=True)
+    else:
+      _key = keyclass(held.kind, held.id, parent=held.parent, _persisted=True)
+
+    entity['key'] = _key
+    instance = cls.registry[flattened[1]](_persisted=True, **entity)
+    if projection: instance.__projection__ = frozenset(projection)
+    return instance
+
+  @classmethod
+  def dispatch(cls, task):
+
+    """ Run a task concurrently: on its own greenlet, if ``gevent`` is
+        available (in which case ``Redis`` sockets are cooperative, and any
+        number of calls may be in flight), or otherwise on a pool of worker
+        threads, sized by :py:attr:`EngineConfig.async_workers`. Calls share
+        pooled connections either way.
+
+        :param task: Callable to run, which must not raise.
+
+        :returns: ``None``. """
+
+    global _async_tasks
+
+    if _support.gevent:  # pragma: no cover
+      gevent.spawn(task)
+      return
+
+    if _async_tasks is None:
+      with _async_lock:
+        if _async_tasks is None:
+          tasks = Queue.Queue()
+
+          def _work():
+
+            """ Run queued tasks, forever. """
+
+            while True: tasks.get()()
+
+          for i in xrange(cls.EngineConfig.async_workers):
+            worker = threading.Thread(target=_work, name=(
+              'redis-async-%s' % i))
+            worker.daemon = True
+            worker.start()
+          _async_tasks = tasks
+
+    _async_tasks.put(task)
+
+  def _async(self, operation, *args, **kwargs):
+
+    """ Run an operation without blocking the caller, backing the ``*_async``
+        model methods. See :py:meth:`dispatch`.
+
+        :param operation: Callable to run.
+
+        :param args: Positional arguments to pass to ``operation``.
+        :param kwargs: Keyword arguments to pass to ``operation``.
+
+        :returns: :py:class:`Future` for the operation's result. """
+
+    future = Future(gevent.event.Event() if _support.gevent else None)
+    self.dispatch(functools.partial(future.run, operation, *args, **kwargs))
+    return future
+
+  @classmethod
+  def fan_out(cls, calls):
+
+    """ Run a set of calls (usually one per shard) in parallel, via ``gevent``
+        if available, and threads otherwise.
+
+        :param calls: Iterable of callables, each taking no arguments.
+
+        :raises: The first exception raised by any of ``calls``.
+
+        :returns: ``list`` of results from ``calls``, in order. """
+
+    calls = list(calls)
+    if len(calls) < 2:
+      return [call() for call in calls]
+
+    if _support.gevent:  # pragma: no cover
+      greenlets = [gevent.spawn(call) for call in calls]
+      gevent.joinall(greenlets, raise_error=True)
+      return [greenlet.value for greenlet in greenlets]
+
+    results, errors = [None] * len(calls), []
+
+    def _run(index, call):
+
+      """ Run a call and store its result (or error). """
+
+      try:
+        results[index] = call()
+      except Exception:  # pragma: no cover
+        errors.append(sys.exc_info())
+
+    threads = [threading.Thread(target=_run, args=(index, call)) for (
+      index, call) in enumerate(calls)]
+
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+
+    if errors:  # pragma: no cover
+      raise errors[0][0], errors[0][1], errors[0][2]
+    return results
+
+  @classmethod
+  def gather(cls, operation, kind, *args):
+
+    """ Execute an index read on every shard and gather the results. Entities
+        and their indexes live together on one shard, so the union of each
+        shard's results is the result across the whole dataset.
+
+        :param operation: Operation name to execute (from
+          :py:attr:`RedisAdapter.Operations`).
+
+        :param kind: String :py:class:`model.Model` kind to acquire channels
+          for.
+
+        :param args: Positional arguments to pass to the low-level operation
+          selected.
+
+        :returns: Result of the operation, as a ``set`` of members if
+          sharding is enabled. """
+
+    if not cls.EngineConfig.shards:
+      return cls.execute(operation, kind, *args)
+
+    gathered = set()
+    for frame in cls.fan_out((functools.partial(*(
+          cls.execute, operation, kind) + args, shard=shard) for (
+            shard) in cls.EngineConfig.shards)):
+      gathered.update(frame)
+    return gathered
+
+  @classmethod
+  def execute(cls, operation, kind, *args, **kwargs):
+
+    """ Acquire a channel and execute an operation, optionally buffering the
+        command.
+
+        :param operation: Operation name to execute (from
+          :py:attr:`RedisAdapter.Operations`).
+
+        :param kind: String :py:class:`model.Model` kind to acquire the channel
+          for.
+
+        :param args: Positional arguments to pass to the low-level operation
+          selected.
+
+        :param kwargs: Keyword arguments to pass to the low-level operation
+          selected. Accepts ``target``, a pipeline or client to execute
+          against, and ``shard``, a server profile to execute against.
+
+        :returns: Result of the selected low-level operation. """
+
+    # defer to pipeline or resolve channel for kind (and shard)
+    target, shard = kwargs.pop('target', None), kwargs.pop('shard', None)
+    if target is None: target = cls.channel(kind, shard)
+
+    instruments, command = cls.EngineConfig.instruments, operation
+
+    if operation == cls.Operations.DELETE:
+      # special case: `delete` instead of `del` (because it's a keyword)
+      operation = 'DELETE'
+
+    try:
+      if isinstance(operation, tuple):  # pragma: no cover
+        # (CLIENT, KILL) => "CLIENT KILL"
+        operation = '_'.join(map(unicode, operation))
+      if isinstance(target, (_redis_client.client.Pipeline,
+                             _redis_client.client.StrictPipeline)) or (
+              fakeredis and isinstance(target, fakeredis.FakePipeline)):
+        getattr(target, operation.lower())(*args, **kwargs)
+        if instruments:
+          # tally queued commands ourselves, as not all clients size pipelines
+          target._queued_commands = getattr(target, '_queued_commands', 0) + 1
+          size = _payload_size(args)
+          for instrument in instruments:
+            instrument.command(command, kind, True, size, None)
+        return target
+
+      started = time.time() if instruments else None
+      result = getattr(target, operation.lower())(*args, **kwargs)
+
+      if instruments:
+        latency, size = time.time() - started, _payload_size(args)
+        for instrument in instruments:
+          instrument.command(command, kind, False, size, latency)
+          instrument.round_trip(1, latency)
+
+      if operation == cls.Operations.HASH_SET and (
+            result in (0, 1)):  # pragma: no cover
+        # count 0 and 1 as success, as it indicates an overwrite,
+        # not a failure
+        return 1
+      return result
+    except Exception:  # pragma: no cover
+      raise
+
+  @classmethod
+  def commit(cls, pipeline):
+
+    """ Execute a pipeline of queued commands, in one round trip (which is
+        recorded to any :py:attr:`EngineConfig.instruments`).
+
+        :param pipeline: Pipeline to execute.
+
+        :returns: ``list`` of results, one for each queued command. """
+
+    instruments = cls.EngineConfig.instruments
+    if not instruments: return pipeline.execute()
+
+    commands, started = getattr(pipeline, '_queued_commands', 0), time.time()
+    pipeline._queued_commands = 0
+    try:
+      return pipeline.execute()
+    finally:
+      if commands:
+        latency = time.time() - started
+        for instrument in instruments:
+          instrument.round_trip(commands, latency)
+
+  @classmethod
+  def script(cls, name, kind, keys=(), args=(), shard=None):
+
+    """ Execute a named server-side Lua script. Scripts are loaded once via
+        ``SCRIPT LOAD`` and subsequently invoked by digest via ``EVALSHA``. If
+        ``Redis`` has since dropped its script cache, the script is loaded
+        again and the call is retried.
+
+        :param name: Name of the script to run, from
+          :py:attr:`RedisAdapter._scripts`.
+
+        :param kind: String :py:class:`model.Model` kind to acquire the channel
+          for.
+
+        :param keys: Iterable of ``Redis`` keys to pass to the script, as
+          ``KEYS``.
+
+        :param args: Iterable of additional arguments to pass to the script, as
+          ``ARGV``.
+
+        :param shard: Server profile to run the script on, if sharding.
+
+        :returns: Result of the script invocation. """
+
+    global _script_hashes
+
+    keys, args = tuple(keys), tuple(args)
+
+    if name not in _script_hashes:
+      _script_hashes[name] = cls.execute(*(
+        cls.Operations.SCRIPT_LOAD, kind, cls._scripts[name]), shard=shard)
+
+    try:
+      return cls.execute(*((
+        cls.Operations.EVALUATE_STORED,
+        kind,
+        _script_hashes[name],
+        len(keys)) + keys + args), shard=shard)
+
+    except _redis_client.exceptions.NoScriptError:  # pragma: no cover
+      del _script_hashes[name]  # not loaded on this server: load and retry
+      return cls.script(name, kind, keys, args, shard=shard)
+
+  @classmethod
+  def codec(cls, kind=None):
+
+    """ Resolve the compression codec to use for blobs, which may be set per
+        model (via ``__compression__``) or across the engine (via
+        :py:attr:`EngineConfig.compression`). A setting of ``True`` picks the
+        fastest available codec.
+
+        :param kind: Model class for which blobs are being written, if known.
+
+        :returns: Tupled ``(codec_id, module)``, or ``(0, None)`` if blobs
+          should be stored uncompressed. """
+
+    setting = getattr(kind, '__compression__', None) if kind else None
+    if setting is None: setting = cls.EngineConfig.compression
+    if not setting: return 0, None
+
+    if setting is True:
+      for name in reversed(_CODECS[1:]):
+        if getattr(_support, name):
+          return _CODECS.index(name), getattr(_support, name)
+      return 0, None  # pragma: no cover
+
+    name = setting if isinstance(setting, basestring) else (
+      setting.__name__.split('.')[0])
+
+    if name not in _CODECS or not getattr(_support, name):
+      raise RuntimeError('Compression codec "%s" is not available.' % name)
+    return _CODECS.index(name), getattr(_support, name)
+
+  @classmethod
+  def inflate(cls, result):
+
+    """ Small closure that can inflate (and potentially decompress) a resulting
+        object for a given storage mode. Framed blobs (see
+        :py:meth:`deflate`) are dispatched by their header, while unframed
+        blobs written by earlier versions are still read as before.
+
+        :param result: ``basestring`` result from raw Redis storage.
+
+        :raises ValueError: If the blob is framed with an unknown version.
+
+        :returns: Inflated entity, if applicable. """
+
+    if isinstance(result, dict):
+      # hash storage: each field holds an individually-serialized value
+      return dict(((field, cls.inflate(value)) for (
+        field, value) in result.iteritems()))
+
+    if not isinstance(result, basestring):  # pragma: no cover
+      return result  # accounts for other non-blob storage
+
+    if result[:1] == _FRAME_MAGIC and len(result) > 1:
+      header = ord(result[1])
+
+      if header >> 4 != _FRAME_VERSION:
+        raise ValueError('Unknown blob format version: %s.' % (header >> 4))
+
+      serializer, codec, payload = (
+        _SERIALIZERS[(header >> 2) & 0x3], _CODECS[header & 0x3], result[2:])
+
+      if codec:
+        payload = getattr(_support, codec).decompress(payload)
+      return (msgpack if serializer == 'msgpack' else json).loads(payload)
+
+    # unframed blob: optionally decompress
+    if cls.EngineConfig.compression:  # pragma: no cover
+      try:
+        result = cls.compressor.decompress(result)
+      except:
+        pass  # maybe entity is uncompressed? will fail during deserialization
+
+    # deserialize structures
+    return cls.serializer.loads(result)
+
+  @classmethod
+  def deflate(cls, value, kind=None):
+
+    """ Small closure that can serialize (and potentially compress) a value for
+        storage. Counterpart to :py:meth:`RedisAdapter.inflate`.
+
+        Blobs are framed with a magic byte and a header byte, recording the
+        format version, serializer and codec, so they can be read back without
+        guessing. Blobs smaller than the compression threshold (set per model
+        via ``__compression_threshold__``, or across the engine via
+        :py:attr:`EngineConfig.compression_threshold`) are left uncompressed,
+        as are blobs which don't shrink.
+
+        :param value: Native structure to serialize.
+
+        :param kind: Model class for which ``value`` is being written, if
+          known, to resolve its compression settings.
+
+        :returns: Serialized (and optionally compressed) ``basestring``,
+          suitable for storage in Redis. """
+
+    serializer = cls.serializer
+    serialized = serializer.dumps(value)
+    codec, compressor = cls.codec(kind)
+
+    threshold = getattr(kind, '__compression_threshold__', None) if (
+      kind) else None
+    if threshold is None: threshold = cls.EngineConfig.compression_threshold
+
+    if compressor and len(serialized) >= threshold:
+      compressed = compressor.compress(serialized)
+
+      if len(compressed) < len(serialized):
+        # we saved space, store it compressed
+        serialized = compressed
+      else:
+        codec = 0
+    else:
+      codec = 0
+
+    return _FRAME_MAGIC + chr((_FRAME_VERSION << 4) | (
+      _SERIALIZERS.index(serializer.__name__) << 2) | codec) + serialized
+
+  @classmethod
+  def get(cls, key, pipeline=None, _entity=None, projection=None):
+
+    """ Retrieve an entity by Key from Redis.
+
+        :param key: Target :py:class:`model.Key` to retrieve from storage.
+
+        :param pipeline: Redis pipeline to enqueue the resulting commands
+          in, rather than directly executing them. Defaults to ``None``. If a
+          pipeline is passed, it will be returned in lieu of the pending
+          result.
 
         :param _entity: Entity to inflate, if we already have one.
 
+        :param projection: Iterable of property names to retrieve, rather than
+          the full entity. Only honored in ``hashkey_hash`` mode, where it
+          results in an ``HMGET`` of just the requested fields, and in a model
+          instance that can't be put back (see :py:meth:`hydrate`).
+
         :returns: The deserialized and decompressed entity associated with the
           target ``key``. """
 
     from canteen import model
 
+    cache = None
     if key:
       encoded, flattened = key
 
+      # serve (copies of) cached entities, if caching is enabled
+      if pipeline is None and _entity is None and not projection:
+        cache = cls.entity_cache(flattened[1])
+        if cache is not None:
+          epoch, cached = cache.epoch, cache.get(encoded)
+          if cached is not None: return cached
+
       # @TODO(sgammon): access to structured keys in adapters
       joined, _ = model.Key.from_urlsafe(encoded).flatten(True)
 
+      shard = cls.shard(flattened)  # route to the entity's shard, if any
+
       ## toplevel_blob
       if cls.EngineConfig.mode == RedisMode.toplevel_blob:
 
@@ -573,43 +1812,73 @@ class RedisAdapter(DirectedGraphAdapter):
         result = _entity or (
           cls.execute(cls.Operations.GET, flattened[1],
                         encoded,
-                        target=pipeline))
+                        target=pipeline, shard=shard))
 
-      ## hashkind_blob
-      elif cls.EngineConfig.mode == RedisMode.hashkind_blob:
+      ## hashkind_blob, hashkey_blob
+      elif cls.EngineConfig.mode in (RedisMode.hashkind_blob,
+                                     RedisMode.hashkey_blob):
 
-        # generate kinded key and trim tail
-        j_kinded, f_kinded = model.Key(flattened[1]).flatten(True)
-        tail = joined.replace(j_kinded, '')
+        if cls.EngineConfig.mode == RedisMode.hashkind_blob:
 
-        result = _entity or (
-          cls.execute(*(
-            cls.Operations.HASH_GET,
-            flattened[1],
-            cls.encode_key(j_kinded, f_kinded),
-            cls.encode_key(tail, flattened)), target=pipeline))
+          # generate kinded key and trim tail
+          j_kinded, f_kinded = model.Key(flattened[1]).flatten(True)
+          tail = joined.replace(j_kinded, '')
+          read = (cls.encode_key(j_kinded, f_kinded),
+                  cls.encode_key(tail, flattened))
 
-      ## hashkey_blob
-      elif cls.EngineConfig.mode == RedisMode.hashkey_blob:
+        else:
 
-        # build key and extract group
-        desired_key = model.Key.from_raw(joined)
-        root = (ancestor for ancestor in desired_key.ancestry).next()
-        tail = (
-          desired_key.flatten(True)[0].replace(root.flatten(True)[0], '') or (
-            '__root__'))
+          # build key and extract group
+          desired_key = model.Key.from_raw(joined)
+          root = (ancestor for ancestor in desired_key.ancestry).next()
+          tail = (
+            desired_key.flatten(True)[0].replace(
+              root.flatten(True)[0], '') or '__root__')
+          read = (cls.encode_key(*root.flatten(True)),
+                  cls.encode_key(tail, flattened))
 
-        result = _entity or (
-          cls.execute(*(
-            cls.Operations.HASH_GET,
-            flattened[1],
-            cls.encode_key(*root.flatten(True)),
-            cls.encode_key(tail, flattened)), target=pipeline))
+        if _entity or pipeline is not None:
+          result = _entity or (
+            cls.execute(*((
+              cls.Operations.HASH_GET, flattened[1]) + read), target=pipeline,
+              shard=shard))
+
+        else:
+          # shared hashes can't expire natively: check expiry alongside
+          with cls.channel(flattened[1], shard).pipeline(
+                transaction=False) as pipe:
+            cls.execute(*((
+              cls.Operations.HASH_GET, flattened[1]) + read), target=pipe)
+            cls.execute(*(
+              cls.Operations.SORTED_SCORE,
+              flattened[1],
+              cls._expiry_index(flattened[1]),
+              encoded), target=pipe)
+            result, expiry = cls.commit(pipe)
+          if cls.expired(expiry): result = None
 
       ## hashkey_hash
-      elif cls.EngineConfig.mode == RedisMode.hashkey_hash:  # pragma: no cover
+      elif cls.EngineConfig.mode == RedisMode.hashkey_hash:
+
+        if projection:
+          # fetch only requested fields
+          projection = tuple(projection)
+          result = _entity or (
+            cls.execute(*((
+              cls.Operations.HASH_MULTI_GET,
+              flattened[1],
+              encoded) + projection), target=pipeline, shard=shard))
 
-        raise NotImplementedError('Redis mode not implemented: "hashkey_hash".')
+          if isinstance(result, list):
+            result = dict(((field, value) for field, value in (
+              zip(projection, result)) if value is not None))
+
+        else:
+          result = _entity or (
+            cls.execute(*(
+              cls.Operations.HASH_GET_ALL,
+              flattened[1],
+              encoded), target=pipeline, shard=shard))
 
       else:  # pragma: no cover
         raise NotImplementedError("Unknown storage mode: '%s'." % (
@@ -618,10 +1887,20 @@ class RedisAdapter(DirectedGraphAdapter):
     else:  # pragma: no cover
       result = _entity
 
-    # @TODO: different storage internal modes
-    if isinstance(result, basestring):
-      return cls.inflate(result)
-    return result
+    if not isinstance(result, (basestring, dict)):
+      return result
+
+    entity = cls.inflate(result)
+    if isinstance(result, dict):
+      entity = entity or None  # empty hashes are missing entities
+
+    if entity is not None and cache is not None:
+      cache.set(encoded, entity, cls.blob_size(result), epoch)
+
+    if entity is not None and projection and (
+          cls.EngineConfig.mode == RedisMode.hashkey_hash):
+      return cls.hydrate(key, entity, projection=projection)
+    return entity
 
   @classmethod
   def get_multi(cls, keys, pipeline=None, **kwargs):
@@ -634,27 +1913,81 @@ class RedisAdapter(DirectedGraphAdapter):
         :param pipeline: Pipeline to execute commands against, if any.
 
         :param kwargs: Implementation-specific kwargs passed through from the
-          original caller.
+          original caller. Accepts ``projection``, an iterable of property names
+          to fetch in lieu of full entities (``hashkey_hash`` mode only), and
+          ``_keys``, a ``dict`` of the caller's :py:class:`model.Key` objects by
+          encoded key, which are attached to results instead of being decoded.
 
         :returns: The deserialized and decompressed entity associated with the
           target ``key``. """
 
     from canteen import model
 
+    # epoch to fill the entity cache at, passed from an outer call
+    fill, known = kwargs.pop('_cache', None), kwargs.pop('_keys', None)
+
+    if keys and pipeline is None and fill is None and (
+          not kwargs.get('projection')):
+      keys = list(keys)
+      caches = [cls.entity_cache(flattened[1]) for encoded, flattened in keys]
+
+      if any((cache is not None for cache in caches)):
+
+        # serve cached entities, and fetch the rest (filling the cache)
+        epoch, hits = _entity_cache.epoch, {}
+        for index, (key, cache) in enumerate(zip(keys, caches)):
+          entity = cache.get(key[0]) if cache is not None else None
+          if entity is not None: hits[index] = cls.hydrate(key, entity, known)
+
+        missing = [key for index, key in enumerate(keys) if (
+          index not in hits)]
+        fetched = iter(cls.get_multi(*(
+          missing,), _cache=epoch, _keys=known, **kwargs) if missing else ())
+
+        return [hits[index] if index in hits else fetched.next() for (
+          index) in xrange(len(keys))]
+
+    if keys and pipeline is None and cls.EngineConfig.shards:
+
+      # fan out one pipeline per shard, in parallel, then reassemble in order
+      keys, batches = list(keys), collections.OrderedDict()
+      for index, key in enumerate(keys):
+        batches.setdefault(cls.shard(key[1]), []).append(index)
+
+      calls = []
+      for shard, batch in batches.iteritems():
+        calls.append(functools.partial(
+          cls.get_multi,
+          [keys[i] for i in batch],
+          pipeline=cls.channel('__meta__', shard).pipeline(transaction=False),
+          _cache=fill,
+          _keys=known,
+          **kwargs))
+
+      results = [None] * len(keys)
+      for batch, entities in zip(batches.itervalues(), cls.fan_out(calls)):
+        for index, entity in zip(batch, entities):
+          results[index] = entity
+      return results
+
     if keys:
+      projection = tuple(kwargs.get('projection') or ())
       requested_keys = keys
       results, calls, bundles, handler = {}, [], [], {
           RedisMode.toplevel_blob: cls.Operations.MULTI_GET,
           RedisMode.hashkind_blob: cls.Operations.HASH_MULTI_GET,
           RedisMode.hashkey_blob: cls.Operations.HASH_MULTI_GET,
-          RedisMode.hashkey_hash: cls.Operations.HASH_GET_ALL
+          RedisMode.hashkey_hash: (
+            cls.Operations.HASH_MULTI_GET if projection else (
+              cls.Operations.HASH_GET_ALL))
         }.get(cls.EngineConfig.mode)
 
       # # plan reads
       for _k in keys:
         encoded, flattened = _k
 
-        if cls.EngineConfig.mode == RedisMode.toplevel_blob:
+        if cls.EngineConfig.mode in (RedisMode.toplevel_blob,
+                                     RedisMode.hashkey_hash):
           bundles.append((flattened[1], encoded, _k))
 
         elif cls.EngineConfig.mode == RedisMode.hashkind_blob:
@@ -689,10 +2022,6 @@ class RedisAdapter(DirectedGraphAdapter):
 
           bundles.append((flattened[1], encoded_root, encoded_tail, _k))
 
-        elif cls.EngineConfig.mode == RedisMode.hashkey_hash:
-          raise NotImplementedError('Redis mode not implemented:'
-                                    ' "hashkey_hash.')  # pragma: no cover
-
       ## merge reads
       kinds, keys, expected, requested = (
         set(), collections.OrderedDict(), [], collections.OrderedDict())
@@ -717,8 +2046,14 @@ class RedisAdapter(DirectedGraphAdapter):
           keys[root].append(tail)
           requested[root].append(_k)
 
+        elif cls.EngineConfig.mode == RedisMode.hashkey_hash:
+          # one hash per entity, so one read per key
+          kind, encoded, _k = read
+          keys[encoded], requested[encoded] = kind, [_k]
+
       # @TODO(sgammon): reads segmented in toplevel by kind, because of routing?
-      pipeline = pipeline or cls.channel('__meta__').pipeline(transaction=False)
+      if pipeline is None:
+        pipeline = cls.channel('__meta__').pipeline(transaction=False)
       with pipeline as pipe:
 
         ## collapse reads
@@ -747,15 +2082,51 @@ class RedisAdapter(DirectedGraphAdapter):
               _target_handler = handler
             cls.execute(_target_handler, '__meta__', root, *tails, target=pipe)
 
-        resultset = pipe.execute()  # execute pipeline and inflate
+        elif cls.EngineConfig.mode == RedisMode.hashkey_hash:
+          for encoded, kind in keys.iteritems():
+
+            expected.append(requested[encoded])
+            cls.execute(handler, kind, encoded, *projection, target=pipe)
+
+        # shared hashes can't expire natively: check expiry alongside
+        checked = cls.EngineConfig.mode in (RedisMode.hashkind_blob,
+                                            RedisMode.hashkey_blob)
+        if checked:
+          for encoded, flattened in requested_keys:
+            cls.execute(*(
+              cls.Operations.SORTED_SCORE,
+              flattened[1],
+              cls._expiry_index(flattened[1]),
+              encoded), target=pipe)
+
+        resultset = cls.commit(pipe)  # execute pipeline and inflate
+
+        expired = set()
+        if checked:
+          resultset, expiries = (
+            resultset[:len(expected)], resultset[len(expected):])
+          expired.update((key for key, expiry in zip(*(
+            requested_keys, expiries)) if cls.expired(expiry)))
 
         for keygroup, item in zip(expected, resultset):
+          if projection and cls.EngineConfig.mode == RedisMode.hashkey_hash:
+            # zip `HMGET` values with requested fields
+            item = dict(((field, value) for field, value in (
+              zip(projection, item)) if value is not None))
+
           if not isinstance(item, (tuple, list)):
             item = (item,)
 
           for key, entity in zip(keygroup, item):
-            results[key] = (
-              cls.inflate(entity) if isinstance(entity, basestring) else entity)
+            if key in expired: entity = None
+            if not isinstance(entity, (basestring, dict)):
+              results[key] = entity
+              continue
+
+            results[key] = cls.inflate(entity)
+            cache = cls.entity_cache(key[1][1]) if fill is not None else None
+            if results[key] and cache is not None:
+              cache.set(key[0], results[key], cls.blob_size(entity), fill)
 
         inflated_results = []
         for key in requested_keys:
@@ -764,13 +2135,9 @@ class RedisAdapter(DirectedGraphAdapter):
           if not entity:
             inflated_results.append(None)
           else:
-            encoded, flattened = key
-            entity['key'] = (
-              cls.registry[flattened[1]].__keyclass__.from_raw(
-                base64.b64decode(encoded)))
-
-            inflated_results.append(
-              cls.registry[flattened[1]](_persisted=True, **entity))
+            inflated_results.append(cls.hydrate(key, entity, known, (
+              projection if cls.EngineConfig.mode == (
+                RedisMode.hashkey_hash) else None)))
 
       return inflated_results
 
@@ -783,39 +2150,223 @@ class RedisAdapter(DirectedGraphAdapter):
 
         :returns: Resulting :py:class:`model.Key` from write operation. """
 
-    _indexed_properties = self._pluck_indexed(entity)
+    return self._put_multi((entity,), **kwargs)[0]
+
+  def _put_multi(self, entities, **kwargs):
+
+    """ Overrides low-level ``put_multi`` process to persist a batch of
+        entities, and all of their indexes, in one transactional pipeline.
+        Entities without an ID are provisioned one with a single
+        ``HINCRBY`` per kind, sent together in one round trip. Overwrites
+        read their reverse indexes under ``WATCH``, and are retried if those
+        change before the transaction is applied.
+
+        :param entities: Iterable of entity :py:class:`model.Model` objects to
+          persist.
+
+        Entities of kinds with deferred index writes (see
+        :py:meth:`write_behind`) are written without their indexes: their keys
+        are queued in the same transaction instead, for
+        :py:meth:`flush_indexes`.
+
+        :param kwargs: Accepts ``pipeline``, an existing pipeline to enqueue
+          writes in (which is then executed), ``fields``, a set of dirty
+          property names to write (``hashkey_hash`` mode, single entity only),
+          and ``ttl``, seconds for the entities to live (see :py:meth:`put`).
+
+        :raises ValueError: If any entity was fetched with a projection, as
+          its indexes would be rewritten from just the fetched properties.
+
+        :returns: ``list`` of resulting :py:class:`model.Key` objects, in the
+          same order as ``entities``. """
+
+    entities = list(entities)
+    if not entities: return []
+
+    # entities fetched with a projection would be re-indexed from partial state
+    for entity in entities:
+      if getattr(entity, '__projection__', None):
+        raise ValueError('Cannot put entity "%s", which was fetched with a'
+                         ' projection of its properties.' % entity.key)
+
+    # entities given IDs by an outer (sharding) call, and its target shard
+    fresh, shard = kwargs.pop('_fresh', frozenset()), kwargs.pop('_shard', None)
+
+    # with no pipeline passed, entity groups are split across shards (if any)
+    owned = 'pipeline' not in kwargs
+    sharded = bool(self.EngineConfig.shards) and owned and shard is None
+    if not sharded and shard is None: shard = self.shard(entities[0].key)
 
     # reuse pipeline passed, if any
-    if 'pipeline' in kwargs:
+    if not owned:
       pipeline = kwargs['pipeline']
       del kwargs['pipeline']
     else:
       pipeline = (
-        self.channel(entity.kind()).pipeline(transaction=True))
+        self.channel(entities[0].kind(), shard).pipeline(transaction=True))
+
+    # provision IDs early for entities that have none, one call per kind
+    # (unless leased locally), and note those that may be overwrites, which
+    # need their reverse indexes
+    unkeyed, keyed = collections.OrderedDict(), []
+    for entity in entities:
+      if not entity.key.id:
+        unkeyed.setdefault((entity.__keyclass__, entity.kind()), []).append(
+          entity)
+      elif not (sharded or id(entity) in fresh or (
+            self.write_behind(entity.kind()))):
+        keyed.append(entity)
+
+    tops, remote = {}, []
+    for (key_class, kind), pending in unkeyed.iteritems():
+      lease = self.id_lease(kind)
+      if lease is None:
+        remote.append((key_class, kind))
+      else:
+        tops[(key_class, kind)] = lease.allocate(len(pending), (
+          functools.partial(self.increment_ids, key_class, kind)))
+
+    # each kind's counter lives on that kind's own channel, whatever the shard,
+    # so that every path provisions IDs from the same counter
+    channels = collections.OrderedDict()
+    for key_class, kind in remote:
+      channels.setdefault(self.channel(kind), []).append((key_class, kind))
+
+    for channel, groups in channels.iteritems():
+      with channel.pipeline(transaction=False) as pipe:
+        for key_class, kind in groups:
+          self.allocate_ids(*(
+            key_class, kind, len(unkeyed[(key_class, kind)])), pipeline=pipe)
+        tops.update(zip(groups, self.commit(pipe)))
+
+    for group, pending in unkeyed.iteritems():
+      top = tops[group]
+      for _id, entity in zip(xrange(top - len(pending) + 1, top + 1), pending):
+        entity.key.id = _id
+
+    if sharded:
+
+      # now that every entity has a key, write each shard's batch in parallel
+      # (entities that were just given IDs can't have any indexes to clean)
+      batches, fresh = collections.OrderedDict(), frozenset((
+        id(entity) for pending in unkeyed.itervalues() for entity in pending))
+      for index, entity in enumerate(entities):
+        batches.setdefault(self.shard(entity.key), []).append(index)
+
+      calls = []
+      for target, batch in batches.iteritems():
+        calls.append(functools.partial(
+          self._put_multi,
+          [entities[i] for i in batch],
+          _shard=target,
+          _fresh=fresh,
+          **kwargs))
+
+      written_keys = [None] * len(entities)
+      for batch, keys in zip(batches.itervalues(), self.fan_out(calls)):
+        for index, key in zip(batch, keys):
+          written_keys[index] = key
+      return written_keys
+
+    # in hash mode, persisted entities need only write dirty properties
+    fields, _fields = kwargs.pop('fields', None), []
+    ttl = kwargs.pop('ttl', None)
+    for entity in entities:
+      if fields is None and entity.__persisted__ and (
+            self.EngineConfig.mode == RedisMode.hashkey_hash):
+        _fields.append(frozenset((
+          name for name, value in entity.__data__.iteritems() if value.dirty)))
+      else:
+        _fields.append(fields)
+
+    reverse_keys = [self._reverse_key(self.encode_key(*(
+      entity.key.flatten(True)))) for entity in keyed]
 
-    # provision ID early if there is none
-    if not entity.key.id:
-      entity.key.id = self.allocate_ids(entity.__keyclass__, entity.kind())
+    while True:
+      reverse = {}
+      if keyed:
+        # reverse indexes are watched before they're read (unless the caller
+        # passed a pipeline, which may already hold commands), so that the
+        # write is retried if they change before it's applied
+        if owned: pipeline.watch(*reverse_keys)
 
-    with pipeline as pipe:
+        with self.channel(entities[0].kind(), shard).pipeline(
+              transaction=False) as fetch:
+          for reverse_key in reverse_keys:
+            self.execute(*(
+              self.Operations.SET_MEMBERS, None, reverse_key), target=fetch)
+          reverse = dict(zip(map(id, keyed), self.commit(fetch)))
 
-      # delegate write up the chain
-      written_key = super(IndexedModelAdapter, self)._put(entity,
-                                                        pipeline=pipe, **kwargs)
+        if owned: pipeline.multi()
 
-      # proxy to `generate_indexes` and write indexes
-      origin, meta, property_map, graph = (
-        self.generate_indexes(entity.key, entity, _indexed_properties))
+      try:
+        written_keys, deferred = [], []
+        with pipeline as pipe:
+
+          for entity, entity_fields in zip(entities, _fields):
+            if self.write_behind(entity.kind()):
+              written_keys.append(super(IndexedModelAdapter, self)._put(
+                entity, pipeline=pipe, fields=entity_fields, ttl=ttl, **(
+                  kwargs)))
+              deferred.append(self.encode_key(*entity.key.flatten(True)))
+              continue
+
+            _indexed_properties = self._pluck_indexed(entity)
+
+            # proxy to `generate_indexes`, clean stale indexes on overwrite
+            origin, meta, property_map, graph = (
+              self.generate_indexes(entity.key, entity, _indexed_properties))
+
+            if id(entity) in reverse:
+              self.clean_indexes((origin, meta, graph),
+                                 pipeline=pipe,
+                                 reverse=reverse[id(entity)])
+
+            # delegate write up the chain
+            written_keys.append(super(IndexedModelAdapter, self)._put(
+              entity, pipeline=pipe, fields=entity_fields, ttl=ttl, **kwargs))
+
+            self.write_indexes((origin, meta, property_map), graph,
+                                pipeline=pipe, **kwargs)
+
+          if deferred:
+            self.execute(*((
+              self.Operations.RIGHT_PUSH, None, self._pending_prefix) + tuple(
+                deferred)), target=pipe)
+
+          # collapse pipelines
+          self.commit(pipe)
+        break
+
+      except _redis_client.WatchError:  # pragma: no cover
+        continue  # reverse indexes changed meanwhile: read them again
+
+    if deferred: self.indexer()
+    return written_keys  # delegate up the chain for entity writes
+
+  def _delete(self, key, **kwargs):
+
+    """ Overrides low-level ``delete`` process to clean a key's indexes in the
+        same transactional pipeline as the delete itself.
+
+        :param key: Target :py:class:`model.Key` to delete.
+
+        :returns: Result of the low-level delete operation. """
+
+    joined, flat = key.flatten(True)
+    encoded = self.encode_key(joined, flat) or key.urlsafe(joined)
 
-      self.write_indexes((origin, meta, property_map), graph,
-                          pipeline=pipe, **kwargs)
+    shard = self.shard(flat)
 
-      # collapse pipelines
-      pipe.execute()
-      return written_key  # delegate up the chain for entity write
+    with self.channel(key.kind, shard).pipeline(transaction=True) as pipe:
+      self.clean_indexes(self.generate_indexes(key),
+                         pipeline=pipe,
+                         shard=shard)
+      self.delete((encoded, flat), pipeline=pipe, **kwargs)
+      return self.commit(pipe)[-1]
 
   @classmethod
-  def put(cls, key, entity, model, pipeline=None):
+  def put(cls, key, entity, model, pipeline=None, fields=None, ttl=None):
 
     """ Persist an entity to storage in Redis.
 
@@ -833,6 +2384,15 @@ class RedisAdapter(DirectedGraphAdapter):
         :param pipeline: Existing pipeline of queued commands to append to, if
           applicable.
 
+        :param fields: Names of properties that have changed since ``entity``
+          was last persisted, if known. In ``hashkey_hash`` mode, only these
+          fields are written. Defaults to ``None``, which writes the full
+          entity.
+
+        :param ttl: Seconds the entity should live for, after which it is
+          expired (see :py:meth:`expire`). Defaults to ``None``, which falls
+          back to the model's ``__ttl__``, if any.
+
         :returns: Result of the lower-level write operation. """
 
     from canteen import model as _model
@@ -843,6 +2403,20 @@ class RedisAdapter(DirectedGraphAdapter):
                      convert_keys=True,
                      convert_models=True))
     joined, flattened = key
+    shard = cls.shard(flattened)  # route to the entity's shard, if any
+    if ttl is None: ttl = getattr(model, '__ttl__', None)
+
+    # writes are applied along with their expiry, as one transaction
+    if pipeline is None:
+      pipe = cls.channel(flattened[1], shard).pipeline(transaction=True)
+      written = cls.put(*(
+        key, entity, model), pipeline=pipe, fields=fields, ttl=ttl)
+      cls.commit(pipe)
+      return written
+
+    # with caching, invalidations are published as part of each write
+    if cls.entity_cache(flattened[1]) is not None:
+      cls.invalidate(flattened[1], joined, target=pipeline, shard=shard)
 
     # clean key types
     _cleaned = {}
@@ -853,14 +2427,38 @@ class RedisAdapter(DirectedGraphAdapter):
       else:
         _cleaned[k] = v
 
-    # serialize + optionally compress
-    serialized = cls.serializer.dumps(_cleaned)
-    if cls.EngineConfig.compression:  # pragma: no cover
-      compressed = cls.compressor.compress(serialized)
+    ## hashkey_hash
+    if cls.EngineConfig.mode == RedisMode.hashkey_hash:
 
-      if len(compressed) < len(serialized):
-        # we saved space, store it compressed and it should uncompress on `get`
-        serialized = compressed
+      # serialize + optionally compress each field individually
+      if fields is not None:
+        _cleaned = dict(((k, v) for k, v in _cleaned.iteritems() if (
+          k in fields)))
+
+      if fields is None or _cleaned:
+        writes = dict(((k, cls.deflate(v, model)) for k, v in (
+          _cleaned.iteritems())))
+
+        _pipeline = pipeline if pipeline is not None else (
+          cls.channel(flattened[1], shard).pipeline(transaction=True))
+
+        if fields is None:
+          # full write: clear any stale fields first
+          cls.execute(cls.Operations.DELETE, flattened[1], joined,
+                      target=_pipeline)
+
+        if writes:
+          cls.execute(cls.Operations.HASH_MULTI_SET, flattened[1], joined,
+                      writes, target=_pipeline)
+
+        if pipeline is None: cls.commit(_pipeline)
+
+      cls.expire(flattened[1], joined, ttl, target=pipeline, shard=shard)
+      entity._set_persisted(True)
+      return entity.key
+
+    # serialize + optionally compress
+    serialized = cls.deflate(_cleaned, model)
 
     # toplevel_blob
     if cls.EngineConfig.mode == RedisMode.toplevel_blob:
@@ -870,7 +2468,8 @@ class RedisAdapter(DirectedGraphAdapter):
           cls.Operations.SET,
           flattened[1],
           joined,
-          serialized), target=pipeline):
+          serialized), target=pipeline, shard=shard):
+        cls.expire(flattened[1], joined, ttl, target=pipeline, shard=shard)
         entity._set_persisted(True)
         return entity.key
       else:  # pragma: no cover
@@ -892,7 +2491,8 @@ class RedisAdapter(DirectedGraphAdapter):
         flattened[1],
         cls.encode_key(*kinded),
         cls.encode_key(tail, flattened),
-        serialized), target=pipeline):
+        serialized), target=pipeline, shard=shard):
+        cls.expire(flattened[1], joined, ttl, target=pipeline, shard=shard)
         entity._set_persisted(True)
         return entity.key
       else:  # pragma: no cover
@@ -911,23 +2511,17 @@ class RedisAdapter(DirectedGraphAdapter):
         flattened[1],
         cls.encode_key(*root),
         cls.encode_key(tail, flattened),
-        serialized), target=pipeline):
+        serialized), target=pipeline, shard=shard):
+        cls.expire(flattened[1], joined, ttl, target=pipeline, shard=shard)
         entity._set_persisted(True)
         return entity.key
       else:  # pragma: no cover
         raise RuntimeError('Failed to write entity "%s" to key "%s".' % (
           str(entity), str(key) or '<none>'))
 
-    ## hashkey_hash
-    elif cls.EngineConfig.mode == RedisMode.hashkey_hash:  # pragma: no cover
-
-      raise NotImplementedError('Redis mode not implemented: "hashkey_hash".')
-
     raise NotImplementedError("Unknown storage mode: '%s'." % (
                               cls.EngineConfig.mode))  # pragma: no cover
 
-    # @TODO: different storage internal modes
-
   # @TODO(sgammon): testing for ability to delete entities
 
   @classmethod
@@ -951,14 +2545,24 @@ class RedisAdapter(DirectedGraphAdapter):
       joined = encoded
       encoded = cls.encode_key((joined, flattened))
 
+    shard = cls.shard(flattened)  # route to the entity's shard, if any
 
-    if cls.EngineConfig.mode == RedisMode.toplevel_blob:
+    # with caching, invalidations are published as part of each delete
+    if cls.entity_cache(flattened[1]) is not None:
+      if pipeline is None:
+        pipe = cls.channel(flattened[1], shard).pipeline(transaction=True)
+        cls.delete(key, pipeline=pipe)
+        return cls.commit(pipe)[-1]
+      cls.invalidate(flattened[1], encoded, target=pipeline, shard=shard)
+
+    if cls.EngineConfig.mode in (RedisMode.toplevel_blob,
+                                 RedisMode.hashkey_hash):
 
       # delegate to redis client with encoded key
       return cls.execute(*(
         cls.Operations.DELETE,
         flattened[1],
-        cls.encode_key(joined, flattened)), target=pipeline)
+        cls.encode_key(joined, flattened)), target=pipeline, shard=shard)
 
     elif cls.EngineConfig.mode == RedisMode.hashkind_blob:
 
@@ -971,7 +2575,7 @@ class RedisAdapter(DirectedGraphAdapter):
         cls.Operations.HASH_DELETE,
         flattened[1],
         cls.encode_key(*kinded),
-        cls.encode_key(tail, flattened)), target=pipeline)
+        cls.encode_key(tail, flattened)), target=pipeline, shard=shard)
 
     elif cls.EngineConfig.mode == RedisMode.hashkey_blob:
 
@@ -986,15 +2590,405 @@ class RedisAdapter(DirectedGraphAdapter):
         cls.Operations.HASH_DELETE,
           flattened[1],
           cls.encode_key(*root.flatten(True)),
-          cls.encode_key(tail, flattened)), target=pipeline)
-
-    elif cls.EngineConfig.mode == RedisMode.hashkey_hash:  # pragma: no cover
-
-      raise NotImplementedError('Redis mode not implemented: "hashkey_hash".')
+          cls.encode_key(tail, flattened)), target=pipeline, shard=shard)
 
     raise NotImplementedError("Unknown storage mode: '%s'." % (
                               cls.EngineConfig.mode))  # pragma: no cover
 
+  @classmethod
+  def _expiry_index(cls, kind):
+
+    """ Name the expiry index for a kind (see :py:meth:`expire`).
+
+        :param kind: String :py:class:`model.Model` kind name.
+
+        :returns: Name of the kind's expiry index. """
+
+    return cls._magic_separator.join((cls._expiry_prefix, kind))
+
+  @staticmethod
+  def expired(expiry, now=None):
+
+    """ Check an expiry read from an expiry index (see :py:meth:`expire`).
+
+        :param expiry: Score read for an entity, in milliseconds since the
+          epoch, or ``None`` if it isn't expiring.
+
+        :param now: Timestamp to check expiry as of. Defaults to ``None``,
+          which uses the current time.
+
+        :returns: ``True`` if the entity has expired, ``False`` otherwise. """
+
+    if expiry is None: return False
+    return float(expiry) <= (time.time() if now is None else now) * 1000
+
+  @classmethod
+  def expire(cls, kind, encoded, ttl, target=None, shard=None):
+
+    """ Set (or clear) the expiry of an entity, after it's written. Entities
+        stored under their own key (in ``toplevel_blob`` and ``hashkey_hash``
+        modes) are expired by Redis natively. Every expiring entity is also
+        tracked in its kind's expiry index, a sorted set of encoded keys by
+        expiry time, so that :py:meth:`sweep` can clean up its index entries
+        (and, in the shared-hash modes, the entity itself).
+
+        In the shared-hash modes (``hashkind_blob`` and ``hashkey_blob``),
+        reads check the expiry index in the same round trip, so expired
+        entities are hidden as soon as they expire, and deleted by the
+        background sweeper (see :py:meth:`sweeper`).
+
+        :param kind: String :py:class:`model.Model` kind name.
+
+        :param encoded: Encoded key of the entity.
+
+        :param ttl: Seconds the entity should live for, or ``None`` for it to
+          live indefinitely.
+
+        :param target: Pipeline to enqueue the expiry in, if any.
+
+        :param shard: Server profile the entity lives on, if sharding.
+
+        :returns: ``None``. """
+
+    index = cls._expiry_index(kind)
+    native = cls.EngineConfig.mode in (RedisMode.toplevel_blob,
+                                       RedisMode.hashkey_hash)
+
+    if not ttl:
+      cls.execute(*(
+        cls.Operations.SORTED_REMOVE,
+        kind,
+        index,
+        encoded), target=target, shard=shard)
+
+      # partial hash writes would otherwise keep an earlier expiry
+      if cls.EngineConfig.mode == RedisMode.hashkey_hash:
+        cls.execute(*(
+          cls.Operations.PERSIST, kind, encoded), target=target, shard=shard)
+      return
+
+    if native:
+      cls.execute(*(
+        cls.Operations.PEXPIRE,
+        kind,
+        encoded,
+        int(ttl * 1000)), target=target, shard=shard)
+
+    cls.execute(*(
+      cls.Operations.SORTED_ADD,
+      kind,
+      index,
+      int((time.time() + ttl) * 1000),
+      encoded), target=target, shard=shard)
+    cls.sweeper()
+
+  @classmethod
+  def sweep(cls, kind=None, now=None):
+
+    """ Delete entities that have expired, along with their index entries,
+        as tracked by each kind's expiry index (see :py:meth:`expire`). Each
+        kind is swept in a transaction that is abandoned if its expiry index
+        changes meanwhile (say, because an expired entity was written again),
+        to be picked up by the next sweep.
+
+        :param kind: String :py:class:`model.Model` kind name to sweep.
+          Defaults to ``None``, which sweeps every known kind.
+
+        :param now: Timestamp to sweep expired entities as of. Defaults to
+          ``None``, which uses the current time.
+
+        :returns: Count of entities swept. """
+
+    from canteen import model
+
+    deadline = int((time.time() if now is None else now) * 1000)
+    kinds = [kind] if kind else sorted(cls.registry)
+    indexes = [cls._expiry_index(k) for k in kinds]
+
+    swept = 0
+    for shard in (cls.EngineConfig.shards or (None,)):
+
+      # find kinds with expired entities, in one round trip per channel (as
+      # expiry indexes live alongside their kind's entities)
+      channels, counts = collections.OrderedDict(), {}
+      for _kind, index in zip(kinds, indexes):
+        channel = cls.channel(_kind, shard)
+        channels.setdefault(id(channel), (channel, []))[1].append(
+          (_kind, index))
+
+      for channel, pending in channels.itervalues():
+        with channel.pipeline(transaction=False) as pipe:
+          for _kind, index in pending:
+            cls.execute(*(
+              cls.Operations.SORTED_COUNT,
+              _kind,
+              index,
+              '-inf',
+              deadline), target=pipe)
+          counts.update(zip(pending, cls.commit(pipe)))
+
+      for _kind, index in zip(kinds, indexes):
+        if not counts[(_kind, index)]: continue
+
+        with cls.channel(_kind, shard).pipeline(transaction=True) as pipe:
+          try:
+            pipe.watch(index)
+            expired = pipe.zrangebyscore(index, '-inf', deadline)
+            keys = [model.Key.from_urlsafe(encoded) for encoded in expired]
+
+            with cls.channel(_kind, shard).pipeline(
+                  transaction=False) as fetch:
+              for encoded in expired:
+                cls.execute(*(
+                  cls.Operations.SET_MEMBERS,
+                  None,
+                  cls._reverse_key(encoded)), target=fetch)
+              reverse = cls.commit(fetch)
+
+            pipe.multi()
+            for encoded, key, members in zip(expired, keys, reverse):
+              cls.clean_indexes(cls.generate_indexes(key),
+                                pipeline=pipe,
+                                reverse=members,
+                                shard=shard)
+              cls.delete((encoded, key.flatten(True)[1]), pipeline=pipe)
+
+            cls.execute(*((
+              cls.Operations.SORTED_REMOVE, _kind, index) + tuple(expired)),
+              target=pipe)
+            cls.commit(pipe)
+
+          except _redis_client.WatchError:  # pragma: no cover
+            continue
+          swept += len(expired)
+    return swept
+
+  @classmethod
+  def sweeper(cls):
+
+    """ Start sweeping expired entities in the background, every
+        :py:attr:`EngineConfig.sweep_interval` seconds, if that is set and a
+        sweeper isn't running already. Called as soon as an expiring entity
+        is written, so processes that never use TTLs never start a sweeper.
+
+        :returns: ``None``. """
+
+    global _sweeping
+
+    if not cls.EngineConfig.sweep_interval or _sweeping: return
+    with _sweep_lock:
+      if _sweeping: return
+      _sweeping = True
+
+    def _sweep():
+
+      """ Sweep expired entities, forever. """
+
+      while True:
+        time.sleep(cls.EngineConfig.sweep_interval)
+        try:
+          cls.sweep()
+        except Exception:  # pragma: no cover
+          pass  # retried at the next interval
+
+    if _support.gevent:  # pragma: no cover
+      gevent.spawn(_sweep)
+    else:
+      sweeper = threading.Thread(target=_sweep, name='redis-sweeper')
+      sweeper.daemon = True
+      sweeper.start()
+
+  @classmethod
+  def flush_indexes(cls, _background=False):
+
+    """ Apply index writes deferred by :py:meth:`_put_multi` (see
+        :py:meth:`write_behind`). Keys are queued on the channel each entity
+        was written to (which may be a model's own server profile), so every
+        distinct channel is drained, shard by shard, in batches of
+        :py:attr:`EngineConfig.write_behind_batch`. Queued keys are indexed
+        as of each entity's current state (so that repeated writes to a key
+        are indexed once). Entities that no longer exist have their indexes
+        cleaned instead.
+
+        Each batch is moved from the queue onto a list claimed by this
+        process, which is only dropped in the same transaction as the batch's
+        index writes. If applying a batch fails, it is queued again (and the
+        failure raised), so deferred index writes are never lost.
+
+        Writes queued (by this process) before a call to this method are
+        always applied by the time it returns, so it may be used to read
+        your own writes.
+
+        :param _background: Whether this is a flush by the background indexer
+          (see :py:meth:`indexer`), which stops between batches once it has
+          been disabled.
+
+        :returns: Count of queued keys that were applied. """
+
+    flushed = 0
+    claimed = cls._magic_separator.join((cls._pending_prefix, _flush_worker))
+
+    with _flush_lock:
+      for shard in (cls.EngineConfig.shards or (None,)):
+        channels = collections.OrderedDict()
+        for kind in [cls._meta_prefix] + sorted(cls.registry):
+          channel = cls.channel(kind, shard)
+          channels.setdefault(id(channel), channel)
+
+        for channel in channels.itervalues():
+          while not (_background and not (
+                cls.EngineConfig.write_behind_interval)):
+            # size the queue, and pick up any batch left claimed
+            with channel.pipeline(transaction=False) as pipe:
+              cls.execute(*(
+                cls.Operations.LIST_LENGTH,
+                None,
+                cls._pending_prefix), target=pipe)
+              cls.execute(*(
+                cls.Operations.LIST_RANGE,
+                None,
+                claimed,
+                0,
+                -1), target=pipe)
+              pending, queued = cls.commit(pipe)
+
+            if not (pending or queued): break
+
+            if not queued:
+              # claim a batch of queued keys, atomically
+              with channel.pipeline(transaction=True) as pipe:
+                for i in xrange(min(*(
+                      pending, cls.EngineConfig.write_behind_batch))):
+                  cls.execute(*(
+                    cls.Operations.RIGHT_POP_LEFT_PUSH,
+                    None,
+                    cls._pending_prefix,
+                    claimed), target=pipe)
+                queued = filter(None, cls.commit(pipe))
+              if not queued: continue  # drained by another process
+
+            try:
+              cls.apply_indexes(*(
+                collections.OrderedDict.fromkeys(queued), shard), claimed=(
+                  claimed))
+
+            except Exception:
+              # put the batch back on the queue, for the next flush
+              with channel.pipeline(transaction=True) as pipe:
+                cls.execute(*((
+                  cls.Operations.RIGHT_PUSH,
+                  None,
+                  cls._pending_prefix) + tuple(queued)), target=pipe)
+                cls.execute(cls.Operations.DELETE, None, claimed, target=pipe)
+                cls.commit(pipe)
+              raise
+
+            flushed += len(queued)
+    return flushed
+
+  @classmethod
+  def apply_indexes(cls, queued, shard=None, claimed=None):
+
+    """ Index a batch of entities whose index writes were deferred, cleaning
+        their stale index entries in the same transaction. The transaction is
+        retried if any of their indexes change meanwhile (say, because one of
+        them was deleted).
+
+        :param queued: Iterable of encoded :py:class:`model.Key` objects, all
+          drained from the same channel.
+
+        :param shard: Server profile holding the keys, if sharding.
+
+        :param claimed: Name of the list the keys were claimed on, if any, to
+          drop in the same transaction as their index writes.
+
+        :returns: ``None``. """
+
+    queued = list(queued)
+    keys = [cls.decode_key(encoded) for encoded in queued]
+    channel = cls.channel(keys[0].kind, shard)  # where they were queued
+
+    with channel.pipeline(transaction=True) as pipe:
+      while True:
+        try:
+          pipe.watch(*[cls._reverse_key(encoded) for encoded in queued])
+          entities = cls.get_multi([
+            (encoded, key.flatten(True)[1]) for encoded, key in (
+              zip(queued, keys))], _keys=dict(zip(queued, keys)))
+
+          with channel.pipeline(transaction=False) as fetch:
+            for encoded in queued:
+              cls.execute(*(
+                cls.Operations.SET_MEMBERS,
+                None,
+                cls._reverse_key(encoded)), target=fetch)
+            reverse = cls.commit(fetch)
+
+          pipe.multi()
+          for key, entity, members in zip(keys, entities, reverse):
+            if entity is None:  # deleted (or expired) since it was queued
+              cls.clean_indexes(cls.generate_indexes(key),
+                                pipeline=pipe,
+                                reverse=members)
+              continue
+
+            origin, meta, property_map, graph = cls.generate_indexes(*(
+              key, entity, cls._pluck_indexed(entity)))
+            cls.clean_indexes((origin, meta, graph),
+                              pipeline=pipe,
+                              reverse=members)
+            cls.write_indexes((origin, meta, property_map), graph,
+                              pipeline=pipe)
+
+          if claimed:
+            cls.execute(cls.Operations.DELETE, None, claimed, target=pipe)
+          cls.commit(pipe)
+          return
+
+        except _redis_client.WatchError:  # pragma: no cover
+          continue
+
+  @classmethod
+  def indexer(cls):
+
+    """ Start applying deferred index writes in the background, whenever any
+        are queued (checking every :py:attr:`EngineConfig.write_behind_interval`
+        seconds otherwise), if that is set and an indexer isn't running
+        already.
+
+        :returns: ``None``. """
+
+    global _indexing
+
+    if not cls.EngineConfig.write_behind_interval or _indexing: return
+    with _indexer_lock:
+      if _indexing: return
+      _indexing = True
+
+    def _index():  # pragma: no cover
+
+      """ Apply deferred index writes, until disabled. """
+
+      global _indexing
+
+      while cls.EngineConfig.write_behind_interval:
+        try:
+          if cls.flush_indexes(_background=True): continue
+        except Exception:
+          cls.logging.warning('Failed to apply deferred index writes, which'
+                              ' will be retried.', exc_info=True)
+        time.sleep(cls.EngineConfig.write_behind_interval)
+
+      with _indexer_lock:
+        _indexing = False  # started again by the next deferred write
+
+    if _support.gevent:  # pragma: no cover
+      gevent.spawn(_index)
+    else:
+      indexer = threading.Thread(target=_index, name='redis-indexer')
+      indexer.daemon = True
+      indexer.start()
+
   @classmethod
   def allocate_ids(cls, key_class, kind, count=1, pipeline=None):
 
@@ -1003,6 +2997,10 @@ class RedisAdapter(DirectedGraphAdapter):
         persistence engine, and thus can be used for uniquely identifying
         non-deterministic data.
 
+        If IDs are leased for ``kind`` (see :py:meth:`id_lease`), they're
+        allocated from the local block without a round trip to Redis, unless
+        a ``pipeline`` is passed.
+
         :param key_class: Descendent of :py:class:`model.Key` to allocate IDs
           for.
 
@@ -1011,6 +3009,11 @@ class RedisAdapter(DirectedGraphAdapter):
         :param count: The number of IDs to generate, which **must** be greater
           than 1. Defaults to ``1``.
 
+        :param pipeline: Existing pipeline to enqueue the allocation in, if
+          any, in which case the highest allocated ID is its result. It must
+          be opened on ``kind``'s own channel (see :py:meth:`channel`), which
+          holds its counter regardless of sharding.
+
         :raises ValueError: In the case the ``count`` is less than ``1``.
 
         :returns: If **only one** ID is requested, an **integer ID** suitable
@@ -1022,11 +3025,51 @@ class RedisAdapter(DirectedGraphAdapter):
     if not count:  # pragma: no cover
       raise ValueError("Cannot allocate less than 1 ID's.")
 
+    lease = cls.id_lease(kind) if pipeline is None else None
+    if lease is not None:
+      value = lease.allocate(count, functools.partial(*(
+        cls.increment_ids, key_class, kind)))
+    else:
+      value = cls.increment_ids(key_class, kind, count, pipeline=pipeline)
+
+    if count > 1:  # pragma: no cover
+      def _generate_range():
+
+        """ Generate a range of requested ID's.
+
+            :yields: Each item in a set of provisioned integer IDs,
+              suitable for use in a :py:class:`model.Key`. """
+
+        bottom_range = (value - count) + 1
+        for i in xrange(bottom_range, value + 1):
+          yield i
+
+      return _generate_range
+    return value
+
+  @classmethod
+  def increment_ids(cls, key_class, kind, count, pipeline=None):
+
+    """ Increment the counter of IDs for a kind in Redis by ``count``,
+        provisioning that many new IDs.
+
+        :param key_class: Descendent of :py:class:`model.Key` to provision IDs
+          for.
+
+        :param kind: String :py:class:`model.Model` kind name.
+
+        :param count: The number of IDs to provision.
+
+        :param pipeline: Existing pipeline to enqueue the increment in, if any.
+
+        :returns: Highest provisioned ID, or ``pipeline``. """
+
     # generate kinded key to resolve ID pointer
     kinded_key = key_class(kind)
     joined, flattened = kinded_key.flatten(True)
 
-    if cls.EngineConfig.mode == RedisMode.toplevel_blob:
+    if cls.EngineConfig.mode in (RedisMode.toplevel_blob,
+                                 RedisMode.hashkey_hash):
       key_root_id = cls._magic_separator.join([
         cls._meta_prefix, cls.encode_key(joined, flattened)])
 
@@ -1054,28 +3097,10 @@ class RedisAdapter(DirectedGraphAdapter):
         cls.encode_key(tail, flattened),
         count), target=pipeline)
 
-    elif cls.EngineConfig.mode == RedisMode.hashkey_hash:  # pragma: no cover
-
-      raise NotImplementedError('Redis mode not implemented: "hashkey_hash".')
-
     else:  # pragma: no cover
 
       raise NotImplementedError("Unknown storage mode: '%s'." % (
                                 cls.EngineConfig.mode))
-
-    if count > 1:  # pragma: no cover
-      def _generate_range():
-
-        """ Generate a range of requested ID's.
-
-            :yields: Each item in a set of provisioned integer IDs,
-              suitable for use in a :py:class:`model.Key`. """
-
-        bottom_range = (value - count)
-        for i in xrange(bottom_range, value):
-          yield i
-
-      return _generate_range
     return value
 
   @classmethod
@@ -1136,7 +3161,7 @@ class RedisAdapter(DirectedGraphAdapter):
     results, indexer_calls = [], []
 
     # resolve target (perhaps a pipeline?)
-    if pipeline:  # pragma: no cover
+    if pipeline is not None:  # pragma: no cover
       target = pipeline
     else:  # pragma: no cover
       target = cls.channel(cls._meta_prefix)
@@ -1207,6 +3232,16 @@ class RedisAdapter(DirectedGraphAdapter):
           # property indexes come through with a type converter
           converter, write = element
 
+          # composite indexes are sorted sets, one for each combination of
+          # equality values, scored by their last property
+          if write[0] == cls._composite_prefix:
+            indexer_calls.append((cls.Operations.SORTED_ADD, (
+              None,
+              cls.composite_key(*write[1:-1]),
+              cls.composite_score(write[-1]),
+              origin), {'target': target}))
+            continue
+
           # basestring is not allowed to be instantiated
           if converter is basestring: converter = cls.serializer.dumps
 
@@ -1275,44 +3310,161 @@ class RedisAdapter(DirectedGraphAdapter):
 
           # @TODO(sgammon): this can cause silent issues
 
-          # everything else is stored unsorted
-          handler = cls.Operations.SET_ADD
+          # everything else is stored unsorted
+          handler = cls.Operations.SET_ADD
+
+          if converter and value is not None:
+            sanitized_value = converter(value)
+          else:
+            sanitized_value = value
+
+          if hash_value:
+            hash_c.append(sanitized_value)
+          args.append(origin)
+
+        # build index key
+        indexer_calls.append((handler, tuple([
+          None, cls._magic_separator.join(map(str, hash_c))] + args), {
+            'target': target}))
+
+    if execute:  # pragma: no cover
+
+      # record each index `origin` is written to, in its reverse index
+      reverse = [cls._magic_separator.join((
+        'Z' if handler == cls.Operations.SORTED_ADD else 'S', hargs[1])) for (
+          handler, hargs, hkwargs) in indexer_calls if hargs[-1] == origin]
+
+      if reverse:
+        indexer_calls.append((cls.Operations.SET_ADD, tuple([
+          None, cls._reverse_key(origin)] + reverse), {'target': target}))
+
+      for handler, hargs, hkwargs in indexer_calls:
+        results.append(cls.execute(handler, *hargs, **hkwargs))
+
+      if pipeline is not None:
+        return pipeline
+      return results
+    return indexer_calls  # pragma: no cover
+
+  @classmethod
+  def composite_key(cls, kind, names, *values):
+
+    """ Build the name of a composite index, for one combination of values
+        of its leading properties (see
+        :py:meth:`IndexedModelAdapter.generate_composite_indexes`).
+
+        :param kind: String :py:class:`model.Model` kind name.
+
+        :param names: ``tuple`` of property names in the index.
+
+        :param values: Values of the leading properties.
+
+        :returns: Name of the ``Redis`` sorted set holding the index. """
+
+    from canteen import model
+
+    encoded = []
+    for value in values:
+      if isinstance(value, model.Key):
+        encoded.append(value.urlsafe())
+      elif isinstance(value, (datetime.date, datetime.time)):
+        encoded.append(value.isoformat())
+      else:
+        encoded.append(cls.serializer.dumps(value))
+
+    return cls._magic_separator.join(map(str, [
+      cls._composite_prefix, cls._path_separator.join((kind,) + names)] + (
+        encoded)))
+
+  @classmethod
+  def composite_score(cls, value):
+
+    """ Convert a value of the last property in a composite index to its
+        score.
+
+        :param value: Numeric, ``date`` or ``datetime`` value.
+
+        :returns: ``float`` score. """
+
+    if isinstance(value, datetime.date):
+      return cls._index_basetypes[type(value)](value)[1]
+    return float(value)
 
-          if converter and value is not None:
-            sanitized_value = converter(value)
-          else:
-            sanitized_value = value
+  @classmethod
+  def _reverse_key(cls, origin):
 
-          if hash_value:
-            hash_c.append(sanitized_value)
-          args.append(origin)
+    """ Build the name of the reverse index for an encoded key, which holds
+        each index the key is a member of, as ``<flag>::<index>``, where
+        ``flag`` is ``S`` for sets and ``Z`` for sorted sets.
 
-        # build index key
-        indexer_calls.append((handler, tuple([
-          None, cls._magic_separator.join(map(str, hash_c))] + args), {
-            'target': target}))
+        :param origin: Encoded :py:class:`model.Key`.
 
-    if execute:  # pragma: no cover
-      for handler, hargs, hkwargs in indexer_calls:
-        results.append(cls.execute(handler, *hargs, **hkwargs))
+        :returns: Name of the ``Redis`` set holding ``origin``'s reverse
+          index. """
 
-      if pipeline:
-        return pipeline
-      return results
-    return indexer_calls  # pragma: no cover
+    return cls._magic_separator.join((cls._reverse_prefix, origin))
 
   @classmethod
-  def clean_indexes(cls, writes, pipeline=None):  # pragma: no cover
+  def clean_indexes(cls, writes, pipeline=None, reverse=None, shard=None):
 
     """ Clean indexes and index entries matching a particular
         :py:class:`model.Key`, and generated via the adapter method
         :py:meth:`RedisAdapter.generate_indexes`.
 
-      :param writes: Writes to clean up.
+        Index membership is resolved from the key's reverse index, which is
+        maintained by :py:meth:`write_indexes`. Meta indexes are always
+        cleaned, to cover entities written before reverse indexing.
 
-      :returns: ``None``. """
+      :param writes: Writes to clean up, like ``(origin, meta, ...)``.
+
+      :param pipeline: Pipeline to enqueue removals in. Defaults to ``None``,
+        in which case removals are sent in a pipeline of their own.
+
+      :param reverse: Members of the key's reverse index, if they have already
+        been fetched. Defaults to ``None``, in which case they are fetched.
+
+      :param shard: Server profile holding the key, if sharding.
+
+      :returns: ``set`` of ``(flag, index)`` pairs that were cleaned. """
+
+    origin, meta = writes[0], writes[1]
+    reverse_key = cls._reverse_key(origin)
+
+    if reverse is None:
+      reverse = cls.execute(*(
+        cls.Operations.SET_MEMBERS, None, reverse_key), shard=shard)
+
+    _cleaned = set((
+      tuple(entry.split(cls._magic_separator, 1)) for entry in reverse))
+    _cleaned.update((
+      ('S', cls._magic_separator.join(map(unicode, index))) for index in meta))
+
+    target = pipeline if pipeline is not None else (
+      cls.channel(cls._meta_prefix, shard).pipeline(transaction=True))
+
+    for _flag, index in _cleaned:
+      cls.execute(*(
+        cls.Operations.SORTED_REMOVE if _flag == 'Z' else (
+          cls.Operations.SET_REMOVE),
+        None,
+        index,
+        origin), target=target)
+    cls.execute(cls.Operations.DELETE, None, reverse_key, target=target)
+
+    if pipeline is None: cls.commit(target)
+    return _cleaned
+
+  def _iter_query(self, query):
 
-    return  # not currently implemented
+    """ Iterate lazily over results for a ``query.Query`` object, streaming
+        them from ``Redis`` in bounded batches where the query allows it.
+
+        :param query: ``query.Query`` to iterate via the local adapter.
+
+        :returns: Iterator over query results, if any. """
+
+    return iter(self.execute_query(*(
+      query.kind, (query.filters, query.sorts), query.options), stream=True))
 
   @classmethod
   def execute_query(cls, kind, spec, options, **kwargs):  # pragma: no cover
@@ -1352,6 +3504,20 @@ class RedisAdapter(DirectedGraphAdapter):
     _data_frame = []  # allocate results window
     _base_kind = kind
 
+    # a declared composite index can serve the query in one ranged read
+    composite = cls.composite_index(kind, filters, sorts, options)
+    if composite is not None:
+      names, values, directives, sort = composite
+      index = cls.composite_key(kind.kind(), names, *values)
+
+      ranges = {('Z', index): [
+        (operator, cls.composite_score(value), None) for (
+          operator, value) in directives]}
+
+      results = cls.intersect_query(*(
+        kind, ranges, {}, options, [sort] if sort else None, index))
+      if results is not None: return results
+
     # calculate ancestry parent
     ancestry_parent = None
     if isinstance(options.ancestor, basestring):
@@ -1494,6 +3660,25 @@ class RedisAdapter(DirectedGraphAdapter):
       (index, _filters[index]) for index in (
         filter(lambda x: x[0] == 'S', _filters.iterkeys()))])
 
+    # opt-in: resolve the query server-side, in one round trip (plus a fetch)
+    if cls.EngineConfig.scripting and not sorts:
+      plan = cls.plan_query_script(sorted_indexes, unsorted_indexes, options)
+      if plan is not None:
+        return cls.execute_query_script(kind, plan, options)
+
+    # single-index queries stream through the index in bounded batches,
+    # instead of pulling the entire index into memory
+    if not sorts:
+      stream = cls.stream_query(kind, sorted_indexes, unsorted_indexes, options)
+      if stream is not None:
+        return stream if kwargs.get('stream') else list(stream)
+
+    # range filters (and any equality sets alongside them) are intersected
+    # server-side, and sorted by index, with `offset` and `limit` pushed down
+    results = cls.intersect_query(*(
+      kind, sorted_indexes, unsorted_indexes, options, sorts))
+    if results is not None: return results
+
     if sorted_indexes:
 
       for prop, _directives in sorted_indexes.iteritems():
@@ -1507,81 +3692,18 @@ class RedisAdapter(DirectedGraphAdapter):
             if subquery.sub_operator is query.OR:
               _or_filters.append(subquery)
 
-        # double-filters
-        if len(_filters[prop]) == 2:
-
-          # extract info
-          _operators = [operator for operator, value in _directives]
-          _values = [value for operator, value in _directives]
-          _, prop = prop
-
-          # special case: maybe we can do a sorted range request
-          if (query.GREATER_THAN in _operators) or (
-                  query.GREATER_THAN_EQUAL_TO in _operators):
-
-            if (query.LESS_THAN in _operators) or (
-                  query.LESS_THAN_EQUAL_TO in _operators):
-
-              # range value query over sorted index
-              greater, lesser = max(_values), min(_values)
-              _data_frame.append(cls.execute(*(
-                cls.Operations.SORTED_RANGE_BY_SCORE,
-                None,
-                prop,
-                lesser,
-                greater,
-                options.offset,
-                options.limit)))
-
-              continue
-
-        if len(_filters[prop]) == 1:  # single-filters
-
-          # extract info
-          _operator, _value = (
-            ((operator, value) for (
-                                 operator, value, chain) in _directives).next())
-          _, prop = prop
+        # range (or static value) query over sorted index
+        bounds = cls.score_bounds([(_op, _val, None) for (
+          _op, _val, _chain) in _directives])
 
-          if _operator is query.EQUALS:
+        if bounds is None:
+          ## @TODO(sgammon): build this query branch
+          raise RuntimeError("Specified query is not yet supported.")
 
-            # static value query over sorted index
-            _data_frame.append(cls.execute(*(
-              cls.Operations.SORTED_RANGE_BY_SCORE,
-              None,
-              prop,
-              _value,
-              _value)))
-
-            continue
-
-          elif _operator is query.LESS_THAN:
-
-            # no lower bound
-            _data_frame.append(cls.execute(
-              cls.Operations.SORTED_RANGE_BY_SCORE,
-              None,
-              prop,
-              '-inf',
-              float(_value) if not (
-                isinstance(_value, float)) else _value))
-
-            continue
-
-          elif _operator is query.GREATER_THAN:
-            # no lower bound
-            _data_frame.append(cls.execute(
-              cls.Operations.SORTED_RANGE_BY_SCORE,
-              None,
-              prop,
-              float(_value) if not (
-                isinstance(_value, float)) else _value,
-              '+inf'))
-
-            continue
-
-        ## @TODO(sgammon): build this query branch
-        raise RuntimeError("Specified query is not yet supported.")
+        _data_frame.append(cls.gather(*((
+          cls.Operations.SORTED_RANGE_BY_SCORE,
+          None,
+          prop[1]) + bounds)))
 
     if unsorted_indexes:
 
@@ -1617,14 +3739,14 @@ class RedisAdapter(DirectedGraphAdapter):
       # special case: only one unsorted set - pull content instead
       # of an intersection merge
       if _intersections and len(_intersections) == 1:
-        _data_frame.append(cls.execute(*(
+        _data_frame.append(cls.gather(*(
           cls.Operations.SET_MEMBERS,
           None,
           _intersections.pop())))
 
       # more than one intersection: do an `SINTER` call instead of `SMEMBERS`
       elif _intersections and len(_intersections) > 1:
-        _data_frame.append(cls.execute(*(
+        _data_frame.append(cls.gather(*(
           cls.Operations.SET_INTERSECT,
           None,
           _intersections)))
@@ -1691,7 +3813,8 @@ class RedisAdapter(DirectedGraphAdapter):
     # execute pipeline, zip keys and build results
     if bundles:
       _seen_results = 0
-      for entity in cls.get_multi(bundles):
+      for entity in cls.get_multi(bundles, _keys=dict(zip((
+            encoded for encoded, flattened in bundles), _queued))):
         if not entity: continue  # skip entities that couldn't be found
 
         if _and_filters or _or_filters:
@@ -1703,33 +3826,657 @@ class RedisAdapter(DirectedGraphAdapter):
                   (_filter.match(entity) for _filter in _or_filters))):
             continue  # doesn't match any of the `or` filters
 
-        result_entities.append(entity.key if options.keys_only else (
-                               entity))
+        result_entities.append(entity)
 
         _seen_results += 1
-        if 0 < options.limit <= _seen_results:
+        if not sorts and 0 < options.limit <= _seen_results:
           break
 
-      # prepare and collapse sort chain, if needed
+      # apply the sort chain before the limit, if needed
       if sorts:
-        if len(sorts) == 1:
+        result_entities = cls.sort_entities(result_entities, sorts)
+        if options.limit > 0:
+          result_entities = result_entities[:options.limit]
 
-          sorted_results, sort_chain, sort = [], sorted(
-            result_entities, key=itemgetter(sorts[0].target.name)), sorts[0]
+    if options.keys_only:
+      return [entity.key for entity in result_entities]
+    return result_entities
 
-          # apply descending, but be careful about asc/dsc string sorts
-          if ((sort.target.basetype in (basestring, unicode, str)) and (
-                sort.operator is sort.ASCENDING) or (
-                sort.operator is sort.DESCENDING) and (
-                sort.target.basetype not in (basestring, unicode, str))):
-            sort_chain = reversed(sort_chain)
+  @classmethod
+  def decode_key(cls, encoded, kind=None):
 
-          for entity in sort_chain:
-            sorted_results.append(entity)
-          return sorted_results
+    """ Decode a key read from an index, resolving its key class from the
+        model registry.
 
-        else:
-          # dammit, i guess collapse and apply
-          raise RuntimeError('too many sorts :(')
+        :param encoded: Encoded :py:class:`model.Key`, as stored in indexes.
 
-    return result_entities
+        :param kind: Model class to fall back to, in the case that the key's
+          kind is not registered.
+
+        :returns: Decoded (and persisted) :py:class:`model.Key`. """
+
+    from canteen import model
+
+    decoded = model.Key.from_urlsafe(encoded, _persisted=True)
+    _base_kind = cls.registry.get(decoded.kind, kind)
+    if not _base_kind: return decoded
+    return _base_kind.__keyclass__.from_urlsafe(encoded, _persisted=True)
+
+  @classmethod
+  def scan_index(cls, index, bounds=None, batch_size=None, offset=0):
+
+    """ Walk an index in bounded batches: unsorted indexes via ``SSCAN``, and
+        sorted indexes via ``ZRANGEBYSCORE ... LIMIT``. When sharding, each
+        shard is walked in turn.
+
+        Since ``SSCAN`` may return a member more than once, members are
+        de-duplicated against those already yielded.
+
+        :param index: Name of the index to walk.
+
+        :param bounds: Tupled ``(lower, upper)`` score bounds, for sorted
+          indexes. Defaults to ``None``, indicating an unsorted index.
+
+        :param batch_size: Number of members to fetch per call. Defaults to
+          :py:attr:`EngineConfig.batch_size`.
+
+        :param offset: Number of members to skip before yielding any. For
+          sorted indexes (without sharding) this is done by ``Redis``.
+
+        :yields: Each batch of (encoded key) members, as a ``list``. """
+
+    batch_size = batch_size or cls.EngineConfig.batch_size
+    shards = cls.EngineConfig.shards or (None,)
+    pushdown = bounds is not None and len(shards) == 1
+
+    def _pages(shard, start):
+
+      """ Walk one shard's copy of the index.
+
+          :yields: Each batch of members. """
+
+      if bounds is not None:
+        while True:
+          members = cls.execute(*(
+            cls.Operations.SORTED_RANGE_BY_SCORE,
+            None,
+            index,
+            bounds[0],
+            bounds[1],
+            start,
+            batch_size), shard=shard)
+
+          if members: yield members
+          if len(members) < batch_size: return
+          start += batch_size
+
+      else:
+        cursor, seen = 0, set()
+        while True:
+          cursor, members = cls.execute(*(
+            cls.Operations.SET_SCAN,
+            None,
+            index,
+            cursor,
+            None,
+            batch_size), shard=shard)
+
+          members = [member for member in members if member not in seen]
+          seen.update(members)
+
+          if members: yield members
+          if not int(cursor): return
+
+    skip = 0 if pushdown else offset
+    for shard in shards:
+      for members in _pages(shard, offset if pushdown else 0):
+        if skip:
+          skipped, members = members[:skip], members[skip:]
+          skip -= len(skipped)
+        if members: yield members
+
+  @classmethod
+  def stream_query(cls, kind, sorted_indexes, unsorted_indexes, options):
+
+    """ Plan a streamed query over a single index, which walks the index (see
+        :py:meth:`scan_index`) and fetches matching entities in bounded
+        batches, stopping as soon as ``limit`` is reached.
+
+        :param kind: Model class for which we are querying across.
+
+        :param sorted_indexes: ``dict`` of sorted indexes, mapped to their
+          filter directives, like ``{('Z', <index>): [<directives>]}``.
+
+        :param unsorted_indexes: ``dict`` of unsorted indexes, mapped to their
+          filter directives, like ``{('S', <index>): [<directives>]}``.
+
+        :param options: Object descendent from, or directly instantiated as
+          :py:class:`QueryOptions`, specifying options for the execution of
+          this :py:class:`Query`.
+
+        :returns: Generator of matching :py:class:`model.Key` (for
+          ``keys_only`` queries) or :py:class:`model.Model` objects, or
+          ``None`` if the query can't be streamed from one index. """
+
+    if len(sorted_indexes) + len(unsorted_indexes) != 1: return None
+
+    if sorted_indexes:
+      (_flag, index), directives = sorted_indexes.items()[0]
+      bounds = cls.score_bounds(directives)
+      if bounds is None: return None
+
+    else:
+      (_flag, index), directives = unsorted_indexes.items()[0]
+      if not cls.is_member_filter(directives): return None
+      bounds = None
+
+    def _stream():
+
+      """ Walk the index and fetch matching entities, batch by batch.
+
+          :yields: Each matching key or entity. """
+
+      remaining = options.limit if (options.limit or 0) > 0 else None
+
+      for members in cls.scan_index(*(
+            index, bounds, None, max(options.offset or 0, 0))):
+
+        while members:
+          # don't fetch more than we need to satisfy `limit`
+          chunk, members = (members, []) if remaining is None else (
+            members[:remaining], members[remaining:])
+
+          keys = [cls.decode_key(member, kind) for member in chunk]
+          if options.keys_only:
+            results = keys
+          else:
+            results = filter(None, cls.get_multi([
+              (member, key.flatten(True)[1]) for member, key in (
+                zip(chunk, keys))], _keys=dict(zip(chunk, keys))))
+
+          for result in results:
+            yield result
+
+          if remaining is not None:
+            remaining -= len(results)
+            if remaining <= 0: return
+
+    return _stream()
+
+  @classmethod
+  def score_bounds(cls, directives):
+
+    """ Resolve filter directives over a sorted index into a score range,
+        suitable for ``ZRANGEBYSCORE``.
+
+        :param directives: Filter directives over one sorted index, like
+          ``[(operator, value, chain)]``.
+
+        :returns: Tupled ``(lower, upper)`` score bounds, or ``None`` if the
+          directives can't be resolved to a single range. """
+
+    from canteen.model import query
+
+    if len(directives) > 2: return None
+
+    lower, upper = '-inf', '+inf'
+    for operator, value, chain in directives:
+      if chain: return None
+
+      if operator is query.EQUALS:
+        lower = upper = float(value)
+      elif operator is query.GREATER_THAN:
+        lower = '(%r' % float(value)
+      elif operator is query.GREATER_THAN_EQUAL_TO:
+        lower = float(value)
+      elif operator is query.LESS_THAN:
+        upper = '(%r' % float(value)
+      elif operator is query.LESS_THAN_EQUAL_TO:
+        upper = float(value)
+      else:
+        return None
+    return lower, upper
+
+  @staticmethod
+  def complement_bounds(bounds):
+
+    """ Resolve the score ranges falling outside of a pair of bounds, as
+        returned from :py:meth:`score_bounds`, suitable for
+        ``ZREMRANGEBYSCORE``.
+
+        :param bounds: Tupled ``(lower, upper)`` score bounds.
+
+        :returns: ``list`` of ``(lower, upper)`` score ranges to remove. """
+
+    lower, upper = bounds
+    ranges = []
+
+    # exclusive bounds keep their edge, so it's removed (and vice versa)
+    if lower != '-inf':
+      ranges.append(('-inf', lower[1:] if isinstance(lower, basestring) else (
+        '(%r' % lower)))
+    if upper != '+inf':
+      ranges.append((upper[1:] if isinstance(upper, basestring) else (
+        '(%r' % upper), '+inf'))
+    return ranges
+
+  @staticmethod
+  def is_member_filter(directives):
+
+    """ Check whether filter directives over an unsorted index can be resolved
+        by set membership alone.
+
+        :param directives: Filter directives over one unsorted index, like
+          ``[(operator, value, chain)]``.
+
+        :returns: ``True`` if every directive is an unchained equality (or
+          ``CONTAINS``) filter. """
+
+    from canteen.model import query
+
+    return all((not chain and operator in (query.EQUALS, query.CONTAINS)) for (
+      operator, value, chain) in directives)
+
+  @classmethod
+  def plan_query_script(cls, sorted_indexes, unsorted_indexes, options):
+
+    """ Plan execution of a query via the server-side ``query`` script, from
+        the indexes resolved by :py:meth:`execute_query`.
+
+        :param sorted_indexes: ``dict`` of sorted indexes, mapped to their
+          filter directives, like ``{('Z', <index>): [<directives>]}``.
+
+        :param unsorted_indexes: ``dict`` of unsorted indexes, mapped to their
+          filter directives, like ``{('S', <index>): [<directives>]}``.
+
+        :param options: Object descendent from, or directly instantiated as
+          :py:class:`QueryOptions`, specifying options for the execution of
+          this :py:class:`Query`.
+
+        :returns: Tupled pair of script ``(keys, args)``, or ``None`` if the
+          query cannot be satisfied by indexes alone (and so must be executed
+          client-side). """
+
+    _sorted, _bounds, _unsorted = [], [], []
+
+    for (_flag, index), directives in sorted_indexes.iteritems():
+      bounds = cls.score_bounds(directives)
+      if bounds is None: return None
+
+      _sorted.append(index)
+      _bounds.extend(bounds)
+
+    for (_flag, index), directives in unsorted_indexes.iteritems():
+      if not cls.is_member_filter(directives): return None
+      _unsorted.append(index)
+
+    if not (_sorted or _unsorted): return None
+
+    return tuple(_sorted + _unsorted), tuple([
+      max(options.offset or 0, 0),
+      max(options.limit or 0, 0),
+      len(_sorted)] + _bounds)
+
+  @classmethod
+  def sort_index(cls, kind, prop):
+
+    """ Resolve the sorted index backing a sort over ``prop``, if any. Only
+        properties indexed by score (``float``, ``date`` and ``datetime``
+        values) can be sorted by ``Redis`` directly.
+
+        :param kind: Model class for which we are querying across.
+
+        :param prop: :py:class:`model.Property` to sort by.
+
+        :returns: Name of the sorted index, or ``None`` if ``prop`` isn't
+          indexed by score. """
+
+    from canteen import model
+
+    sample = _SORTED_SAMPLES.get(prop.basetype)
+    if sample is None or not prop.indexed: return None
+
+    origin, meta, property_map, graph_indexes = cls.generate_indexes(*(
+      model.Key(kind), None, {prop.name: (prop, sample)}))
+
+    for operation, index, config in cls.write_indexes(
+          (origin, [], property_map), graph_indexes, execute=False):
+      if operation == cls.Operations.SORTED_ADD: return index[1]
+    return None  # pragma: no cover
+
+  @classmethod
+  def sort_entities(cls, entities, sorts):
+
+    """ Sort entities by a chain of sort directives, client-side. Each sort is
+        applied stably, from last to first, so that earlier sorts take
+        precedence.
+
+        :param entities: Iterable of :py:class:`model.Model` entities to sort.
+
+        :param sorts: ``list`` of :py:class:`query.Sort` directives.
+
+        :returns: Sorted ``list`` of entities. """
+
+    from canteen.model import query
+
+    entities = list(entities)
+    for sort in reversed(sorts):
+
+      # apply descending, but be careful about asc/dsc string sorts
+      textual = sort.target.basetype in (basestring, unicode, str)
+      entities.sort(key=itemgetter(sort.target.name), reverse=(
+        (sort.operator is query.ASCENDING) if textual else (
+          sort.operator is query.DESCENDING)))
+    return entities
+
+  @classmethod
+  def intersect_query(cls, kind, sorted_indexes, unsorted_indexes, options,
+                      sorts=None, order=None):
+
+    """ Execute a query across one or more sorted indexes (and any equality
+        sets alongside them) server-side, in one transaction. Indexes are
+        intersected via ``ZINTERSTORE`` into temporary keys, which are trimmed
+        to each range filter's bounds and then paged via ``offset`` and
+        ``limit``. Results are ordered by the first sorted index, by name.
+
+        If ``sorts`` are given, the first must be over a property indexed by
+        score (see :py:meth:`sort_index`): its index orders results instead,
+        and is read with ``ZRANGE``/``ZREVRANGE`` (or straight from the index,
+        if there's nothing to intersect it with). Further sorts are applied
+        client-side, but only to the page and any entities tied with its
+        edges. Entities without a value for the first sort don't match.
+
+        Temporary keys are deleted once read, unless
+        :py:attr:`EngineConfig.intersect_ttl` is set, in which case the
+        intersection expires after that many seconds and is reused (say, for
+        further pages of the same query) until then. Uncached intersections
+        read again for ties are private to each call, so concurrent identical
+        queries can't replace or delete them between round trips.
+
+        :param kind: Model class for which we are querying across.
+
+        :param sorted_indexes: ``dict`` of sorted indexes, mapped to their
+          filter directives, like ``{('Z', <index>): [<directives>]}``.
+
+        :param unsorted_indexes: ``dict`` of unsorted indexes, mapped to their
+          filter directives, like ``{('S', <index>): [<directives>]}``.
+
+        :param options: Object descendent from, or directly instantiated as
+          :py:class:`QueryOptions`, specifying options for the execution of
+          this :py:class:`Query`.
+
+        :param sorts: ``list`` of :py:class:`query.Sort` directives to order
+          results by, if any.
+
+        :param order: Name of the sorted index to order results by, in place
+          of the one backing the first sort (say, a composite index).
+
+        :returns: Iterable (``list``) of matching :py:class:`model.Key` (for
+          ``keys_only`` queries) or :py:class:`model.Model` objects, or
+          ``None`` if the query can't be resolved by indexes alone. """
+
+    from canteen.model import query
+
+    secondary = (sorts or [])[1:]
+    if sorts and order is None:
+      order = cls.sort_index(kind, sorts[0].target)
+      if order is None: return None
+
+    if not (sorted_indexes or order): return None
+
+    _ranges, _sets = [], []
+    for (_flag, index), directives in sorted(sorted_indexes.iteritems()):
+      bounds = cls.score_bounds(directives)
+      if bounds is None: return None
+      if index == order:
+        _ranges.insert(0, (index, bounds))
+      else:
+        _ranges.append((index, bounds))
+
+    for (_flag, index), directives in sorted(unsorted_indexes.iteritems()):
+      if not cls.is_member_filter(directives): return None
+      _sets.append(index)
+
+    if order:
+      # property indexes are per-kind, so the kind index is redundant
+      _kind_index = cls._magic_separator.join((cls._kind_prefix, kind.kind()))
+      _sets = [_set for _set in _sets if _set != _kind_index]
+      if not _ranges or _ranges[0][0] != order:
+        _ranges.insert(0, (order, ('-inf', '+inf')))
+
+    ttl, shards = cls.EngineConfig.intersect_ttl, cls.EngineConfig.shards
+    offset, limit = max(options.offset or 0, 0), max(options.limit or 0, 0)
+    descending = bool(sorts) and sorts[0].operator is query.DESCENDING
+
+    # when sharding (or sorting further), pages start from the beginning and
+    # results are merged (and sorted) here
+    merged = bool(shards or secondary)
+    start, stop = (0 if merged else offset), (
+      (offset + limit - 1) if limit else -1)
+
+    # a lone index is read directly, without intersecting anything into it
+    direct = len(_ranges) == 1 and not _sets
+    ties = bool(secondary and limit)
+
+    # intersections are named by query, so they may be shared while cached,
+    # but otherwise get a per-call nonce if they outlive their transaction
+    digest = hashlib.md5(repr((_ranges, _sets))).hexdigest()
+    if ties and not ttl: digest = '.'.join((digest, uuid.uuid4().hex))
+    result, staging = (
+      cls._magic_separator.join((cls._temp_prefix, digest)),
+      cls._magic_separator.join((cls._temp_prefix, digest, 'range')))
+
+    def _read(bounds, start, stop, shard):
+
+      """ Read a page of members straight from the first sorted index.
+
+          :returns: ``list`` of ``(member, score)`` pairs. """
+
+      index, (lower, upper) = _ranges[0][0], bounds
+      page = {'withscores': True, 'shard': shard}
+      if stop >= 0:
+        page.update(start=start, num=stop - start + 1)
+
+      if descending:
+        members = cls.execute(*(
+          cls.Operations.SORTED_MEMBERS_BY_SCORE, kind.kind(), index, upper,
+          lower), **page)
+      else:
+        members = cls.execute(*(
+          cls.Operations.SORTED_RANGE_BY_SCORE, kind.kind(), index, lower,
+          upper), **page)
+
+      # an offset without a limit is applied here
+      return members[start:] if stop < 0 else members
+
+    def _page(shard):
+
+      """ Intersect and page matching members on one shard.
+
+          :returns: ``list`` of ``(member, score)`` pairs. """
+
+      if direct:
+        return _read(_ranges[0][1], start, stop, shard)
+
+      operation = cls.Operations.SORTED_MEMBERS_BY_INDEX if descending else (
+        cls.Operations.SORTED_RANGE)
+
+      if ttl and cls.execute(*(
+            cls.Operations.EXISTS, kind.kind(), result), shard=shard):
+        return cls.execute(*(
+          operation, kind.kind(), result, start, stop),
+          withscores=True, shard=shard)
+
+      pipe = cls.channel(kind.kind(), shard).pipeline(transaction=True)
+
+      def _intersect(target, weights, bounds):
+
+        """ Queue an intersection into ``target``, trimmed to ``bounds``. """
+
+        cls.execute(*(
+          cls.Operations.SORTED_INTERSECT_STORE, None, target, weights),
+          target=pipe)
+
+        for lower, upper in cls.complement_bounds(bounds):
+          cls.execute(*(
+            cls.Operations.SORTED_REMOVE_RANGE_BY_SCORE,
+            None,
+            target,
+            lower,
+            upper), target=pipe)
+
+      # first range, intersected with each equality set (which score zero)
+      (index, bounds), others = _ranges[0], _ranges[1:]
+      weights = dict.fromkeys(_sets, 0)
+      weights[index] = 1
+      _intersect(result, weights, bounds)
+
+      # each further range narrows the result, keeping its scores
+      for index, bounds in others:
+        _intersect(staging, {index: 1, result: 0}, bounds)
+        cls.execute(*(
+          cls.Operations.SORTED_INTERSECT_STORE,
+          None,
+          result,
+          {result: 1, staging: 0}), target=pipe)
+
+      cls.execute(*(
+        operation, None, result, start, stop),
+        withscores=True, target=pipe)
+
+      if ttl or ties:  # keep the result around, to be read again
+        cls.execute(*(
+          cls.Operations.EXPIRE, None, result, ttl or cls._temp_ttl),
+          target=pipe)
+        cls.execute(cls.Operations.DELETE, None, staging, target=pipe)
+        return cls.commit(pipe)[-3]
+
+      cls.execute(cls.Operations.DELETE, None, result, staging, target=pipe)
+      return cls.commit(pipe)[-2]
+
+    def _ties(shard, score):
+
+      """ Read every member tied at ``score`` on one shard, and release the
+          intersection if it's no longer needed.
+
+          :returns: ``list`` of ``(member, score)`` pairs. """
+
+      if direct:
+        return _read((score, score), 0, -1, shard)
+
+      pipe = cls.channel(kind.kind(), shard).pipeline(transaction=False)
+      cls.execute(*(
+        cls.Operations.SORTED_RANGE_BY_SCORE, None, result, score, score),
+        withscores=True, target=pipe)
+      if not ttl:
+        cls.execute(cls.Operations.DELETE, None, result, target=pipe)
+      return cls.commit(pipe)[0]
+
+    shards = shards or (None,)
+    page = []
+    for frame in cls.fan_out((functools.partial(_page, shard) for (
+          shard) in shards)):
+      page.extend(frame)
+
+    def _ordered(members):
+
+      """ Order and de-duplicate ``(member, score)`` pairs.
+
+          :returns: Ordered ``list`` of pairs. """
+
+      return sorted(set(members), key=lambda (member, score): (
+        score, member), reverse=descending)
+
+    if not merged:
+      candidates, skipped = page, 0
+
+    else:
+      page = _ordered(page)
+
+      if ties and len(page) >= offset + limit:
+        boundary = page[offset + limit - 1][1]
+        for frame in cls.fan_out((functools.partial(*(
+              _ties, shard, boundary)) for shard in shards)):
+          page.extend(frame)
+        page = _ordered(page)
+
+      elif ties and not (direct or ttl):  # release intersections
+        for shard in shards:
+          cls.execute(cls.Operations.DELETE, kind.kind(), result, shard=shard)
+
+      if not secondary:
+        candidates, skipped = (
+          page[offset:(offset + limit) if limit else None], 0)
+
+      else:
+        # entities tied with the first on the page might sort before it
+        first = page[offset][1] if offset < len(page) else None
+        candidates = [(member, score) for position, (member, score) in (
+          enumerate(page)) if score == first or position >= offset]
+        skipped = len(page) - len(candidates)
+
+    matching_keys = [cls.decode_key(encoded, kind) for (
+      encoded, _s) in candidates]
+
+    if options.keys_only and not secondary:
+      return matching_keys
+
+    entities = filter(None, cls.get_multi([
+      (encoded, key.flatten(True)[1]) for (encoded, _s), key in (
+        zip(candidates, matching_keys))], _keys=dict(zip((
+          encoded for encoded, _s in candidates), matching_keys))) or ())
+
+    if secondary:
+      entities = cls.sort_entities(entities, sorts)[(offset - skipped):(
+        (offset - skipped + limit) if limit else None)]
+
+    return [entity.key for entity in entities] if options.keys_only else (
+      entities)
+
+  @classmethod
+  def execute_query_script(cls, kind, plan, options):
+
+    """ Execute a query planned by :py:meth:`plan_query_script`, server-side.
+        The script only reads the indexes it is passed, and returns a page of
+        matching keys: their entities are then fetched via
+        :py:meth:`get_multi`.
+
+        :param kind: Model class for which we are querying across.
+
+        :param plan: Tupled pair of script ``(keys, args)``, as returned from
+          :py:meth:`plan_query_script`.
+
+        :param options: Object descendent from, or directly instantiated as
+          :py:class:`QueryOptions`, specifying options for the execution of
+          this :py:class:`Query`.
+
+        :returns: Iterable (``list``) of matching :py:class:`model.Key` (for
+          ``keys_only`` queries) or :py:class:`model.Model` objects. """
+
+    keys, args = plan
+
+    if not cls.EngineConfig.shards:
+      page = cls.script('query', kind.kind(), keys, args)
+
+    else:
+      # scatter: each shard returns its first `offset + limit` matches, which
+      # are then merged and paged here
+      offset, limit = args[0], args[1]
+      _args = (0, (offset + limit) if limit else 0) + tuple(args[2:])
+
+      merged = []
+      for result in cls.fan_out((functools.partial(*(
+            cls.script, 'query', kind.kind(), keys, _args), shard=shard) for (
+              shard) in cls.EngineConfig.shards)):
+        merged.extend(result)
+
+      page = sorted(merged)[offset:(offset + limit) if limit else None]
+
+    matching_keys = [cls.decode_key(encoded, kind) for encoded in page]
+
+    if options.keys_only:
+      return matching_keys
+
+    return filter(None, cls.get_multi([
+      (encoded, key.flatten(True)[1]) for encoded, key in (
+        zip(page, matching_keys))], _keys=dict(zip(page, matching_keys))))
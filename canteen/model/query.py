@@ -620,6 +620,48 @@ class Query(AbstractQuery):
       options=QueryOptions(**options) if options else None,
       adapter=adapter)
 
+  def fetch_async(self, adapter=None, **options):
+
+    """ Fetch results for the currently-built :py:class:`Query`, without
+        blocking. Accepts the same options as ``fetch``.
+
+        :param adapter: Adapter to use for the ``fetch`` operation.
+
+        :param **options: Accepts any valid and registered options on
+          :py:class:`QueryOptions`.
+
+        :returns: :py:class:`Future` for a ``list`` of matching model
+          entities. """
+
+    from canteen import model
+
+    _adapter = adapter or self.adapter or (
+      self.kind.__adapter__ if self.kind else model.Model.__adapter__)
+    return _adapter._async(self.fetch, adapter, **options)
+
+  def iter(self, adapter=None, **options):
+
+    """ Iterate over results for the currently-built :py:class:`Query`,
+        lazily. Adapters that support it stream results from storage in
+        bounded batches, rather than materializing them all at once.
+
+        :param adapter: Adapter to use for the ``iter`` operation.
+
+        :param **options: Accepts any valid and registered options on
+          :py:class:`QueryOptions`.
+
+        :returns: Iterator of matching model entities (or
+          :py:class:`model.Key` objects if ``keys_only`` is truthy). """
+
+    from canteen import model
+
+    if options: self.options.overlay(QueryOptions(**options))
+
+    if adapter: return adapter._iter_query(self)
+    if self.adapter: return self.adapter._iter_query(self)
+    if self.kind: return self.kind.__adapter__._iter_query(self)
+    return model.Model.__adapter__._iter_query(self)
+
   def fetch_page(self, **options):
 
     """ Fetch a page of results, potentially as the next in a sequence of page
@@ -17,6 +17,8 @@
 """
 
 # stdlib
+import time
+import uuid
 import datetime
 
 # canteen test
@@ -42,6 +44,18 @@ class SampleModel(model.Model):
   date = datetime.datetime
 
 
+class SampleTicket(model.Model):
+
+  """ Test model, with a composite index. """
+
+  __indexes__ = (('status', 'owner', 'created'),)
+
+  status = str
+  owner = str
+  created = datetime.datetime
+  priority = int
+
+
 class TestGraphPerson(model.Vertex):
 
   """ simple test person object """
@@ -290,6 +304,43 @@ class AbstractModelAdapterTests(test.FrameworkTest):
         assert isinstance(i, int)
 
 
+  def test_async_get_put(self):
+
+    """ Test putting and getting entities without blocking """
+
+    if not self.__abstract__:
+      # explicit keys, so concurrent puts don't contend over ID allocation
+      futures = [SampleModel(
+        key=model.Key(SampleModel.kind(), "AsyncEntity%s" % i),
+        string='async', integer=[i]).put_async(
+          adapter=self._construct()) for i in xrange(5)]
+      keys = [future.result(timeout=10) for future in futures]
+      assert [key.id for key in keys] == [
+        "AsyncEntity%s" % i for i in xrange(5)]
+
+      future = SampleModel.get_async(keys[2], adapter=self._construct())
+      assert future.result(timeout=10).integer == [2]
+      assert future.done()
+
+      called = []
+      future = SampleModel.get_multi_async(keys, adapter=self._construct())
+      future.add_done_callback(called.append)
+      assert [e.integer for e in future.result(timeout=10)] == [
+        [i] for i in xrange(5)]
+
+      # callbacks run just after the result is made available
+      for attempt in xrange(50):
+        if called: break
+        time.sleep(0.05)
+      assert called == [future]
+
+      # errors are raised when the result is collected
+      future = SampleModel.get_async(adapter=self._construct())
+      with self.assertRaises(ValueError):
+        future.result(timeout=10)
+      assert isinstance(future.exception(), ValueError)
+
+
 class IndexedModelAdapterTests(AbstractModelAdapterTests):
 
   """ Tests `model.adapter.abstract.IndexedModelAdapter` """
@@ -769,6 +820,103 @@ class IndexedModelAdapterTests(AbstractModelAdapterTests):
         assert l.date == r
 
 
+  def test_fetch_async(self):
+
+    """ Test fetching query results without blocking """
+
+    if not self.__abstract__:
+      root = model.Key(SampleModel, 'async-query')
+      for i in xrange(3):
+        SampleModel(key=model.Key(SampleModel, 'child%s' % i, parent=root),
+                    string='async').put(adapter=self._construct())
+
+      future = SampleModel.query(ancestor=root, limit=50).fetch_async(
+        adapter=self._construct())
+      assert len(future.result(timeout=10)) == 3
+
+  def test_entity_ttl(self):
+
+    """ Test expiring entities, and their index entries, after a TTL """
+
+    if not self.__abstract__:
+      # filter on a value unique to this run, so leftovers can't match
+      adapter, now, value = self._construct(), time.time(), (
+        'expiring-%s' % uuid.uuid4().hex)
+      query = SampleModel.query().filter(SampleModel.string == value)
+
+      lasting = SampleModel(string=value, integer=[1]).put(adapter=adapter)
+      expiring = SampleModel(string=value, integer=[2]).put(
+        adapter=adapter, ttl=60)
+      assert len(query.fetch(limit=50, adapter=adapter)) == 2
+
+      # once expired, entities are swept along with their indexes
+      assert adapter.sweep('SampleModel', now=now + 120) == 1
+      assert SampleModel.get(expiring, adapter=adapter) is None
+      assert SampleModel.get(lasting, adapter=adapter).integer == [1]
+      assert [e.integer for e in query.fetch(limit=50, adapter=adapter)] == [
+        [1]]
+
+      # writing an entity again without a TTL makes it permanent
+      renewed = SampleModel(string='renewed').put(adapter=adapter, ttl=60)
+      SampleModel.get(renewed, adapter=adapter).put(adapter=adapter)
+      assert adapter.sweep('SampleModel', now=now + 120) == 0
+      assert SampleModel.get(renewed, adapter=adapter)
+
+      # expired entities are hidden from reads before they're swept
+      fleeting = SampleModel(string=value, integer=[3]).put(
+        adapter=adapter, ttl=0.01)
+      time.sleep(0.05)
+      assert SampleModel.get(fleeting, adapter=adapter) is None
+      assert list(SampleModel.get_multi([fleeting, lasting], adapter=(
+        adapter)))[0] is None
+      assert [e.integer for e in query.fetch(limit=50, adapter=adapter)] == [
+        [1]]
+
+      # ... and swept, unless they were already cleaned up as they were read
+      assert adapter.sweep('SampleModel') in (0, 1)
+      assert adapter.sweep('SampleModel') == 0
+
+  def test_composite_index(self):
+
+    """ Test serving equality-and-range queries from a composite index """
+
+    if not self.__abstract__:
+      adapter, start = self._construct(), datetime.datetime(2014, 6, 1)
+      for priority, (status, owner) in enumerate((
+            ('open', 'sam'), ('open', 'sam'), ('open', 'ann'),
+            ('closed', 'sam'), ('open', 'sam'))):
+        SampleTicket(status=status,
+                     owner=owner,
+                     created=start + datetime.timedelta(hours=priority),
+                     priority=priority).put(adapter=adapter)
+
+      _query = lambda *sorts: SampleTicket.query(*((
+        SampleTicket.status == 'open', SampleTicket.owner == 'sam') + sorts))
+
+      # sorted by the index's last property, with a limit
+      q = _query(-SampleTicket.created)
+      assert adapter.composite_index(SampleTicket, *(
+        q.filters, q.sorts, q.options))
+      assert [t.priority for t in q.fetch(limit=2, adapter=adapter)] == [4, 1]
+
+      # ranged over the index's last property, with an offset
+      q = _query().filter(SampleTicket.created > start)
+      assert [t.priority for t in q.fetch(adapter=adapter)] == [1, 4]
+      assert [t.priority for t in q.fetch(offset=1, adapter=adapter)] == [4]
+
+      # queries not covered by the index aren't served by it
+      q = SampleTicket.query(SampleTicket.status == 'open')
+      q = q.sort(-SampleTicket.created)
+      assert not adapter.composite_index(SampleTicket, *(
+        q.filters, q.sorts, q.options))
+
+      # deletes are reflected in the index
+      _query(-SampleTicket.created).fetch(
+        limit=1, adapter=adapter)[0].delete(adapter=adapter)
+      assert [t.priority for t in _query(-SampleTicket.created).fetch(
+        limit=5, adapter=adapter)] == [1, 0]
+
+
 class GraphModelAdapterTests(IndexedModelAdapterTests):
 
   """ Tests `model.adapter.abstract.GraphModelAdapter` """
@@ -15,16 +15,322 @@
 
 """
 
+# stdlib
+import os
+import shutil
+import threading
+import datetime
+import tempfile
+
 # canteen model API
+from canteen import test
+from canteen import model
 from canteen.model.adapter import inmemory
 
 # abstract test bases
+from .test_abstract import SampleModel
 from .test_abstract import DirectedGraphAdapterTests
 
 
+class SamplePackedModel(model.Model):
+
+  """ Test model, stored packed by the in-memory adapter. """
+
+  __packed__ = True
+
+  string = basestring, {'required': True}
+  integer = int, {'repeated': True}
+  number = int, {'repeated': False}
+
+
 class InMemoryAdapterTests(DirectedGraphAdapterTests):
 
   """ Tests `model.adapter.inmemory` """
 
   __abstract__ = False
   subject = inmemory.InMemoryAdapter
+
+  def test_sorted_index_bounds(self):
+
+    """ Test inclusive, exclusive and zero bounds against sorted indexes """
+
+    root = model.Key(SampleModel, 'sorted-bounds')
+    for number in (-1, 0, 1, 2, 3):
+      SampleModel(key=model.Key(SampleModel, number + 2, parent=root),
+                  string="bounds", number=number).put(adapter=self.subject())
+
+    def numbers(*filters):
+      q = SampleModel.query(ancestor=root, limit=50)
+      for _filter in filters: q = q.filter(_filter)
+      return sorted((r.number for r in q.fetch(adapter=self.subject())))
+
+    assert numbers(SampleModel.number > 0) == [1, 2, 3]
+    assert numbers(SampleModel.number >= 0) == [0, 1, 2, 3]
+    assert numbers(SampleModel.number < 0) == [-1]
+    assert numbers(SampleModel.number <= 0) == [-1, 0]
+    assert numbers(SampleModel.number == 0) == [0]
+    assert numbers(SampleModel.number > 0, SampleModel.number <= 2) == [1, 2]
+
+    # indexes stay ordered, and entries are dropped on delete
+    index = inmemory._metadata['__index__'][('SampleModel', 'number')]
+    assert list(index) == sorted(index)
+    model.Key(SampleModel, 2, parent=root).delete(adapter=self.subject())
+    assert numbers(SampleModel.number >= 0) == [1, 2, 3]
+
+  def test_query_paging(self):
+
+    """ Test offset and limit are applied after filtering and sorting """
+
+    root = model.Key(SampleModel, 'paging')
+    for number in xrange(10):
+      SampleModel(key=model.Key(SampleModel, number + 1, parent=root),
+                  string="odd" if number % 2 else "even",
+                  number=number).put(adapter=self.subject())
+
+    def numbers(q, **options):
+      return [r.number for r in q.fetch(adapter=self.subject(), **options)]
+
+    # sorted by an indexed property
+    q = SampleModel.query(ancestor=root).sort(+SampleModel.number)
+    assert numbers(q, offset=2, limit=3) == [2, 3, 4]
+    q = SampleModel.query(ancestor=root).sort(-SampleModel.number)
+    assert numbers(q, offset=8, limit=5) == [1, 0]
+
+    # paged after in-memory filters
+    q = SampleModel.query(ancestor=root).filter(SampleModel.string != "odd")
+    assert len(numbers(q, limit=3)) == 3
+    assert len(numbers(q, offset=3, limit=3)) == 2
+    assert all((n % 2 == 0 for n in numbers(q, offset=1, limit=10)))
+
+    # overwrites move entities in sorted indexes, rather than adding them twice
+    for number in xrange(10):
+      SampleModel(key=model.Key(SampleModel, number + 1, parent=root),
+                  string="moved", number=number + 10).put(
+                    adapter=self.subject())
+
+    q = SampleModel.query(ancestor=root).sort(+SampleModel.number)
+    assert numbers(q, limit=20) == range(10, 20)
+    q = SampleModel.query(ancestor=root).filter(SampleModel.string == "odd")
+    assert numbers(q) == []
+
+  def test_snapshot_restore(self):
+
+    """ Test warm-starting in-memory state from a snapshot """
+
+    root = model.Key(SampleModel, 'snapshot')
+    keys = [SampleModel(key=model.Key(SampleModel, number + 1, parent=root),
+                        string="snapshot", number=number,
+                        date=datetime.datetime(2014, 7, number + 1)).put(
+                          adapter=self.subject()) for number in xrange(3)]
+
+    path = os.path.join(tempfile.mkdtemp(), 'snapshot')
+    try:
+      assert self.subject.snapshot(path) >= 3
+
+      # lose an entity, then warm-start from the snapshot
+      keys[0].delete(adapter=self.subject())
+      assert self.subject.restore(path) >= 3
+
+      entity = keys[0].get(adapter=self.subject())
+      assert entity.number == 0 and entity.key == keys[0]
+      assert entity.key.parent == root
+      assert entity.date == datetime.datetime(2014, 7, 1)
+
+      q = SampleModel.query(ancestor=root).filter(SampleModel.number >= 1)
+      assert sorted((r.number for r in q.fetch(
+        limit=10, adapter=self.subject()))) == [1, 2]
+
+      # files that aren't snapshots are refused
+      with open(path, 'wb') as handle:
+        handle.write('not a snapshot, at all')
+      with self.assertRaises(RuntimeError):
+        self.subject.restore(path)
+
+      # ... as are empty ones
+      open(path, 'wb').close()
+      with self.assertRaises(RuntimeError):
+        self.subject.restore(path)
+
+      # snapshots written from several threads at once are complete
+      threads = [threading.Thread(target=self.subject.snapshot, args=(
+        path,)) for i in xrange(8)]
+      for thread in threads: thread.start()
+      for thread in threads: thread.join()
+      assert self.subject.restore(path) >= 3
+      assert os.listdir(os.path.dirname(path)) == ['snapshot']
+    finally:
+      shutil.rmtree(os.path.dirname(path))
+
+  def test_threadsafe(self):
+
+    """ Test striped locking, under concurrent reads and writes """
+
+    from canteen.model.adapter import benchmark
+
+    config = self.subject.EngineConfig
+    assert not config.threadsafe
+
+    config.threadsafe = True
+    try:
+      stripe = self.subject.lock('SampleModel')
+      assert stripe is self.subject.lock('SampleModel')
+      assert stripe is not self.subject.lock('SampleKind')
+      with self.subject.exclusive():
+        with stripe:  # reentrant
+          pass
+    finally:
+      config.threadsafe = False
+
+    results = benchmark.scaling((1, 4), count=50, reads=200)
+    assert not config.threadsafe
+
+    assert [r['threads'] for r in results] == [1, 4]
+    for result in results:
+      assert result['errors'] == 0
+      assert result['operations'] == result['threads'] * 200
+      assert result['ops_per_sec'] > 0
+
+  def test_threadsafe_metadata(self):
+
+    """ Test counts shared across kinds, under concurrent writes """
+
+    config = self.subject.EngineConfig
+    config.threadsafe = True
+    try:
+      before = (inmemory._metadata['ops'].get('put', 0),
+                inmemory._metadata['global'].get('entity_count', 0),
+                len(inmemory._metadata['keys']))
+
+      def _write(model_class, prefix):
+        """ write a batch of named entities of one kind """
+        for i in xrange(100):
+          model_class(key=model.Key(model_class, '%s-%s' % (prefix, i)),
+                      string='counted').put(adapter=self.subject())
+
+      threads = [threading.Thread(target=_write, args=(
+        model_class, 'counted-%s' % n)) for n, model_class in (
+          enumerate((SampleModel, SamplePackedModel) * 2))]
+      for thread in threads: thread.start()
+      for thread in threads: thread.join()
+    finally:
+      config.threadsafe = False
+
+    assert (inmemory._metadata['ops']['put'],
+            inmemory._metadata['global']['entity_count'],
+            len(inmemory._metadata['keys'])) == tuple(
+              count + 400 for count in before)
+
+  def test_packed_storage(self):
+
+    """ Test storing entities packed, and reading them into fresh models """
+
+    key = SamplePackedModel(string='packed', integer=[1, 2], number=3).put(
+      adapter=self.subject())
+
+    # held as a tuple of values, ordered by property name
+    assert inmemory._datastore[key.flatten(True)[1]] == (
+      (1, 2), 3, 'packed')
+
+    entity = key.get(adapter=self.subject())
+    assert entity.key == key and entity.integer == [1, 2]
+
+    # every read builds a fresh model, unaffected by changes to the last
+    entity.integer.append(3)
+    entity.number = 4
+    fresh = key.get(adapter=self.subject())
+    assert fresh is not entity
+    assert fresh.integer == [1, 2] and fresh.number == 3
+
+    # unset values stay unset, and queries read packed entities
+    bare = SamplePackedModel(string='packed').put(adapter=self.subject())
+    assert bare.get(adapter=self.subject()).string == 'packed'
+    q = SamplePackedModel.query().filter(SamplePackedModel.number >= 3)
+    assert [e.key for e in q.fetch(limit=10, adapter=self.subject())] == [key]
+
+    entity = bare.get(adapter=self.subject())
+    assert entity.number is None
+    entity.put(adapter=self.subject())
+
+
+class SharedMemoryAdapterTests(test.FrameworkTest):
+
+  """ Tests `model.adapter.inmemory.SharedMemoryAdapter` """
+
+  subject = inmemory.SharedMemoryAdapter
+
+  def setUp(self):
+
+    """ Set up a segment file, and act as the writer """
+
+    config = self.subject.EngineConfig
+    self.path = os.path.join(tempfile.mkdtemp(), 'segment')
+    self.saved = (inmemory._datastore, inmemory._metadata, inmemory._graph)
+    self.config = (config.segment_path, config.writer, config.refresh_interval)
+    config.segment_path, config.writer, config.refresh_interval = (
+      self.path, True, 0)
+
+  def tearDown(self):
+
+    """ Restore in-memory state, and remove the segment file """
+
+    config = self.subject.EngineConfig
+    self.subject.mount(*self.saved)
+    inmemory._segment = None
+    config.segment_path, config.writer, config.refresh_interval = self.config
+    shutil.rmtree(os.path.dirname(self.path))
+
+  def test_publish_and_attach(self):
+
+    """ Test readers mapping segments published by the writer """
+
+    config = self.subject.EngineConfig
+    first = SamplePackedModel(string='shared', integer=[1], number=7).put(
+      adapter=self.subject())
+    assert self.subject.publish() >= 1
+
+    # readers serve gets and queries from the segment
+    config.writer = False
+
+    entity = first.get(adapter=self.subject())
+    assert isinstance(inmemory._datastore, inmemory.Segment)
+    assert entity.key == first and entity.integer == [1]
+
+    q = SamplePackedModel.query().filter(SamplePackedModel.number == 7)
+    assert first in [e.key for e in q.fetch(limit=10, adapter=self.subject())]
+
+    # ... and refuse writes
+    with self.assertRaises(RuntimeError):
+      SamplePackedModel(string='refused').put(adapter=self.subject())
+    with self.assertRaises(RuntimeError):
+      first.delete(adapter=self.subject())
+
+    # newer segments are picked up by readers as they're published
+    config.writer = True
+    self.subject.mount(*self.saved)
+    second = SamplePackedModel(string='shared', number=8).put(
+      adapter=self.subject())
+    self.subject.publish()
+
+    config.writer = False
+    assert second.get(adapter=self.subject()).number == 8
+    assert first.get(adapter=self.subject()).number == 7
+    assert model.Key(SamplePackedModel, 'missing').get(
+      adapter=self.subject()) is None
+
+  def test_concurrent_publish(self):
+
+    """ Test publishing from several threads at once """
+
+    keys = [SamplePackedModel(string='concurrent', number=i).put(
+      adapter=self.subject()) for i in xrange(20)]
+
+    threads = [threading.Thread(target=self.subject.publish) for (
+      i) in xrange(8)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+
+    # readers map a complete segment, and nothing is left aside
+    self.subject.EngineConfig.writer = False
+    assert [key.get(adapter=self.subject()).number for key in keys] == (
+      range(20))
+    assert os.listdir(os.path.dirname(self.path)) == ['segment']
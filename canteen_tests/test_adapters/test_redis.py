@@ -15,8 +15,13 @@
 
 """
 
-# redis adapter & model API
+# stdlib
+import time
+
+# canteen test, redis adapter & model API
+from canteen import test
 from canteen import model
+from canteen.model import query
 from canteen.model.adapter import redis as rapi
 
 # abstract test bases
@@ -28,6 +33,11 @@ try:
 except ImportError:  # pragma: no cover
   fakeredis = None
 
+try:
+  import lupa  # fakeredis needs `lupa` to run Lua scripts
+except ImportError:  # pragma: no cover
+  lupa = None
+
 
 if fakeredis:
 
@@ -80,6 +90,538 @@ if fakeredis:
       ss = SampleEntity.get(x, adapter=self.subject())
       assert not ss, "should have deleted entity but instead got '%s'" % ss
 
+    def test_put_multi(self):
+
+      """ Test saving a batch of entities to Redis with `RedisAdapter` """
+
+      class SampleBatchEntity(model.Model):
+
+        """ quick sample entity """
+
+        __adapter__ = rapi.RedisAdapter
+
+        string = str, {'indexed': True}
+        number = int, {'indexed': False}
+
+      entities = [SampleBatchEntity(string='batch', number=i)
+                  for i in xrange(5)]
+      keys = SampleBatchEntity.put_multi(entities, adapter=self.subject())
+
+      assert len(keys) == 5
+      assert len(set((k.id for k in keys))) == 5
+      assert all((e.key is k for e, k in zip(entities, keys)))
+
+      # should be able to fetch them all back, in order
+      fetched = list(SampleBatchEntity.get_multi(keys, adapter=self.subject()))
+      assert [e.number for e in fetched] == range(5)
+
+      # indexes should have been written as well
+      found = SampleBatchEntity.query().filter(
+        SampleBatchEntity.string == 'batch').fetch(adapter=self.subject())
+      assert len(found) == 5
+
+      # a following single put should not collide with allocated IDs
+      single = SampleBatchEntity(string='single', number=5).put(
+        adapter=self.subject())
+      assert single.id not in set((k.id for k in keys))
+
+    def test_leased_ids(self):
+
+      """ Test allocating IDs locally from blocks leased from Redis """
+
+      class SampleLeasedEntity(model.Model):
+
+        """ quick sample entity """
+
+        __adapter__ = rapi.RedisAdapter
+        __id_block__ = 4
+
+        string = str, {'indexed': False}
+
+      rapi._id_leases.pop('SampleLeasedEntity', None)
+      lease = rapi.RedisAdapter.id_lease('SampleLeasedEntity')
+      lease.window = 60.0  # blocks are used up quickly, so they'll grow
+
+      try:
+        keys = [SampleLeasedEntity(string='leased').put(adapter=self.subject())
+                for i in xrange(6)]
+        assert [k.id for k in keys] == range(1, 7)
+
+        # two blocks were leased: 4 IDs, then 8
+        assert rapi.RedisAdapter.increment_ids(*(
+          model.Key, 'SampleLeasedEntity', 0)) == 12
+        assert lease.size == 8
+
+        keys = SampleLeasedEntity.put_multi([
+          SampleLeasedEntity(string='leased') for i in xrange(3)],
+          adapter=self.subject())
+        assert [k.id for k in keys] == [7, 8, 9]
+
+        # batches larger than a block lease as many IDs as they need
+        keys = SampleLeasedEntity.put_multi([
+          SampleLeasedEntity(string='leased') for i in xrange(20)],
+          adapter=self.subject())
+        assert [k.id for k in keys] == range(13, 33)
+        assert lease.size == 16
+
+        assert SampleLeasedEntity.get(keys[-1], adapter=self.subject())
+      finally:
+        rapi._id_leases.pop('SampleLeasedEntity', None)
+
+    def test_native_expiry(self):
+
+      """ Test tracking expiring entities, and expiring them in Redis """
+
+      class SampleExpiringEntity(model.Model):
+
+        """ quick sample entity """
+
+        __adapter__ = rapi.RedisAdapter
+        __ttl__ = 60
+
+        string = str, {'indexed': True}
+
+      key = SampleExpiringEntity(string='expiring').put(adapter=self.subject())
+      encoded = rapi.RedisAdapter.encode_key(*key.flatten(True))
+
+      expires = rapi._mock_redis.zscore(*(
+        '__expiry__::SampleExpiringEntity', encoded))
+      assert 0 < expires - time.time() * 1000 <= 60000
+
+      if self.mode in (rapi.RedisMode.toplevel_blob,
+                       rapi.RedisMode.hashkey_hash):
+        assert 0 < rapi._mock_redis.pttl(encoded) <= 60000
+
+    def test_get_multi_reuses_keys(self):
+
+      """ Test that batch reads copy, rather than share, the caller's keys """
+
+      keys = [test_abstract.SampleModel(string='reused', number=i).put(
+        adapter=self.subject()) for i in xrange(3)]
+      requested = [model.Key(key.kind, key.id) for key in keys]
+
+      entities = test_abstract.SampleModel.get_multi(*(
+        requested,), adapter=self.subject())
+      assert [entity.number for entity in entities] == [0, 1, 2]
+      for entity, key in zip(entities, requested):
+        assert entity.key == key and entity.key is not key
+        assert entity.key.__persisted__ and not key.__persisted__
+
+      # the same key requested twice yields two distinctly-keyed entities
+      first, second = test_abstract.SampleModel.get_multi(*(
+        [requested[0], requested[0]],), adapter=self.subject())
+      assert first.key is not second.key
+      assert first.key.owner is first and second.key.owner is second
+
+    def test_write_behind(self):
+
+      """ Test deferring index writes until they're flushed """
+
+      class SampleDeferredEntity(model.Model):
+
+        """ quick sample entity """
+
+        __adapter__ = rapi.RedisAdapter
+        __write_behind__ = True
+
+        string = str, {'indexed': True}
+        number = float, {'indexed': True}
+
+      interval = self.subject.EngineConfig.write_behind_interval
+      self.subject.EngineConfig.write_behind_interval = 0  # flush by hand
+
+      try:
+        _query = lambda *filters: [entity.key.id for entity in (
+          SampleDeferredEntity.query(*filters).fetch(
+            limit=10, adapter=self.subject()))]
+
+        s = SampleDeferredEntity(key=model.Key(SampleDeferredEntity, 'd'),
+                                 string='before', number=1.5)
+        s.put(adapter=self.subject())
+
+        # the entity is written, but not yet indexed
+        assert SampleDeferredEntity.get(s.key, adapter=self.subject())
+        assert not _query(SampleDeferredEntity.string == 'before')
+
+        # repeated writes are indexed as of the latest one
+        s.string = 'after'
+        s.put(adapter=self.subject())
+        assert self.subject.flush_indexes() == 2
+        assert not _query(SampleDeferredEntity.string == 'before')
+        assert _query(SampleDeferredEntity.string == 'after') == ['d']
+        assert _query(SampleDeferredEntity.number > 1.0) == ['d']
+        assert self.subject.flush_indexes() == 0
+
+        # entities deleted before a flush have their indexes cleaned
+        s.string = 'deleted'
+        s.put(adapter=self.subject())
+        s.key.delete(adapter=self.subject())
+        assert self.subject.flush_indexes() == 1
+        assert not _query(SampleDeferredEntity.string == 'after')
+        assert not _query(SampleDeferredEntity.string == 'deleted')
+
+        # batches that fail to apply are queued again, rather than lost
+        s = SampleDeferredEntity(key=model.Key(SampleDeferredEntity, 'e'),
+                                 string='retried', number=2.5)
+        s.put(adapter=self.subject())
+
+        def _failing(cls, queued, shard=None, claimed=None):
+          """ fail to apply index writes """
+          raise RuntimeError('applying index writes failed')
+
+        apply_indexes = rapi.RedisAdapter.__dict__['apply_indexes']
+        rapi.RedisAdapter.apply_indexes = classmethod(_failing)
+        try:
+          with self.assertRaises(RuntimeError):
+            self.subject.flush_indexes()
+        finally:
+          rapi.RedisAdapter.apply_indexes = apply_indexes
+
+        assert rapi._mock_redis.lrange(self.subject._pending_prefix, 0, -1) == [
+          self.subject.encode_key(*s.key.flatten(True))]
+        assert not _query(SampleDeferredEntity.string == 'retried')
+        assert self.subject.flush_indexes() == 1
+        assert _query(SampleDeferredEntity.string == 'retried') == ['e']
+        assert not rapi._mock_redis.keys(
+          self.subject._pending_prefix + '*')
+
+        s.key.delete(adapter=self.subject())
+        assert self.subject.flush_indexes() == 0
+
+      finally:
+        self.subject.EngineConfig.write_behind_interval = interval
+
+    def test_composite_index_writes(self):
+
+      """ Test maintaining composite indexes across overwrites """
+
+      class SampleCompositeEntity(model.Model):
+
+        """ quick sample entity """
+
+        __adapter__ = rapi.RedisAdapter
+        __indexes__ = (('string', 'number'),)
+
+        string = str
+        number = float
+
+      s = SampleCompositeEntity(key=model.Key(SampleCompositeEntity, 'c'),
+                                string='before', number=1.5)
+      k = s.put(adapter=self.subject())
+      encoded = self.subject.encode_key(*k.flatten(True))
+
+      before, after = (self.subject.composite_key(*(
+        'SampleCompositeEntity', ('string', 'number'), value)) for (
+          value) in ('before', 'after'))
+      assert rapi._mock_redis.zscore(before, encoded) == 1.5
+
+      s.string = 'after'
+      s.put(adapter=self.subject())
+      assert rapi._mock_redis.zscore(before, encoded) is None
+      assert rapi._mock_redis.zscore(after, encoded) == 1.5
+
+    def test_clean_indexes(self):
+
+      """ Test that deletes and overwrites clean up stale index entries """
+
+      class SampleCleanEntity(model.Model):
+
+        """ quick sample entity """
+
+        __adapter__ = rapi.RedisAdapter
+
+        string = str, {'indexed': True}
+        number = float, {'indexed': True}
+
+      s = SampleCleanEntity(key=model.Key(SampleCleanEntity, 'clean'),
+                            string='before', number=1.5)
+      k = s.put(adapter=self.subject())
+      encoded = self.subject.encode_key(*k.flatten(True))
+
+      def _query(string):
+        """ query by string property """
+        return SampleCleanEntity.query().filter(
+          SampleCleanEntity.string == string).fetch(adapter=self.subject())
+
+      assert len(_query('before')) == 1
+
+      # overwrite with a new value: old index entry should be gone
+      SampleCleanEntity(key=model.Key(SampleCleanEntity, 'clean'),
+                        string='after', number=2.5).put(adapter=self.subject())
+
+      assert not _query('before')
+      assert len(_query('after')) == 1
+
+      # delete: no index should still reference the key
+      SampleCleanEntity.get(k, adapter=self.subject()).delete(
+        adapter=self.subject())
+
+      assert not _query('after')
+      assert not rapi._mock_redis.zscore(
+        '__index__::SampleCleanEntity.number', encoded)
+      assert not rapi._mock_redis.sismember(
+        '__kind__::SampleCleanEntity', encoded)
+      assert not rapi._mock_redis.exists(self.subject._reverse_key(encoded))
+
+    def test_overwrite_race(self):
+
+      """ Test that overwrites racing between reading reverse indexes and
+          writing are retried, rather than leaving stale index entries """
+
+      class SampleRacingEntity(model.Model):
+
+        """ quick sample entity """
+
+        __adapter__ = rapi.RedisAdapter
+
+        string = str, {'indexed': True}
+
+      key = model.Key(SampleRacingEntity, 'racing')
+      SampleRacingEntity(key=key, string='first').put(adapter=self.subject())
+
+      commit, raced = rapi.RedisAdapter.__dict__['commit'], []
+
+      def _racing_commit(cls, pipeline):
+        """ overwrite the entity once, just before a transactional write """
+        if getattr(pipeline, 'transaction', False) and not raced:
+          raced.append(pipeline)
+          SampleRacingEntity(key=model.Key(SampleRacingEntity, 'racing'),
+                             string='racing').put(adapter=self.subject())
+        return commit.__func__(cls, pipeline)
+
+      rapi.RedisAdapter.commit = classmethod(_racing_commit)
+      try:
+        SampleRacingEntity(key=model.Key(SampleRacingEntity, 'racing'),
+                           string='last').put(adapter=self.subject())
+      finally:
+        rapi.RedisAdapter.commit = commit
+
+      assert raced
+      for string, count in (('first', 0), ('racing', 0), ('last', 1)):
+        assert len(SampleRacingEntity.query().filter(
+          SampleRacingEntity.string == string).fetch(
+            adapter=self.subject())) == count
+
+    def test_plan_query_script(self):
+
+      """ Test planning a server-side query script from resolved indexes """
+
+      keys, args = self.subject.plan_query_script({
+        ('Z', 'score'): [(query.GREATER_THAN, 1, None),
+                         (query.LESS_THAN_EQUAL_TO, 5, None)]}, {
+        ('S', 'color'): [(query.EQUALS, 'blue', None)]},
+        query.QueryOptions(limit=10, offset=2, keys_only=True))
+
+      assert keys == ('score', 'color')
+      assert args == (2, 10, 1, '(1.0', 5.0)
+
+      # inequality filters can't be resolved by indexes alone
+      assert self.subject.plan_query_script({}, {
+        ('S', 'color'): [(query.NOT_EQUALS, 'blue', None)]},
+        query.QueryOptions()) is None
+
+    def test_query_script(self):
+
+      """ Test executing a planned query with the server-side query script """
+
+      class SampleScriptEntity(model.Model):
+
+        """ quick sample entity """
+
+        __adapter__ = rapi.RedisAdapter
+
+        string = str, {'indexed': True}
+        number = float, {'indexed': True}
+
+      SampleScriptEntity.put_multi([
+        SampleScriptEntity(string='script', number=float(i))
+        for i in xrange(10)], adapter=self.subject())
+
+      if lupa:
+        keys, args = self.subject.plan_query_script({
+          ('Z', '__index__::SampleScriptEntity.number'): [
+            (query.GREATER_THAN_EQUAL_TO, 3, None)]}, {
+          ('S', '__kind__::SampleScriptEntity'): [
+            (query.EQUALS, 'SampleScriptEntity', None)]},
+          query.QueryOptions(limit=4, offset=1))
+
+        page = rapi._mock_redis.eval(*((
+          rapi._QUERY_SCRIPT, len(keys)) + keys + args))
+        assert len(page) == 4
+        assert page == sorted(page)
+
+        # matching entities are fetched once the page is known
+        entities = self.subject.execute_query_script(*(
+          SampleScriptEntity, (keys, args), query.QueryOptions()))
+        assert [self.subject.encode_key(*entity.key.flatten(True)) for (
+          entity) in entities] == page
+        assert all((entity.number >= 3 for entity in entities))
+
+    def test_scan_index(self):
+
+      """ Test walking sorted and unsorted indexes in bounded batches """
+
+      rapi._mock_redis.sadd('__scan__::set', *('m%s' % i for i in xrange(7)))
+      rapi._mock_redis.zadd('__scan__::sorted', **dict((
+        ('m%s' % i, float(i)) for i in xrange(7))))
+
+      batches = list(self.subject.scan_index('__scan__::set', batch_size=3))
+      members = [m for batch in batches for m in batch]
+      assert sorted(members) == ['m%s' % i for i in xrange(7)]
+
+      batches = list(self.subject.scan_index(
+        '__scan__::sorted', ('-inf', '+inf'), batch_size=3, offset=2))
+      assert [len(batch) for batch in batches] == [3, 2]
+      members = [m for batch in batches for m in batch]
+      assert members == ['m%s' % i for i in xrange(2, 7)]
+
+    def test_stream_query(self):
+
+      """ Test streaming single-index query results with a limit """
+
+      class SampleStreamEntity(model.Model):
+
+        """ quick sample entity """
+
+        __adapter__ = rapi.RedisAdapter
+
+        string = str, {'indexed': True}
+        number = float, {'indexed': True}
+
+      SampleStreamEntity.put_multi([
+        SampleStreamEntity(string='stream', number=float(i))
+        for i in xrange(12)], adapter=self.subject())
+
+      q = SampleStreamEntity.query().filter(SampleStreamEntity.number >= 4.0)
+      results = q.fetch(limit=5, adapter=self.subject())
+      assert [e.number for e in results] == [4.0, 5.0, 6.0, 7.0, 8.0]
+
+      stream = self.subject().execute_query(*(
+        SampleStreamEntity, ([SampleStreamEntity.string == 'stream'], []),
+        query.QueryOptions(limit=3, keys_only=True)), stream=True)
+      assert not isinstance(stream, list)
+      assert len(list(stream)) == 3
+
+      streamed = SampleStreamEntity.query().filter(
+        SampleStreamEntity.string == 'stream').iter(adapter=self.subject())
+      assert len(list(streamed)) == 12
+
+    def test_complement_bounds(self):
+
+      """ Test resolving score ranges outside of a pair of bounds """
+
+      assert self.subject.complement_bounds(('-inf', '+inf')) == []
+      assert self.subject.complement_bounds((1.0, '(5.0')) == [
+        ('-inf', '(1.0'), ('5.0', '+inf')]
+
+    def test_intersect_query(self):
+
+      """ Test intersecting range and equality filters with a limit """
+
+      class SampleRangeEntity(model.Model):
+
+        """ quick sample entity """
+
+        __adapter__ = rapi.RedisAdapter
+
+        string = str, {'indexed': True}
+        number = float, {'indexed': True}
+        other = float, {'indexed': True}
+
+      SampleRangeEntity.put_multi([
+        SampleRangeEntity(string='even' if i % 2 else 'odd',
+                          number=float(i), other=float(20 - i))
+        for i in xrange(20)], adapter=self.subject())
+
+      # two ranges across different properties
+      q = SampleRangeEntity.query().filter(
+        SampleRangeEntity.number >= 4.0).filter(
+        SampleRangeEntity.other > 10.0)
+      results = q.fetch(adapter=self.subject())
+      assert sorted(e.number for e in results) == [4.0, 5.0, 6.0, 7.0, 8.0, 9.0]
+
+      # range mixed with an equality set, paged server-side
+      q = SampleRangeEntity.query().filter(
+        SampleRangeEntity.number <= 15.0).filter(
+        SampleRangeEntity.string == 'odd')
+      results = q.fetch(limit=3, offset=2, adapter=self.subject())
+      assert [e.number for e in results] == [4.0, 6.0, 8.0]
+
+      keys = q.fetch(limit=3, offset=2, keys_only=True, adapter=self.subject())
+      assert keys == [e.key for e in results]
+
+      # no temporary keys are left behind
+      assert not rapi._mock_redis.keys('__temp__*')
+
+      # single bounds are inclusive (or not) as specified, even with sorts
+      q = SampleRangeEntity.query().filter(
+        SampleRangeEntity.number >= 18.0).sort(-SampleRangeEntity.number)
+      assert [e.number for e in q.fetch(adapter=self.subject())] == [
+        19.0, 18.0]
+
+    def test_sorted_query(self):
+
+      """ Test index-backed and multi-key sorts, paged server-side """
+
+      class SampleSortedEntity(model.Model):
+
+        """ quick sample entity """
+
+        __adapter__ = rapi.RedisAdapter
+
+        string = str, {'indexed': True}
+        number = float, {'indexed': True}
+        other = float, {'indexed': True}
+
+      SampleSortedEntity.put_multi([
+        SampleSortedEntity(string='sorted', number=float(i / 3),
+                           other=float(i)) for i in xrange(12)],
+        adapter=self.subject())
+
+      assert self.subject.sort_index(*(
+        SampleSortedEntity, SampleSortedEntity.number)) == (
+          '__index__::SampleSortedEntity.number')
+      assert self.subject.sort_index(*(
+        SampleSortedEntity, SampleSortedEntity.string)) is None
+
+      # "newest" first: only the page is fetched
+      fetched, get_multi = [], self.subject.__dict__['get_multi']
+
+      def _get_multi(cls, keys, **kwargs):
+        """ record fetched keys """
+        keys = list(keys)
+        fetched.extend(keys)
+        return get_multi.__func__(cls, keys, **kwargs)
+
+      self.subject.get_multi = classmethod(_get_multi)
+      try:
+        q = SampleSortedEntity.query().sort(-SampleSortedEntity.other)
+        results = q.fetch(limit=3, adapter=self.subject())
+      finally:
+        self.subject.get_multi = get_multi
+
+      assert [e.other for e in results] == [11.0, 10.0, 9.0]
+      assert len(fetched) == 3
+
+      # filtered and sorted, by different properties
+      q = SampleSortedEntity.query().filter(
+        SampleSortedEntity.string == 'sorted').filter(
+        SampleSortedEntity.number < 3.0).sort(+SampleSortedEntity.other)
+      results = q.fetch(limit=4, offset=2, adapter=self.subject())
+      assert [e.other for e in results] == [2.0, 3.0, 4.0, 5.0]
+
+      # multi-key sorts, with ties across the edges of the page
+      q = SampleSortedEntity.query().sort(+SampleSortedEntity.number).sort(
+        -SampleSortedEntity.other)
+      results = q.fetch(limit=4, offset=2, adapter=self.subject())
+      assert [e.other for e in results] == [0.0, 5.0, 4.0, 3.0]
+
+      keys = q.fetch(limit=4, offset=2, keys_only=True, adapter=self.subject())
+      assert keys == [e.key for e in results]
+
+      # no temporary keys are left behind
+      assert not rapi._mock_redis.keys('__temp__*')
+
 
   class RedisAdapterTopLevelBlobTests(test_abstract.DirectedGraphAdapterTests,
                                       RedisSetupTeardown):
@@ -157,7 +699,733 @@ if fakeredis:
       rapi.RedisAdapter.EngineConfig.mode = rapi.RedisMode.toplevel_blob
 
 
-  # @TODO(sgammon): add hashkey_hash testing when that mode is supported
+  class RedisAdapterHashKeyHashTests(test_abstract.DirectedGraphAdapterTests,
+                                     RedisSetupTeardown):
+
+    """ Tests `model.adapter.redis.Redis` in ``hashkey_hash`` mode """
+
+    __abstract__ = False
+    subject = rapi.RedisAdapter
+    mode = rapi.RedisMode.hashkey_hash
+
+    @classmethod
+    def setUpClass(cls):
+      """ Set Redis into testing mode. """
+
+      rapi._mock_redis = fakeredis.FakeStrictRedis()
+      rapi._mock_redis.flushall()
+      rapi.RedisAdapter.__testing__ = True
+      rapi.RedisAdapter.EngineConfig.mode = rapi.RedisMode.hashkey_hash
+
+    @classmethod
+    def tearDownClass(cls):
+      """ Set Redis back into non-testing mode. """
+
+      rapi.RedisAdapter.__testing__ = False
+      rapi.RedisAdapter.EngineConfig.mode = rapi.RedisMode.toplevel_blob
+
+    def test_entity_stored_as_hash(self):
+
+      """ Test that entities are stored as one hash field per property """
+
+      s, x, SampleEntity = self.test_put_entity()
+      joined, flattened = x.flatten(True)
+      stored = rapi._mock_redis.hgetall(self.subject.encode_key(joined,
+                                                                flattened))
+
+      assert set(stored.keys()) == set(('string', 'number'))
+
+    def test_partial_put(self):
+
+      """ Test that a persisted entity only writes dirty properties """
+
+      s, x, SampleEntity = self.test_put_entity()
+      joined, flattened = x.flatten(True)
+      encoded = self.subject.encode_key(joined, flattened)
+
+      # mutate a field behind the adapter's back, which should survive
+      rapi._mock_redis.hset(encoded, 'number',
+                            self.subject.deflate(10))
+
+      s.string = 'hello'
+      s.put(adapter=self.subject())
+
+      ss = SampleEntity.get(x, adapter=self.subject())
+      assert ss.string == 'hello'
+      assert ss.number == 10
+
+    def test_projected_get(self):
+
+      """ Test fetching a subset of properties via `HMGET` """
+
+      s, x, SampleEntity = self.test_put_entity()
+
+      ss = SampleEntity.get(x, adapter=self.subject(), projection=('string',))
+      assert ss.string == 'hi'
+      assert ss.number is None
+
+      ss, = SampleEntity.get_multi([x], adapter=self.subject(),
+                                   projection=('number',))
+      assert ss.string is None
+      assert ss.number == 5
+
+    def test_projected_put(self):
+
+      """ Test that entities fetched with a projection can't be put back """
+
+      class SampleProjectedEntity(model.Model):
+
+        """ quick sample entity """
+
+        __adapter__ = rapi.RedisAdapter
+
+        string = str, {'indexed': True}
+        number = int, {'indexed': True}
+
+      _query = lambda *filters: [entity.key.id for entity in (
+        SampleProjectedEntity.query(*filters).fetch(
+          limit=10, adapter=self.subject()))]
+
+      key = SampleProjectedEntity(key=model.Key(SampleProjectedEntity, 'p'),
+                                  string='before', number=5).put(
+                                    adapter=self.subject())
+
+      for projected in (
+            SampleProjectedEntity.get(key, adapter=self.subject(), projection=(
+              'string',)),
+            list(SampleProjectedEntity.get_multi([key], adapter=(
+              self.subject()), projection=('string',)))[0]):
+        projected.string = 'after'
+        with self.assertRaises(ValueError):
+          projected.put(adapter=self.subject())
+
+      # indexes of the properties that weren't fetched are left intact
+      assert _query(SampleProjectedEntity.number == 5) == ['p']
+      assert _query(SampleProjectedEntity.string == 'before') == ['p']
+
+      entity = SampleProjectedEntity.get(key, adapter=self.subject())
+      entity.string = 'after'
+      entity.put(adapter=self.subject())
+      assert _query(SampleProjectedEntity.string == 'after') == ['p']
+      assert _query(SampleProjectedEntity.number == 5) == ['p']
+
+
+  class RedisConnectionPoolTests(test.FrameworkTest):
+
+    """ Tests pooled, per-profile connections in `RedisAdapter` """
+
+    def setUp(self):
+      """ Stash configured server profiles and pools. """
+
+      self._profiles = dict(rapi._server_profiles)
+      self._pools = dict(rapi._connection_pools)
+
+    def tearDown(self):
+      """ Restore configured server profiles and pools. """
+
+      for target, original in ((rapi._server_profiles, self._profiles),
+                               (rapi._connection_pools, self._pools)):
+        target.clear()
+        target.update(original)
+
+    def test_pool_per_profile(self):
+
+      """ Test that pools are created once per profile, then shared """
+
+      rapi._server_profiles['pooled'] = {
+        'host': '127.0.0.1', 'port': 6379, 'max_connections': 5}
+      rapi._server_profiles['alias'] = 'pooled'
+
+      pool = rapi.RedisAdapter.pool('pooled')
+      assert isinstance(pool, rapi.PooledConnections)
+      assert isinstance(pool, rapi.redis.ConnectionPool)
+      assert pool.max_connections == 5
+      assert rapi.RedisAdapter.pool('pooled') is pool
+
+      # pointers resolve to the config they point at
+      assert rapi.RedisAdapter.pool('alias').max_connections == 5
+
+    def test_pool_blocking(self):
+
+      """ Test building a blocking pool """
+
+      rapi._server_profiles['blocking'] = {
+        'host': '127.0.0.1', 'blocking': True, 'timeout': 1}
+
+      pool = rapi.RedisAdapter.pool('blocking')
+      assert isinstance(pool, rapi.redis.BlockingConnectionPool)
+      assert pool.timeout == 1
+
+    def test_pool_unix_socket(self):
+
+      """ Test building a pool that connects over a unix socket """
+
+      rapi._server_profiles['unix'] = {
+        'unix_socket_path': '/tmp/canteen-nonexistent.sock'}
+
+      pool = rapi.RedisAdapter.pool('unix')
+      assert pool.connection_class is rapi.redis.UnixDomainSocketConnection
+      assert pool.connection_kwargs['path'] == '/tmp/canteen-nonexistent.sock'
+
+    def test_pool_health_check_and_usage(self):
+
+      """ Test pool usage counters and idle connection health checks """
+
+      rapi._server_profiles['checked'] = {
+        'unix_socket_path': '/tmp/canteen-nonexistent.sock',
+        'health_check_interval': 0}
+
+      pool = rapi.RedisAdapter.pool('checked')
+      connection = pool.get_connection('GET')
+      assert pool.usage['in_use'] == 1
+      assert pool.usage['created'] == 1
+
+      pool.release(connection)
+      assert pool.usage['in_use'] == 0
+
+      # idle connection should be checked, and dropped since it's dead
+      assert pool.get_connection('GET') is connection
+      assert pool.usage['health_checks'] == 1
+      assert pool.usage['reconnects'] == 1
+      assert pool.usage['created'] == 1
+
+
+  class RedisBlobFormatTests(test.FrameworkTest):
+
+    """ Tests the framed, codec-tagged blob format """
+
+    def tearDown(self):
+      """ Reset compression settings. """
+
+      rapi.RedisAdapter.EngineConfig.compression = False
+      rapi.RedisAdapter.EngineConfig.compression_threshold = 256
+
+    def test_frame_header(self):
+
+      """ Test that blobs are framed with a version/serializer/codec header """
+
+      blob = rapi.RedisAdapter.deflate({'hello': 'world'})
+      header = ord(blob[1])
+
+      assert blob[0] == rapi._FRAME_MAGIC
+      assert header >> 4 == rapi._FRAME_VERSION
+      assert rapi._SERIALIZERS[(header >> 2) & 0x3] == (
+        rapi.RedisAdapter.serializer.__name__)
+      assert header & 0x3 == 0  # uncompressed
+      assert rapi.RedisAdapter.inflate(blob) == {'hello': 'world'}
+
+      # unknown format versions are refused, rather than guessed at
+      with self.assertRaises(ValueError):
+        rapi.RedisAdapter.inflate(rapi._FRAME_MAGIC + chr(0xf0) + blob[2:])
+
+    def test_compressed_blobs(self):
+
+      """ Test compressing blobs over the threshold, with each codec """
+
+      value = {'text': 'compressible ' * 64}
+      small = {'text': 'tiny'}
+
+      for codec in filter(lambda name: getattr(rapi._support, name), (
+            rapi._CODECS[1:])):
+        rapi.RedisAdapter.EngineConfig.compression = codec
+
+        blob = rapi.RedisAdapter.deflate(value)
+        assert rapi._CODECS[ord(blob[1]) & 0x3] == codec
+        assert len(blob) < len(rapi.RedisAdapter.serializer.dumps(value))
+        assert rapi.RedisAdapter.inflate(blob) == value
+
+        # small blobs aren't worth compressing
+        blob = rapi.RedisAdapter.deflate(small)
+        assert ord(blob[1]) & 0x3 == 0
+        assert rapi.RedisAdapter.inflate(blob) == small
+
+      # unknown codecs are refused
+      rapi.RedisAdapter.EngineConfig.compression = 'bogus'
+      with self.assertRaises(RuntimeError):
+        rapi.RedisAdapter.deflate(value)
+
+    def test_model_compression(self):
+
+      """ Test per-model compression codecs and thresholds """
+
+      class SampleCompressedEntity(model.Model):
+
+        """ quick sample entity """
+
+        __adapter__ = rapi.RedisAdapter
+        __compression__ = 'zlib'
+        __compression_threshold__ = 0
+
+        string = str
+
+      blob = rapi.RedisAdapter.deflate({'string': 'a' * 32}, (
+        SampleCompressedEntity))
+      assert rapi._CODECS[ord(blob[1]) & 0x3] == 'zlib'
+
+      # the engine-wide setting applies otherwise
+      blob = rapi.RedisAdapter.deflate({'string': 'a' * 32})
+      assert ord(blob[1]) & 0x3 == 0
+
+    def test_unframed_blobs(self):
+
+      """ Test reading blobs written before the framed format """
+
+      blob = rapi.RedisAdapter.serializer.dumps({'legacy': True})
+      assert rapi.RedisAdapter.inflate(blob) == {'legacy': True}
+
+
+  class RedisEntityCacheTests(test.FrameworkTest):
+
+    """ Tests the in-process entity cache, and its invalidation """
+
+    def setUp(self):
+      """ Set Redis into testing mode, with caching. """
+
+      rapi._mock_redis = fakeredis.FakeStrictRedis()
+      rapi._entity_cache = None
+      rapi.RedisAdapter.__testing__ = True
+      rapi.RedisAdapter.EngineConfig.cache = True
+      rapi.RedisAdapter.EngineConfig.mode = rapi.RedisMode.toplevel_blob
+
+    def tearDown(self):
+      """ Set Redis back into non-testing mode, without caching. """
+
+      rapi._entity_cache = None
+      rapi.RedisAdapter.__testing__ = False
+      rapi.RedisAdapter.EngineConfig.cache = False
+
+    def _sample(self):
+
+      """ Build a sample model for cache tests. """
+
+      class SampleCachedEntity(model.Model):
+
+        """ quick sample entity """
+
+        __adapter__ = rapi.RedisAdapter
+
+        string = str, {'indexed': False}
+        numbers = int, {'repeated': True, 'indexed': False}
+
+      return SampleCachedEntity
+
+    def test_cache_bounds(self):
+
+      """ Test evicting least-recently-used entities by count and size """
+
+      cache = rapi.EntityCache(3, 100)
+      for key in ('a', 'b', 'c'):
+        assert cache.set(key, {'key': key}, 10, cache.epoch)
+
+      assert cache.get('a') == {'key': 'a'}  # `b` is now least recent
+      cache.set('d', {'key': 'd'}, 10, cache.epoch)
+      assert cache.get('b') is None
+      assert len(cache) == 3 and cache.size == 30
+
+      # oversized entities evict others, or aren't cached at all
+      cache.set('e', {'key': 'e'}, 90, cache.epoch)
+      assert len(cache) == 2 and cache.size == 100
+      assert not cache.set('f', {'key': 'f'}, 101, cache.epoch)
+
+      # entities read before an invalidation aren't cached
+      epoch = cache.epoch
+      cache.invalidate('e')
+      assert not cache.set('e', {'key': 'e'}, 10, epoch)
+
+      # entities are copied in and out
+      value = {'list': [1, 2]}
+      cache.set('g', value, 10, cache.epoch)
+      value['list'].append(3)
+      cache.get('g')['list'].append(4)
+      assert cache.get('g') == {'list': [1, 2]}
+
+    def test_cached_reads(self):
+
+      """ Test serving reads from the cache, and invalidating it on writes """
+
+      SampleCachedEntity = self._sample()
+      entity = SampleCachedEntity(string='cached', numbers=[1, 2])
+      key = entity.put()
+
+      # our own write's invalidation is delivered asynchronously, so it may
+      # evict the entity just after it was first cached
+      for attempt in xrange(50):
+        assert SampleCachedEntity.get(key).string == 'cached'
+        hits = rapi._entity_cache.stats['hits']
+        cached = SampleCachedEntity.get(key)
+        if rapi._entity_cache.stats['hits'] == hits + 1: break
+        time.sleep(0.05)
+
+      assert cached.string == 'cached'
+      assert rapi._entity_cache.stats['hits'] == hits + 1
+
+      # mutating a cached entity doesn't touch the cache
+      cached.numbers.append(3)
+      assert SampleCachedEntity.get(key).numbers == [1, 2]
+
+      # writes and deletes invalidate it
+      entity.string = 'updated'
+      entity.put()
+      assert SampleCachedEntity.get(key).string == 'updated'
+
+      other = SampleCachedEntity(string='other').put()
+      results = list(SampleCachedEntity.get_multi([key, other, key]))
+      assert [e.string for e in results] == ['updated', 'other', 'updated']
+
+      SampleCachedEntity.get(key).delete()
+      assert SampleCachedEntity.get(key) is None
+      assert [e and e.string for e in SampleCachedEntity.get_multi([
+        key, other])] == [None, 'other']
+
+    def test_published_invalidation(self):
+
+      """ Test invalidating cached entities on writes by other processes """
+
+      SampleCachedEntity = self._sample()
+
+      # start listening, and let the listener subscribe before writing (the
+      # mock client drops subscriptions that are published to mid-subscribe)
+      rapi.RedisAdapter.entity_cache('SampleCachedEntity')
+      subscription = rapi._listeners[-1][1]
+      for attempt in xrange(50):
+        if subscription and subscription[0].subscribed: break
+        time.sleep(0.05)
+
+      key = SampleCachedEntity(string='cached').put()
+      encoded = rapi.RedisAdapter.encode_key(*key.flatten(True))
+
+      # the write's own invalidation may still be in flight, and evict it
+      cached = None
+      for attempt in xrange(50):
+        SampleCachedEntity.get(key)
+        cached = rapi._entity_cache.get(encoded)
+        if cached: break
+        time.sleep(0.05)
+      assert cached
+
+      # simulate a write elsewhere, which publishes on the kind's channel
+      for attempt in xrange(50):
+        rapi._mock_redis.publish('__cache__::SampleCachedEntity', encoded)
+        time.sleep(0.05)
+        if rapi._entity_cache.get(encoded) is None: break
+      assert rapi._entity_cache.get(encoded) is None
+
+
+  class RedisShardingTests(test.FrameworkTest):
+
+    """ Tests sharding entity groups across Redis server profiles """
+
+    shards = ('shard-a', 'shard-b', 'shard-c')
+
+    def setUp(self):
+      """ Set Redis into sharded testing mode. """
+
+      rapi.RedisAdapter.__testing__ = True
+      rapi.RedisAdapter.EngineConfig.shards = self.shards
+      for shard in self.shards:
+        rapi.RedisAdapter.channel(None, shard).flushdb()
+
+    def tearDown(self):
+      """ Set Redis back into non-testing, unsharded mode. """
+
+      rapi.RedisAdapter.__testing__ = False
+      rapi.RedisAdapter.EngineConfig.shards = None
+
+    def _sample(self):
+
+      """ Build a sample model for sharding tests. """
+
+      class SampleShardedEntity(model.Model):
+
+        """ quick sample entity """
+
+        __adapter__ = rapi.RedisAdapter
+
+        string = str, {'indexed': True}
+        number = int, {'indexed': False}
+
+      return SampleShardedEntity
+
+    def test_hash_ring(self):
+
+      """ Test that the hash ring is stable and only moves a node's keys """
+
+      before = rapi.HashRing(('a', 'b', 'c'))
+      after = rapi.HashRing(('a', 'b', 'c', 'd'))
+
+      keys = ['key-%s' % i for i in xrange(1000)]
+      assert [before.get(k) for k in keys] == [
+        rapi.HashRing(('a', 'b', 'c')).get(k) for k in keys]
+
+      moved = [k for k in keys if before.get(k) != after.get(k)]
+      assert all((after.get(k) == 'd' for k in moved))
+      assert 0 < len(moved) < len(keys) / 2
+      assert set((before.get(k) for k in keys)) == set(('a', 'b', 'c'))
+
+    def test_sharded_put_and_get(self):
+
+      """ Test spreading entity groups across shards, and fetching them """
+
+      SampleShardedEntity = self._sample()
+
+      keys = SampleShardedEntity.put_multi([
+        SampleShardedEntity(string='sharded', number=i) for i in xrange(30)])
+
+      # entities should be spread across shards, on the shard they hash to
+      placed = set()
+      for key in keys:
+        shard = rapi.RedisAdapter.shard(key)
+        placed.add(shard)
+        client = rapi.RedisAdapter.channel(None, shard)
+        assert client.exists(rapi.RedisAdapter.encode_key(*key.flatten(True)))
+      assert len(placed) > 1
+
+      fetched = list(SampleShardedEntity.get_multi(keys))
+      assert [e.number for e in fetched] == range(30)
+      assert SampleShardedEntity.get(keys[3]).number == 3
+
+    def test_sharded_entity_group(self):
+
+      """ Test that entity groups are kept together on one shard """
+
+      SampleShardedEntity = self._sample()
+
+      parent = SampleShardedEntity(key=model.Key(SampleShardedEntity, 'root'),
+                                   string='parent', number=0).put()
+
+      children = SampleShardedEntity.put_multi([
+        SampleShardedEntity(key=model.Key(SampleShardedEntity, 'child-%s' % i,
+                                          parent=parent),
+                            string='child', number=i) for i in xrange(10)])
+
+      assert set((rapi.RedisAdapter.shard(k) for k in children)) == set((
+        rapi.RedisAdapter.shard(parent),))
+
+    def test_sharded_ids(self):
+
+      """ Test that a kind's IDs come from one counter on every path """
+
+      SampleShardedEntity = self._sample()
+
+      first = rapi.RedisAdapter.allocate_ids(model.Key, 'SampleShardedEntity')
+
+      keys = SampleShardedEntity.put_multi([
+        SampleShardedEntity(string='owned', number=i) for i in xrange(3)])
+
+      # a pipeline on a shard the kind's counter isn't on
+      pipe = rapi.RedisAdapter.channel(None, self.shards[0]).pipeline(
+        transaction=True)
+      keys += SampleShardedEntity.put_multi([
+        SampleShardedEntity(string='piped', number=i) for i in xrange(2)],
+        pipeline=pipe)
+
+      last = rapi.RedisAdapter.allocate_ids(model.Key, 'SampleShardedEntity')
+      assert [k.id for k in keys] + [last] == range(first + 1, first + 7)
+
+    def test_sharded_query(self):
+
+      """ Test gathering query results across shards """
+
+      SampleShardedEntity = self._sample()
+
+      keys = SampleShardedEntity.put_multi([
+        SampleShardedEntity(string='gathered', number=i) for i in xrange(12)])
+
+      results = SampleShardedEntity.query().filter(
+        SampleShardedEntity.string == 'gathered').fetch()
+      assert sorted((e.number for e in results)) == range(12)
+
+      # deletes should clean indexes on the entity's own shard
+      SampleShardedEntity.get(keys[0]).delete()
+      results = SampleShardedEntity.query().filter(
+        SampleShardedEntity.string == 'gathered').fetch()
+      assert len(results) == 11
+
+    def test_sharded_intersect_query(self):
+
+      """ Test paging an intersected query across shards """
+
+      class SampleShardedRangeEntity(model.Model):
+
+        """ quick sample entity """
+
+        __adapter__ = rapi.RedisAdapter
+
+        string = str, {'indexed': True}
+        number = float, {'indexed': True}
+
+      SampleShardedRangeEntity.put_multi([
+        SampleShardedRangeEntity(string='ranged', number=float(i))
+        for i in xrange(20)])
+
+      q = SampleShardedRangeEntity.query().filter(
+        SampleShardedRangeEntity.number > 5.0).filter(
+        SampleShardedRangeEntity.string == 'ranged')
+
+      rapi.RedisAdapter.EngineConfig.intersect_ttl = 30
+      try:
+        first = q.fetch(limit=4, offset=1)
+        assert [e.number for e in first] == [7.0, 8.0, 9.0, 10.0]
+
+        # intersections are kept around (with a TTL) and reused
+        temps = [rapi.RedisAdapter.channel(None, shard).keys('__temp__*')
+                 for shard in self.shards]
+        assert all((len(keys) == 1 for keys in temps))
+        assert [e.number for e in q.fetch(limit=4, offset=1)] == [
+          7.0, 8.0, 9.0, 10.0]
+
+      finally:
+        rapi.RedisAdapter.EngineConfig.intersect_ttl = 0
+
+    def test_sharded_sorted_query(self):
+
+      """ Test merging index-backed, multi-key sorts across shards """
+
+      class SampleShardedSortedEntity(model.Model):
+
+        """ quick sample entity """
+
+        __adapter__ = rapi.RedisAdapter
+
+        number = float, {'indexed': True}
+        other = float, {'indexed': True}
+
+      SampleShardedSortedEntity.put_multi([
+        SampleShardedSortedEntity(number=float(i / 3), other=float(i))
+        for i in xrange(12)])
+
+      q = SampleShardedSortedEntity.query().sort(
+        -SampleShardedSortedEntity.other)
+      assert [e.other for e in q.fetch(limit=3, offset=1)] == [
+        10.0, 9.0, 8.0]
+
+      q = SampleShardedSortedEntity.query().sort(
+        -SampleShardedSortedEntity.number).sort(
+        +SampleShardedSortedEntity.other)
+      assert [e.other for e in q.fetch(limit=4, offset=2)] == [
+        11.0, 6.0, 7.0, 8.0]
+
+      assert not any((
+        rapi.RedisAdapter.channel(None, shard).keys('__temp__*') for (
+          shard) in self.shards))
+
+
+
+  class RedisInstrumentationTests(test.FrameworkTest):
+
+    """ Tests recording commands and round trips to instruments """
+
+    def setUp(self):
+      """ Set Redis into testing mode, with metrics. """
+
+      self.metrics = rapi.Metrics()
+      rapi._mock_redis = fakeredis.FakeStrictRedis()
+      rapi.RedisAdapter.__testing__ = True
+      rapi.RedisAdapter.EngineConfig.instruments = (self.metrics,)
+      rapi.RedisAdapter.EngineConfig.mode = rapi.RedisMode.toplevel_blob
+
+    def tearDown(self):
+      """ Set Redis back into non-testing mode, without metrics. """
+
+      rapi.RedisAdapter.__testing__ = False
+      rapi.RedisAdapter.EngineConfig.instruments = ()
+
+    def test_command_metrics(self):
+
+      """ Test aggregating commands by operation and kind """
+
+      class SampleMeteredEntity(model.Model):
+
+        """ quick sample entity """
+
+        __adapter__ = rapi.RedisAdapter
+
+        string = str, {'indexed': True}
+
+      key = SampleMeteredEntity(string='metered').put()
+      SampleMeteredEntity.get(key)
+
+      stats = dict(((s['operation'], s['kind']), s) for s in (
+        self.metrics.snapshot()['commands']))
+
+      # the entity is written in a pipeline, and read directly
+      written = stats[(rapi.RedisAdapter.Operations.SET, 'SampleMeteredEntity')]
+      assert (written['pipelined'], written['direct']) == (1, 0)
+      assert written['bytes'] > len('metered')
+
+      read = stats[(rapi.RedisAdapter.Operations.GET, 'SampleMeteredEntity')]
+      assert (read['calls'], read['pipelined'], read['direct']) == (1, 0, 1)
+      assert sum(read['latency']) == 1
+      assert len(read['latency']) == len(rapi.Metrics.buckets) + 1
+
+      self.metrics.reset()
+      assert self.metrics.snapshot() == {'round_trips': 0, 'commands': []}
+
+    def test_request_round_trips(self):
+
+      """ Test counting round trips within a request """
+
+      class SampleTracedEntity(model.Model):
+
+        """ quick sample entity """
+
+        __adapter__ = rapi.RedisAdapter
+
+        string = str, {'indexed': True}
+
+      keys = [SampleTracedEntity(string='traced').put() for i in xrange(3)]
+      overall = self.metrics.round_trips
+
+      with self.metrics.request() as request:
+        list(SampleTracedEntity.get_multi(keys))  # one pipeline
+        SampleTracedEntity.get(keys[0])  # one direct read
+
+      assert request['round_trips'] == 2
+      assert request['commands'] == 2
+      assert request['latency'] >= 0
+      assert self.metrics.round_trips == overall + 2
+
+      # round trips outside of the request aren't counted against it
+      SampleTracedEntity.get(keys[0])
+      assert request['round_trips'] == 2
+
+
+  class RedisBenchmarkTests(test.FrameworkTest):
+
+    """ Tests benchmarking `model.adapter.redis.Redis` storage modes """
+
+    def test_benchmark_modes(self):
+
+      """ Test running and metering each benchmark workload on fakeredis """
+
+      from canteen.model.adapter import benchmark
+
+      modes = (rapi.RedisMode.toplevel_blob, rapi.RedisMode.hashkey_hash)
+      mock, mode = rapi._mock_redis, rapi.RedisAdapter.EngineConfig.mode
+
+      results = benchmark.run(modes, count=20)
+
+      # adapter state is restored once the benchmark completes
+      assert rapi._mock_redis is mock
+      assert rapi.RedisAdapter.EngineConfig.mode == mode
+      assert rapi.RedisAdapter.__testing__ is False
+
+      assert [(r['mode'], r['workload']) for r in results] == [
+        (m, w) for m in modes for w in (
+          'put', 'get', 'get_multi', 'filtered_query', 'sorted_query',
+          'delete')]
+
+      for result in results:
+        assert result['backend'] == 'fakeredis'
+        assert result['round_trips_per_op'] >= 1
+        assert result['bytes_written'] > 0
+
+        if result['workload'] == 'get':
+          assert result['round_trips_per_op'] == 1
+        if result['workload'] == 'put':
+          assert result['memory'] > 0
+        if result['workload'] == 'delete':
+          assert result['memory'] == 0
 
 
 else:  # pragma: no cover